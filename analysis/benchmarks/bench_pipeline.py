@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+
+"""Benchmarks of the main openbuilding paths on synthetic models
+
+For each model size a synthetic gbXML and eso file are written (see
+    synthetic.py), and these stages are timed with an
+    openbuilding.profiling.Profiler:
+
+    - read_xml: GbxmlGraph.read_xml
+    - gbxml_to_bim: GbxmlToBimMap.run
+    - bim_to_idf: BimToIdfMap.run
+    - idf_string: IdfGraph.idf_string
+    - write_pickle, read_pickle: BimGraph.write_pickle and read_pickle
+    - graph_queries: the external and internal surfaces of every space and
+        the layers of every construction
+    - read_eso: EsoGraph.read_eso
+    - eso_to_bim: EsoToBimMap.run
+
+Each stage is the best of --repeat runs. The results are printed and
+    appended to benchmarks/results/pipeline.jsonl with the git commit, so
+    the scaling of each stage and any regressions can be seen across
+    commits with --report.
+
+The openbuilding modules are imported from --package-dir, which defaults to
+    this checkout. Another commit is benchmarked with the same synthetic
+    models by pointing --package-dir at a git worktree of that commit; the
+    stages only use the methods which the older commits also have.
+
+Usage (from the analysis folder):
+    python benchmarks/bench_pipeline.py
+    python benchmarks/bench_pipeline.py --spaces 10 100 1000 --repeat 3
+    git worktree add ../../baseline <commit>
+    python benchmarks/bench_pipeline.py --package-dir ../../baseline/analysis/openbuilding
+    python benchmarks/bench_pipeline.py --report
+
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import types
+
+import pandas as pd
+
+benchmarks_dir=os.path.dirname(os.path.abspath(__file__))
+analysis_dir=os.path.dirname(benchmarks_dir)
+sys.path.insert(0,analysis_dir)
+
+from openbuilding.profiling import Profiler, graph_counters, file_size
+
+from synthetic import write_gbxml, write_eso, space_ids
+
+package_dir=os.path.join(analysis_dir,'openbuilding')
+results_fp=os.path.join(benchmarks_dir,'results','pipeline.jsonl')
+
+
+def import_package(folder=package_dir):
+    """Returns a namespace of the openbuilding classes used by the stages
+
+    The modules are imported directly from folder, so that the package
+        __init__ of an older commit (which imports all the modules) is not
+        needed. variable_registry is None if the folder does not have it.
+
+    """
+    sys.path.insert(0,os.path.abspath(folder))
+    import gbxml_graph, gbxml_to_bim_map, bim_to_idf_map, bim_graph, eso_graph, eso_to_bim_map
+    try:
+        from variable_registry import variable_registry
+    except ImportError:
+        variable_registry=None
+    return types.SimpleNamespace(GbxmlGraph=gbxml_graph.GbxmlGraph,
+                                 GbxmlToBimMap=gbxml_to_bim_map.GbxmlToBimMap,
+                                 BimToIdfMap=bim_to_idf_map.BimToIdfMap,
+                                 BimGraph=bim_graph.BimGraph,
+                                 EsoGraph=eso_graph.EsoGraph,
+                                 EsoToBimMap=eso_to_bim_map.EsoToBimMap,
+                                 variable_registry=variable_registry)
+
+
+def git_commit(folder=package_dir):
+    "Returns the short hash of the git commit of folder, or None"
+    try:
+        return subprocess.run(['git','rev-parse','--short','HEAD'],
+                              cwd=folder,capture_output=True,
+                              text=True,check=True).stdout.strip()
+    except (OSError,subprocess.CalledProcessError):
+        return None
+
+
+def graph_queries(bim):
+    """Runs the BimNode queries of every space and construction, returns the
+    number of results
+    """
+    count=0
+    for space in bim.Space:
+        count+=len(space.external_surfaces())
+        count+=len(space.internal_surfaces())
+    for construction in bim.Construction:
+        count+=len(construction.Layers())
+    return count
+
+
+def run_size(ob,folder,profiler,n_spaces,surfaces_per_space,n_schedules,
+             eso_variables,eso_timesteps):
+    """Runs each stage once for a model size, the records are placed in profiler
+
+    Arguments:
+        - ob (types.SimpleNamespace): the classes returned by import_package
+
+    """
+    gbxml_fp=os.path.join(folder,'building.gbxml')
+    eso_fp=os.path.join(folder,'eplusout.eso')
+    pickle_fp=os.path.join(folder,'bim.pickle')
+    write_gbxml(gbxml_fp,n_spaces=n_spaces,surfaces_per_space=surfaces_per_space,
+                n_schedules=n_schedules)
+    write_eso(eso_fp,space_ids(n_spaces),n_variables=eso_variables,
+              n_timesteps=eso_timesteps)
+
+    with profiler.stage('read_xml',bytes_read=file_size(gbxml_fp)) as record:
+        gbxml=ob.GbxmlGraph()
+        gbxml.read_xml(gbxml_fp)
+        record.update(graph_counters(gbxml))
+    with profiler.stage('gbxml_to_bim') as record:
+        o=ob.GbxmlToBimMap()
+        o.input_gbxml=gbxml
+        o.run()
+        bim=o.output_bim
+        record.update(graph_counters(bim))
+    with profiler.stage('bim_to_idf') as record:
+        o1=ob.BimToIdfMap()
+        o1.input_bim=bim
+        o1.run()
+        record.update(graph_counters(o1.output_idf))
+    with profiler.stage('idf_string') as record:
+        record['bytes_written']=len(o1.output_idf.idf_string())
+    with profiler.stage('graph_queries') as record:
+        record['results']=graph_queries(bim)
+    with profiler.stage('write_pickle') as record:
+        bim.write_pickle(pickle_fp)
+        record['bytes_written']=file_size(pickle_fp)
+    with profiler.stage('read_pickle') as record:
+        bim1=ob.BimGraph()
+        bim1.read_pickle(pickle_fp)
+        record.update(graph_counters(bim1))
+    with profiler.stage('read_eso',bytes_read=file_size(eso_fp)) as record:
+        if ob.variable_registry is None:
+            eso=ob.EsoGraph()
+        else:
+            eso=ob.EsoGraph(registry=ob.variable_registry)
+        eso.read_eso(eso_fp)
+        record.update(graph_counters(eso))
+    with profiler.stage('eso_to_bim') as record:
+        o2=ob.EsoToBimMap()
+        o2.bim=bim
+        o2.input_eso=eso
+        skipped=o2.run()
+        if skipped is not None:
+            record['skipped']=len(skipped)
+
+
+def run(spaces=(10,50,200),surfaces_per_space=6,n_schedules=5,
+        eso_variables=None,eso_timesteps=744,repeat=3,folder=package_dir):
+    """Returns a DataFrame of the best time of each stage for each size
+
+    Arguments:
+        - spaces (list): the numbers of spaces
+        - eso_variables (int): the number of eso variables, the default is
+            all the synthetic.eso_variables of each space
+        - folder (str): the openbuilding folder to benchmark
+
+    """
+    ob=import_package(folder)
+    rows=[]
+    for n_spaces in spaces:
+        profiler=Profiler()
+        with tempfile.TemporaryDirectory() as tmp:
+            for i in range(repeat):
+                run_size(ob,tmp,profiler,n_spaces,surfaces_per_space,
+                         n_schedules,eso_variables,eso_timesteps)
+        df=profiler.to_dataframe()
+        best=df.loc[df.groupby('stage',sort=False)['wall'].idxmin()]
+        best=best.drop(columns=['run','parent','depth','start'])
+        best.insert(0,'spaces',n_spaces)
+        rows.append(best)
+    df=pd.concat(rows,ignore_index=True)
+    df.insert(1,'surfaces_per_space',surfaces_per_space)
+    df.insert(2,'schedules',n_schedules)
+    df.insert(3,'eso_timesteps',eso_timesteps)
+    return df
+
+
+def record_results(df,fp=results_fp,folder=package_dir):
+    """Appends the results to a JSON lines file with the commit of folder,
+    the date and the machine
+    """
+    os.makedirs(os.path.dirname(fp),exist_ok=True)
+    df=df.copy()
+    df.insert(0,'commit',git_commit(folder))
+    df.insert(1,'date',datetime.datetime.now().isoformat(timespec='seconds'))
+    df.insert(2,'python',platform.python_version())
+    df.insert(3,'machine',platform.node())
+    with open(fp,'a') as f:
+        for record in df.to_dict(orient='records'):
+            record={k:(None if isinstance(v,float) and v!=v else v)
+                    for k,v in record.items()}
+            f.write(json.dumps(record)+'\n')
+
+
+def report(fp=results_fp):
+    """Returns a DataFrame of the recorded wall times (ms)
+
+    There is a row for each commit and stage and a column for each number of
+        spaces, using the latest result of each. Only the results with the
+        same surfaces_per_space, schedules and eso_timesteps as the latest
+        result are included.
+
+    """
+    df=pd.read_json(fp,lines=True)
+    keys=['surfaces_per_space','schedules','eso_timesteps']
+    latest=df.iloc[-1]
+    df=df[(df[keys]==latest[keys]).all(axis=1)]
+    df=df.drop_duplicates(['commit','stage','spaces'],keep='last')
+    order=df.drop_duplicates('commit')['commit'].tolist()
+    df=df.pivot_table(index=['stage','commit'],columns='spaces',
+                      values='wall',aggfunc='last')*1000
+    return df.reindex(sorted(df.index,key=lambda x:(x[0],order.index(x[1]))))
+
+
+def main(argv=None):
+    parser=argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--spaces',type=int,nargs='+',default=[10,50,200],
+                        help='the numbers of spaces of the synthetic models')
+    parser.add_argument('--surfaces-per-space',type=int,default=6)
+    parser.add_argument('--schedules',type=int,default=5,
+                        help='the number of distinct occupancy schedules')
+    parser.add_argument('--eso-variables',type=int,default=None,
+                        help='the default is 10 variables for each space')
+    parser.add_argument('--eso-timesteps',type=int,default=744,
+                        help='the number of hours, the default is January')
+    parser.add_argument('--repeat',type=int,default=3)
+    parser.add_argument('--package-dir',default=package_dir,
+                        help='the openbuilding folder to benchmark, i.e. in a '
+                        'git worktree of another commit')
+    parser.add_argument('--no-record',action='store_true',
+                        help='do not append the results to '+results_fp)
+    parser.add_argument('--report',action='store_true',
+                        help='print the recorded results and exit')
+    args=parser.parse_args(argv)
+    pd.set_option('display.width',200)
+    pd.set_option('display.max_columns',30)
+    if args.report:
+        print(report().round(1))
+        return 0
+    df=run(spaces=args.spaces,
+           surfaces_per_space=args.surfaces_per_space,
+           n_schedules=args.schedules,
+           eso_variables=args.eso_variables,
+           eso_timesteps=args.eso_timesteps,
+           repeat=args.repeat,
+           folder=args.package_dir)
+    if not args.no_record:
+        record_results(df,folder=args.package_dir)
+    table=df.pivot_table(index='stage',columns='spaces',values='wall',sort=False)*1000
+    print('wall time (ms)')
+    print(table.round(1))
+    return 0
+
+
+if __name__=='__main__':
+    sys.exit(main())
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+"""Import time benchmark for the openbuilding package
+
+Each statement is run in a new Python process with 'python -X importtime',
+    as a batch worker would be started. The import time of the statement 
+    (the cumulative time of the top level imports that are not made by 
+    'python -c pass') and the total process time are the best of several 
+    runs, and the heavy third party packages that were imported are listed.
+
+Usage (from the analysis folder):
+    python benchmarks/importtime.py
+    python benchmarks/importtime.py --repeat 10 --max-ms 100
+
+With --max-ms the script exits with status 1 if the import time of any 
+    statement is above the limit.
+
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+
+statements=['import openbuilding',
+            'from openbuilding import Graph',
+            'from openbuilding import IdfGraph',
+            'from openbuilding import BimGraph',
+            'from openbuilding import GbxmlToBimMap',
+            'from openbuilding import EnergyPlusModel',
+            ]
+
+heavy_packages=['lxml','pandas','matplotlib','scipy','sklearn']
+
+analysis_dir=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def importtime(statement,startup_modules=()):
+    """Returns the results of one run of a statement
+
+    Arguments:
+        - statement (str): the Python code to run
+        - startup_modules (set): the modules imported by the interpreter
+            itself, which are not included in the import time
+
+    Returns (import time in ms, process time in ms, set of the top level 
+        imports, set of the packages imported)
+
+    The top level imports include the modules imported with 
+        importlib.import_module by openbuilding.__getattr__, which 
+        -X importtime shows as top level.
+
+    """
+    t=time.perf_counter()
+    p=subprocess.run([sys.executable,'-X','importtime','-c',statement],
+                     cwd=analysis_dir,
+                     capture_output=True,
+                     text=True)
+    process_ms=(time.perf_counter()-t)*1000
+    if p.returncode!=0:
+        raise RuntimeError('{} failed:\n{}'.format(statement,p.stderr[-2000:]))
+    import_us=0
+    modules=set()
+    packages=set()
+    for line in p.stderr.splitlines():
+        if not line.startswith('import time:'): continue
+        try:
+            _,cumulative,name=line[len('import time:'):].split('|')
+            cumulative=int(cumulative)
+        except ValueError:  # the header line
+            continue
+        module=name.strip()
+        package=module.split('.')[0]
+        packages.add(package)
+        top_level=len(name)-len(name.lstrip())==1  # nested imports are indented
+        if top_level:
+            modules.add(module)
+            if not module in startup_modules:
+                import_us+=cumulative
+    return import_us/1000,process_ms,modules,packages
+
+
+def run(repeat=5):
+    """Returns a list of dicts of the results of each statement
+    """
+    startup_modules=importtime('pass')[2]
+    results=[]
+    for statement in statements:
+        runs=[importtime(statement,startup_modules) for i in range(repeat)]
+        results.append({'statement':statement,
+                        'import_ms':min(r[0] for r in runs),
+                        'process_ms':min(r[1] for r in runs),
+                        'heavy':[x for x in heavy_packages if x in runs[0][3]]})
+    return results
+
+
+def main(argv=None):
+    parser=argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat',type=int,default=5,
+                        help='the number of runs of each statement')
+    parser.add_argument('--max-ms',type=float,default=None,
+                        help='the largest allowed import time of a statement')
+    args=parser.parse_args(argv)
+    results=run(args.repeat)
+    print('{:45} {:>10} {:>11}  {}'.format('statement','import ms','process ms','imports'))
+    for r in results:
+        print('{:45} {:10.1f} {:11.1f}  {}'.format(r['statement'],
+                                                  r['import_ms'],
+                                                  r['process_ms'],
+                                                  ', '.join(r['heavy'])))
+    if args.max_ms is not None:
+        slow=[r for r in results if r['import_ms']>args.max_ms]
+        for r in slow:
+            print('SLOW: {} ({:.1f} ms > {} ms)'.format(r['statement'],
+                                                        r['import_ms'],
+                                                        args.max_ms))
+        return 1 if slow else 0
+    return 0
+
+
+if __name__=='__main__':
+    sys.exit(main())
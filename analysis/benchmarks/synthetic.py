@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+
+"""Synthetic gbXML and eso files of a chosen size, for the benchmarks
+
+synthetic_gbxml() returns a single storey building of box shaped rooms on a
+    grid, using the constructions, materials, window type and heating
+    schedule of 01_D-original_gbXML/detached_house.gbxml. The number of
+    spaces, the surfaces per space and the number of distinct schedules can
+    be set, so the mapping and query times can be measured as the model
+    grows.
+
+write_eso() writes an eso file with a chosen number of hourly variables
+    and timesteps, for the spaces of a synthetic gbXML.
+
+Example:
+    tree=synthetic_gbxml(n_spaces=100,surfaces_per_space=10,n_schedules=5)
+    tree.write('building.gbxml')
+    write_eso('eplusout.eso',space_ids(100),n_variables=500,n_timesteps=8760)
+
+"""
+
+import copy
+import math
+import os
+
+import numpy as np
+import pandas as pd
+from lxml import etree
+
+
+analysis_dir=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+template_fp=os.path.join(analysis_dir,'01_D-original_gbXML','detached_house.gbxml')
+
+ns='http://www.gbxml.org/schema'
+
+room_width=4.0
+room_height=2.7
+
+# the Space and Zone variables written to synthetic eso files, in order
+eso_variables=[('Zone Mean Air Temperature','C'),
+               ('Zone Thermostat Heating Setpoint Temperature','C'),
+               ('Zone People Total Heating Energy','J'),
+               ('Zone Lights Total Heating Energy','J'),
+               ('Zone Electric Equipment Total Heating Energy','J'),
+               ('Zone Windows Total Transmitted Solar Radiation Energy','J'),
+               ('Zone Windows Total Heat Gain Energy','J'),
+               ('Zone Windows Total Heat Loss Energy','J'),
+               ('Zone Infiltration Total Heat Loss Energy','J'),
+               ('Zone Infiltration Total Heat Gain Energy','J'),
+               ]
+
+
+def _element(parent,tag,attributes=None,text=None):
+    "Adds a gbXML element to parent and returns it"
+    e=etree.SubElement(parent,'{%s}%s' % (ns,tag),attributes or {})
+    if text is not None:
+        e.text=text
+    return e
+
+
+def _polyloop(parent,points):
+    "Adds a PlanarGeometry element with the points"
+    poly_loop=_element(_element(parent,'PlanarGeometry'),'PolyLoop')
+    for point in points:
+        cartesian_point=_element(poly_loop,'CartesianPoint')
+        for x in point:
+            _element(cartesian_point,'Coordinate',text='%f' % x)
+
+
+def _surface(campus,surface_id,surface_type,construction,space_ids,
+             points,azimuth,tilt,window_id=None):
+    """Adds a Surface element
+
+    Arguments:
+        - points (np.ndarray): a (4,3) array of the vertices, anticlockwise
+            when seen from outside the first space
+        - window_id (str): if given, a window is added in the middle of the
+            surface
+
+    """
+    surface=_element(campus,'Surface',{'id':surface_id,
+                                       'surfaceType':surface_type,
+                                       'constructionIdRef':construction})
+    for space_id in space_ids:
+        _element(surface,'AdjacentSpaceId',{'spaceIdRef':space_id})
+    width=np.linalg.norm(points[1]-points[0])
+    height=np.linalg.norm(points[3]-points[0])
+    rectangular_geometry=_element(surface,'RectangularGeometry')
+    _element(rectangular_geometry,'Azimuth',text='%f' % azimuth)
+    _element(rectangular_geometry,'Tilt',text='%f' % tilt)
+    cartesian_point=_element(rectangular_geometry,'CartesianPoint')
+    for x in points[0]:
+        _element(cartesian_point,'Coordinate',text='%f' % x)
+    _element(rectangular_geometry,'Height',text='%f' % height)
+    _element(rectangular_geometry,'Width',text='%f' % width)
+    _polyloop(surface,points)
+    if window_id is not None:
+        u=(points[1]-points[0])/width
+        v=(points[3]-points[0])/height
+        x0,x1=width*0.25,width*0.75
+        y0,y1=min(0.9,height*0.3),min(2.1,height*0.8)
+        opening=_element(surface,'Opening',{'id':window_id,
+                                            'windowTypeIdRef':'STD_EXTW',
+                                            'openingType':'FixedWindow'})
+        rectangular_geometry=_element(opening,'RectangularGeometry')
+        cartesian_point=_element(rectangular_geometry,'CartesianPoint')
+        _element(cartesian_point,'Coordinate',text='%f' % x0)
+        _element(cartesian_point,'Coordinate',text='%f' % y0)
+        _element(rectangular_geometry,'Height',text='%f' % (y1-y0))
+        _element(rectangular_geometry,'Width',text='%f' % (x1-x0))
+        _polyloop(opening,[points[0]+u*x+v*y for x,y in ((x0,y0),(x1,y0),(x1,y1),(x0,y1))])
+    return surface
+
+
+def space_ids(n_spaces):
+    "Returns the Space ids of a synthetic gbXML"
+    return ['SPACE_%d' % i for i in range(n_spaces)]
+
+
+def synthetic_gbxml(n_spaces=10,surfaces_per_space=6,n_schedules=1,windows=True):
+    """Returns a synthetic gbXML as an lxml ElementTree
+
+    Arguments:
+        - n_spaces (int): the number of rooms, placed on a square grid
+        - surfaces_per_space (int): the number of surfaces of each room,
+            of which 2 are the floor and roof and the rest are walls. Each
+            wall is split into (surfaces_per_space-2)//4 surfaces, so this
+            is rounded down to 2 plus a multiple of 4, and is at least 6.
+        - n_schedules (int): the number of distinct occupancy schedules,
+            which are used by the rooms in turn
+        - windows (bool): if True, each external wall surface has a window
+
+    Walls between rooms are one InteriorWall surface shared by both rooms.
+
+    """
+    template=etree.parse(template_fp).getroot()
+    root=etree.Element(template.tag,dict(template.attrib),nsmap=template.nsmap)
+    root.text,root.tail=None,None
+    template_campus=template.find('{%s}Campus' % ns)
+    template_space=template_campus.find('{%s}Building/{%s}Space' % (ns,ns))
+    template_zone=template.find('{%s}Zone' % ns)
+
+    campus=_element(root,'Campus',dict(template_campus.attrib))
+    for tag in ('Name','Location'):
+        e=template_campus.find('{%s}%s' % (ns,tag))
+        if e is not None:
+            campus.append(copy.deepcopy(e))
+    building=_element(campus,'Building',{'id':'synthetic_building',
+                                        'buildingType':'Unknown'})
+    building.append(copy.deepcopy(template_campus.find('{%s}Building/{%s}BuildingStorey' % (ns,ns))))
+
+    # spaces
+    ids=space_ids(n_spaces)
+    for k,space_id in enumerate(ids):
+        schedule_id='schedule-synthetic-%d' % (k%n_schedules)
+        space=_element(building,'Space',
+                       {'id':space_id,
+                        'conditionType':'HeatedAndCooled',
+                        'buildingStoreyIdRef':template_space.get('buildingStoreyIdRef'),
+                        'peopleScheduleIdRef':schedule_id,
+                        'lightScheduleIdRef':schedule_id,
+                        'equipmentScheduleIdRef':schedule_id,
+                        'zoneIdRef':'Zone-'+space_id})
+        for e in template_space:
+            if not isinstance(e.tag,str): continue
+            e=copy.deepcopy(e)
+            e.tail=None
+            tag=etree.QName(e).localname
+            if tag=='Name':
+                e.text=space_id
+            elif tag=='Area':
+                e.text='%f' % room_width**2
+            elif tag=='Volume':
+                e.text='%f' % (room_width**2*room_height)
+            space.append(e)
+
+    # surfaces
+    nx=max(1,math.ceil(math.sqrt(n_spaces)))
+    segments=max(1,(surfaces_per_space-2)//4)
+    count=0
+    for k,space_id in enumerate(ids):
+        i,j=k%nx,k//nx
+        x0,y0=i*room_width,j*room_width
+        x1,y1=x0+room_width,y0+room_width
+        h=room_height
+        count+=1
+        _surface(campus,'surface-%d' % count,'SlabOnGrade','STD_FLO1',[space_id],
+                 np.array([[x0,y0,0],[x0,y1,0],[x1,y1,0],[x1,y0,0]],dtype=float),0,180)
+        count+=1
+        _surface(campus,'surface-%d' % count,'Roof','STD_ROOF',[space_id],
+                 np.array([[x0,y0,h],[x1,y0,h],[x1,y1,h],[x0,y1,h]],dtype=float),0,0)
+        # (start, end, azimuth, neighbour) of the walls, anticlockwise from outside
+        walls=[((x0,y0),(x1,y0),180,k-nx if j>0 else None),
+               ((x1,y0),(x1,y1),90,k+1 if i<nx-1 and k+1<n_spaces else None),
+               ((x1,y1),(x0,y1),0,k+nx if k+nx<n_spaces else None),
+               ((x0,y1),(x0,y0),270,k-1 if i>0 else None)]
+        for start,end,azimuth,neighbour in walls:
+            if neighbour is not None and neighbour<k:
+                continue  # added by the neighbour
+            start,end=np.array(start,dtype=float),np.array(end,dtype=float)
+            for s in range(segments):
+                a=start+(end-start)*s/segments
+                b=start+(end-start)*(s+1)/segments
+                points=np.array([[a[0],a[1],0],[b[0],b[1],0],
+                                 [b[0],b[1],h],[a[0],a[1],h]])
+                count+=1
+                surface_id='surface-%d' % count
+                if neighbour is None:
+                    _surface(campus,surface_id,'ExteriorWall','WALL',[space_id],
+                             points,azimuth,90,
+                             window_id=surface_id+'-opening-1' if windows else None)
+                else:
+                    _surface(campus,surface_id,'InteriorWall','PART',
+                             [space_id,ids[neighbour]],points,azimuth,90)
+
+    # constructions, materials and the template schedules
+    for e in template:
+        if not isinstance(e.tag,str): continue
+        if etree.QName(e).localname in ('Campus','Zone'): continue
+        e=copy.deepcopy(e)
+        e.tail=None
+        root.append(e)
+
+    # zones
+    for space_id in ids:
+        zone=copy.deepcopy(template_zone)
+        zone.tail=None
+        zone.set('id','Zone-'+space_id)
+        root.append(zone)
+
+    # synthetic schedules
+    for k in range(n_schedules):
+        level=(k+1)/(n_schedules+1)
+        schedule=_element(root,'Schedule',{'id':'schedule-synthetic-%d' % k,
+                                           'type':'Fraction'})
+        year_schedule=_element(schedule,'YearSchedule',{'id':'yearSchedule-synthetic-%d' % k})
+        _element(year_schedule,'BeginDate',text='2001-01-01')
+        _element(year_schedule,'EndDate',text='2001-12-31')
+        _element(year_schedule,'WeekScheduleId',{'weekScheduleIdRef':'weekSchedule-synthetic-%d' % k})
+        week_schedule=_element(root,'WeekSchedule',{'id':'weekSchedule-synthetic-%d' % k,
+                                                    'scheduleType':'Fraction'})
+        _element(week_schedule,'Day',{'dayScheduleIdRef':'daySchedule-synthetic-%d' % k,
+                                      'dayType':'All'})
+        day_schedule=_element(root,'DaySchedule',{'id':'daySchedule-synthetic-%d' % k,
+                                                  'scheduleType':'Fraction'})
+        for hour in range(24):
+            _element(day_schedule,'ScheduleValue',
+                     text='%g' % (level if 8<=hour<18 else 0.0))
+
+    return etree.ElementTree(root)
+
+
+def write_gbxml(fp,**kwargs):
+    "Writes a synthetic gbXML file, the arguments are those of synthetic_gbxml"
+    synthetic_gbxml(**kwargs).write(fp,xml_declaration=True,encoding='UTF-8',
+                                    pretty_print=True)
+
+
+def write_eso(fp,keys,n_variables=None,n_timesteps=8760,seed=0):
+    """Writes a synthetic eso file of hourly variables
+
+    Arguments:
+        - fp (str): the filepath
+        - keys (list): the zone keys, i.e. space_ids(n_spaces)
+        - n_variables (int): the number of variables. The first is the
+            'Site Outdoor Air Drybulb Temperature' of the 'Environment', and
+            the rest are the eso_variables of each key in turn. The default
+            is all eso_variables for all keys.
+        - n_timesteps (int): the number of hours from 1/1/2001 00:00,
+            at most 8760
+        - seed (int): the seed of the random values
+
+    """
+    variables=[('Environment','Site Outdoor Air Drybulb Temperature','C')]
+    variables+=[(key.upper(),name,units) for key in keys for name,units in eso_variables]
+    if n_variables is not None:
+        variables=variables[:n_variables]
+    n_timesteps=min(n_timesteps,8760)
+    codes=np.arange(len(variables))+7
+    values=np.random.default_rng(seed).normal(15.0,5.0,(n_timesteps,len(variables)))
+    index=pd.date_range('2001-01-01 01:00',periods=n_timesteps,freq='h')
+    day_names=['Monday','Tuesday','Wednesday','Thursday','Friday','Saturday','Sunday']
+    with open(fp,'w') as f:
+        f.write('Program Version,EnergyPlus, Version 8.9.0-40101eaafd, YMD=2001.01.01 00:00\n')
+        f.write('1,5,Environment Title[],Latitude[deg],Longitude[deg],Time Zone[],Elevation[m]\n')
+        f.write('2,8,Day of Simulation[],Month[],Day of Month[],DST Indicator[1=yes 0=no],'
+                'Hour[],StartMinute[],EndMinute[],DayType\n')
+        for code,(key,name,units) in zip(codes,variables):
+            f.write('%d,1,%s,%s [%s] !Hourly\n' % (code,key,name,units))
+        f.write('End of Data Dictionary\n')
+        f.write('1,RUN PERIOD 1,52.45,-1.73,0.00,99.00\n')
+        prefixes=['%d,' % code for code in codes]
+        for t in range(n_timesteps):
+            ts=index[t]-pd.Timedelta('1h')  # the start of the hour
+            f.write('2,%d,%d,%d,0,%d,0.00,60.00,%s\n' % (ts.dayofyear,ts.month,ts.day,
+                                                          ts.hour+1,day_names[ts.dayofweek]))
+            f.write(''.join('%s%.2f\n' % (p,v) for p,v in zip(prefixes,values[t])))
+        f.write('End of Data\n')
+        f.write(' Number of Records Written=%d\n' % (n_timesteps*(len(variables)+1)))
+
+
+
+# tests
+
+if __name__=='__main__':
+    import sys
+    import tempfile
+    sys.path.insert(0,analysis_dir)
+    from openbuilding.gbxml_graph import GbxmlGraph
+    from openbuilding.gbxml_to_bim_map import GbxmlToBimMap
+    from openbuilding.eso_graph import EsoGraph
+    from openbuilding.eso_to_bim_map import EsoToBimMap
+    from openbuilding.variable_registry import variable_registry
+
+    print('TEST-synthetic')
+
+    folder=tempfile.mkdtemp()
+    fp=os.path.join(folder,'building.gbxml')
+    write_gbxml(fp,n_spaces=5,surfaces_per_space=10,n_schedules=2)
+    gbxml=GbxmlGraph()
+    gbxml.read_xml(fp)
+    o=GbxmlToBimMap()
+    o.input_gbxml=gbxml
+    o.run()
+    bim=o.output_bim
+    print(len(bim.Space),len(bim.Surface),len(bim.Opening),len(bim.Schedule))
+    fp1=os.path.join(folder,'eplusout.eso')
+    write_eso(fp1,space_ids(5),n_timesteps=48)
+    eso=EsoGraph(registry=variable_registry)
+    eso.read_eso(fp1)
+    o1=EsoToBimMap()
+    o1.bim=bim
+    o1.input_eso=eso
+    print(len(eso._nodes),o1.run())
+    print(bim.Space[0].air_temperature)
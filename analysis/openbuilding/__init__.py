@@ -1,31 +1,82 @@
 #
 
-print('openbuilding.__init__')
-
-#from .gbxml.gbxml import Gbxml
-
-from .graph import Graph
-from .xml_graph import XmlGraph
-from .gbxml_graph import GbxmlGraph
-from .gbxml_to_bim_map import GbxmlToBimMap
-from .bim_graph import BimGraph
-from .bim_to_epjson_map import BimToEpjsonMap
-from .bim_to_idf_map import BimToIdfMap
-from .idf_graph import IdfGraph
-from .energyplus_model import EnergyPlusModel
-from .epjson_graph import EpjsonGraph
-from .epjson_to_bim_map import EpjsonToBimMap
-from .eso_graph import EsoGraph
-from .eso_to_bim_map import EsoToBimMap
-from .refitxml_graph import RefitxmlGraph
-from .refitxml_to_bim_map import RefitxmlToBimMap
-from .uncertainty import NumpyRandomNormal
-from .uncertainty import RandomChoice
-from .timeseries import TimeSeries
-from .timeseries import DiscreteTimeSeries
-from .timeseries import IntervalTimeSeries
-from .timeseries import ContinuousTimeSeries
-from .timeseries import Variable
-from .schedules import DaySchedule
-from .schedules import WeekSchedule
-from .schedules import PeriodSchedule
+"""The openbuilding package
+
+The public names are imported lazily, when they are first used, so that
+    'from openbuilding import Graph' does not import lxml, pandas or the
+    optional dependencies of the other modules. _exports maps each public
+    name to the module it is defined in.
+
+"""
+
+import importlib
+
+_exports={'Graph':'graph',
+          'XmlGraph':'xml_graph',
+          'GbxmlGraph':'gbxml_graph',
+          'GbxmlToBimMap':'gbxml_to_bim_map',
+          'BimGraph':'bim_graph',
+          'BimGraphView':'bim_graph',
+          'BimGraphValidator':'bim_graph_validator',
+          'BimToEpjsonMap':'bim_to_epjson_map',
+          'BimToIdfMap':'bim_to_idf_map',
+          'IdfGraph':'idf_graph',
+          'EnergyPlusModel':'energyplus_model',
+          'EnergyPlusRunner':'energyplus_runner',
+          'EnergyPlusProgress':'energyplus_runner',
+          'Profiler':'profiling',
+          'EpjsonGraph':'epjson_graph',
+          'EpjsonToBimMap':'epjson_to_bim_map',
+          'EsoGraph':'eso_graph',
+          'EsoToBimMap':'eso_to_bim_map',
+          'VariableRegistry':'variable_registry',
+          'EpwReader':'epw_reader',
+          'SeriesPool':'series_pool',
+          'SchedulePool':'schedule_pool',
+          'RefitxmlGraph':'refitxml_graph',
+          'RefitxmlToBimMap':'refitxml_to_bim_map',
+          'NumpyRandomNormal':'uncertainty',
+          'RandomChoice':'uncertainty',
+          'Ensemble':'ensemble',
+          'BimParameter':'experimental_design',
+          'GbxmlParameter':'experimental_design',
+          'LatinHypercubeDesign':'experimental_design',
+          'SobolDesign':'experimental_design',
+          'FullFactorialDesign':'experimental_design',
+          'MorrisDesign':'sensitivity',
+          'MorrisAnalysis':'sensitivity',
+          'SaltelliDesign':'sensitivity',
+          'SobolAnalysis':'sensitivity',
+          'Surrogate':'surrogate',
+          'MonthlyHeatBalance':'heat_balance',
+          'PolygonArray':'geometry',
+          'ConstructionArray':'construction_array',
+          'VariantPipeline':'variants',
+          'SetAzimuth':'variants',
+          'SetInfiltration':'variants',
+          'SwapConstruction':'variants',
+          'TimeSeries':'timeseries',
+          'DiscreteTimeSeries':'timeseries',
+          'IntervalTimeSeries':'timeseries',
+          'ContinuousTimeSeries':'timeseries',
+          'Variable':'timeseries',
+          'DaySchedule':'schedules',
+          'WeekSchedule':'schedules',
+          'PeriodSchedule':'schedules',
+          }
+
+__all__=list(_exports)
+
+
+def __getattr__(name):
+    "Imports the module of a public name on first use"
+    module=_exports.get(name)
+    if module is None:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__,name))
+    value=getattr(importlib.import_module('.'+module,__name__),name)
+    globals()[name]=value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals())+__all__)
@@ -14,16 +14,250 @@ import pandas as pd
 
 class BimGraph(Graph):
     """A Bim graph
+    
+    relations() returns the derived relationships of the graph, such as the 
+        surfaces of each space and the ordered layers of each construction.
+        These are computed in one traversal and cached until the graph is
+        changed with add_node, add_edge, remove_edge, remove_node etc. 
+        Changes made directly to the node or edge tuples (i.e. 
+        node.labels.append('Space')) need a call to invalidate_relations().
+    
     """
     
+    _relations=None  # the cached BimRelations
+    
     
     @staticmethod
     def _node(self,_id,node_tuple):
         "Returns a Node instance"
         return BimNode(self,_id,node_tuple)
 
+
+    def add_edge(self,
+                 start_node,
+                 end_node,
+                 name=None,
+                 properties=None):
+        "Adds a new edge tuple to self._edges"
+        self._relations=None
+        return Graph.add_edge(self,start_node,end_node,name,properties)
+    
+    
+    def add_node(self,
+                 labels=None,
+                 properties=None):
+        "Adds a new node tuple to self._nodes"
+        self._relations=None
+        return Graph.add_node(self,labels,properties)
+    
+    
+    def clear(self):
+        "Clears the graph, deletes all nodes"
+        self._relations=None
+        Graph.clear(self)
+        
+        
+    def invalidate_relations(self):
+        "Discards the cached BimRelations"
+        self._relations=None
+        
+        
+    def read_pickle(self,fp):
+        self._relations=None
+        Graph.read_pickle(self,fp)
+        
+        
+    def relations(self):
+        "Returns the BimRelations of the graph, computed on first use after a change"
+        if self._relations is None:
+            self._relations=BimRelations(self)
+        return self._relations
+    
+    
+    def remove_edge(self,
+                    edge):
+        "Removes an edge"
+        self._relations=None
+        return Graph.remove_edge(self,edge)
+    
+    
+    def remove_node(self,
+                    node):
+        "Removes a node and its edges"
+        self._relations=None
+        return Graph.remove_node(self,node)
     
     
+    def remove_orphan_nodes(self):
+        "Removes all nodes with no edges"
+        self._relations=None
+        Graph.remove_orphan_nodes(self)
+
+
+    def view(self,properties=None):
+        """Returns a BimGraphView of this graph
+
+        Arguments:
+            - properties (dict): {node._id:{key:value}} of property values
+                which are different in the view
+
+        """
+        return BimGraphView(self,properties)
+
+
+class BimGraphView(BimGraph):
+    """A lightweight, copy-on-write view of a BimGraph
+
+    The view shares the node and edge tuples of the base graph. A node is
+        only copied when its properties or edges are changed through the
+        view, so the base graph is never altered.
+
+    Node properties should be changed by attribute assignment
+        (i.e. node.key=value) rather than through node.properties.
+
+    """
+
+    def __init__(self,bim,properties=None):
+        Graph.__init__(self)
+        self._nodes=dict(bim._nodes)
+        self._edges=dict(bim._edges)
+        self._id_count=bim._id_count
+        self._shared_ids=set(bim._nodes)
+        self._relations=bim._relations  # valid until the view's edges change
+        if properties:
+            for _id,d in properties.items():
+                self._own(_id)[1].update(d)
+
+
+    @staticmethod
+    def _node(self,_id,node_tuple):
+        "Returns a Node instance"
+        return BimViewNode(self,_id,node_tuple)
+
+
+    def _own(self,_id):
+        "Copies a shared node tuple into the view and returns the copy"
+        if _id in self._shared_ids:
+            labels,properties,_id_in_edges,_id_out_edges=self._nodes[_id]
+            self._nodes[_id]=(list(labels),
+                              dict(properties),
+                              list(_id_in_edges),
+                              list(_id_out_edges))
+            self._shared_ids.discard(_id)
+        return self._nodes[_id]
+
+
+    def add_edge(self,
+                 start_node,
+                 end_node,
+                 name=None,
+                 properties=None):
+        "Adds a new edge, copying the start and end nodes if needed"
+        self._own(start_node._id)
+        self._own(end_node._id)
+        return BimGraph.add_edge(self,start_node,end_node,name,properties)
+
+
+    def remove_edge(self,
+                    edge):
+        "Removes an edge, copying the start and end nodes if needed"
+        self._own(edge._id_start_node)
+        self._own(edge._id_end_node)
+        return BimGraph.remove_edge(self,edge)
+
+
+class BimRelations():
+    """The derived relationships of a BimGraph
+    
+    All relationships are found in one pass over the edges of the graph. The 
+        keys and values are node _ids.
+    
+    Attributes:
+        - inner_next_to (dict): {surface _id:_id} of the inner adjacent node
+        - outer_next_to (dict): {surface _id:_id} of the outer adjacent node
+        - surface_types (dict): {surface _id:type} where type is 'ground' 
+            (next to a Ground node), 'environment' (next to a Climate node) 
+            or 'internal' (between two spaces)
+        - space_surfaces (dict): {space _id:[surface _ids]}
+        - surfaces (dict): {opening _id:surface _id}
+        - spaces (dict): {_id:space _id} of the nodes which belong to a space, 
+            i.e. People, Light, Appliance and RoomHeater nodes
+        - constructions (dict): {surface or opening _id:construction _id}
+        - layers (dict): {construction _id:[layer _ids]}, outer to inner
+        - next_layer (dict): {layer _id:layer _id}
+        - materials (dict): {layer _id:material _id}
+        - material_layers (dict): {material _id:[layer _ids]}
+        - schedules (dict): {_id:{edge name:schedule _id}}, i.e. 
+            {room heater _id:{'has_heating_schedule':schedule _id}}
+    
+    """
+    
+    def __init__(self,bim):
+        nodes=bim._nodes
+        self.inner_next_to={}
+        self.outer_next_to={}
+        self.surface_types={}
+        self.space_surfaces={}
+        self.surfaces={}
+        self.spaces={}
+        self.constructions={}
+        self.layers={}
+        self.next_layer={}
+        self.materials={}
+        self.material_layers={}
+        self.schedules={}
+        outer_layer={}
+        elements={}  # {layer element _id:layer _id}
+        element_materials={}  # {layer element _id:material _id}
+        for start,end,name,_ in bim._edges.values():
+            if name=='inner_next_to':
+                self.inner_next_to[start]=end
+            elif name=='outer_next_to':
+                self.outer_next_to[start]=end
+            elif name=='has_construction':
+                self.constructions[start]=end
+            elif name=='outer_layer':
+                outer_layer[start]=end
+            elif name=='next_layer':
+                self.next_layer[start]=end
+            elif name=='has' and 'LayerElement' in nodes[start][0]:
+                element_materials[start]=end
+            elif name.endswith('_schedule'):
+                self.schedules.setdefault(start,{})[name]=end
+            elif name=='contains' or name.startswith('has_'):
+                start_labels=nodes[start][0]
+                if 'Space' in start_labels:
+                    self.spaces[end]=start
+                elif 'Surface' in start_labels:
+                    self.surfaces[end]=start
+                elif 'Layer' in start_labels:
+                    elements[end]=start
+        for element,material in element_materials.items():
+            layer=elements.get(element)
+            if layer is None: continue
+            self.materials[layer]=material
+            self.material_layers.setdefault(material,[]).append(layer)
+        for construction,layer in outer_layer.items():
+            l=[]
+            while layer is not None and not layer in l:
+                l.append(layer)
+                layer=self.next_layer.get(layer)
+            self.layers[construction]=l
+        for surface,inner in self.inner_next_to.items():
+            outer=self.outer_next_to.get(surface)
+            labels=nodes[inner][0]+(nodes[outer][0] if outer is not None else [])
+            if 'Ground' in labels:
+                self.surface_types[surface]='ground'
+            elif 'Climate' in labels:
+                self.surface_types[surface]='environment'
+            elif labels.count('Space')==2:
+                self.surface_types[surface]='internal'
+            for _id in (inner,outer):
+                if _id is not None and 'Space' in nodes[_id][0]:
+                    l=self.space_surfaces.setdefault(_id,[])
+                    if not surface in l:
+                        l.append(surface)
+
 
 #------------------------------------------------------------------------------
     
@@ -36,12 +270,7 @@ class BimNode(Node):
         "Adds an inner edge"
         self._graph.add_edge(self,
                             adjacent_node,
-                            'next_to',
-                            properties={'type':'inner'}
-                            )
-        self._graph.add_edge(adjacent_node,
-                            self,
-                            'next_to'
+                            'inner_next_to'
                             )
     
     
@@ -50,43 +279,51 @@ class BimNode(Node):
         "Adds an outer edge"
         self._graph.add_edge(self,
                             adjacent_node,
-                            'next_to',
-                            properties={'type':'outer'}
-                            )
-        self._graph.add_edge(adjacent_node,
-                            self,
-                            'next_to'
+                            'outer_next_to'
                             )
     
+    
+    def _related(self,_ids):
+        "Returns the nodes for a list of _ids"
+        graph=self._graph
+        return [graph._Node(_id) for _id in _ids]
+    
+    
+    def _related_node(self,_id):
+        "Returns the node for an _id, or None"
+        return None if _id is None else self._graph._Node(_id)
+    
+    
+    def _surfaces_of_type(self,types):
+        "Returns the surfaces adjacent to a space with a surface type in types"
+        relations=self._graph.relations()
+        surface_types=relations.surface_types
+        return self._related([x for x in relations.space_surfaces.get(self._id,[])
+                              if surface_types.get(x) in types])
+
+
+    def construction(self):
+        "Returns the Construction node of a surface or opening"
+        return self._related_node(self._graph.relations().constructions.get(self._id))
+    
+    
     def contains(self):
         return self.successor_nodes(name='contains')
     
     
     def environment_surfaces(self):
-        "Returns the surfaces adjacent to the environment"
-        l=[]
-        for surface in self.surfaces:
-            if surface.environments:
-                l.append(surface)
-        return l
+        "Returns the surfaces of a space which are adjacent to the environment"
+        return self._surfaces_of_type(('environment',))
     
     
     def external_surfaces(self):
-        "Returns the surfaces adjacent to the environment and ground"
-        l=[]
-        for surface in self.surfaces:
-            if surface.environments or surface.grounds:
-                l.append(surface)
-        return l
+        "Returns the surfaces of a space which are adjacent to the environment and ground"
+        return self._surfaces_of_type(('environment','ground'))
     
     
     def ground_surfaces(self):
-        "Returns the surfaces adjacent to the ground"
-        l=[]
-        for surface in self.surfaces:
-            if surface.grounds:
-                l.append(surface)
-        return l
+        "Returns the surfaces of a space which are adjacent to the ground"
+        return self._surfaces_of_type(('ground',))
     
     
     def has(self):
@@ -95,29 +332,17 @@ class BimNode(Node):
     
     def heating_schedule(self):
         "Returns the heating schedule of the node"
-        for e in self.out_edges:
-            if (e.name=='has' 
-                and e.properties.get('type')=='heating'
-                and 'Schedule' in e.end_node.labels):
-                return e.end_node
-        return None
+        return self.schedule('has_heating_schedule')
     
     
     def inner_next_to(self):
         "Returns the inner next_to node"
-        for e in self.out_edges:
-            if e.name=='next_to' and e.properties.get('type')=='inner':
-                return e.start_node
-        return None
+        return self._related_node(self._graph.relations().inner_next_to.get(self._id))
     
     
     def internal_surfaces(self):
-        "Returns the surfaces adjacent to another Space"
-        l=[]
-        for surface in self.surfaces:
-            if len(surface.spaces)==2:
-                l.append(surface)
-        return l
+        "Returns the surfaces of a space which are adjacent to another Space"
+        return self._surfaces_of_type(('internal',))
     
     
     def is_contained_by(self):
@@ -130,15 +355,26 @@ class BimNode(Node):
     
     def Layers(self):
         "Returns the layers for the node, from outer to inner"
-        l=[]
-        node=self
-        while True:
-            try:
-                layer=node.Layer[0]
-            except IndexError:
-                return l
-            l.append(layer)
-            node=layer
+        relations=self._graph.relations()
+        l=relations.layers.get(self._id)
+        if l is None:
+            l=[]
+            layer=relations.next_layer.get(self._id)
+            while layer is not None and not layer in l:
+                l.append(layer)
+                layer=relations.next_layer.get(layer)
+        return self._related(l)
+        
+        
+    def material(self):
+        "Returns the material node of a layer"
+        return self._related_node(self._graph.relations().materials.get(self._id))
+    
+    
+    def material_layer(self):
+        "Returns the first layer which has this material node"
+        l=self._graph.relations().material_layers.get(self._id)
+        return self._related_node(l[0] if l else None)
         
     
     def next_to(self):
@@ -147,25 +383,50 @@ class BimNode(Node):
     
     def ordered_materials(self):
         "Returns the material nodes for a construction, in order"
-        name1='has'
-        material_edges=[e for e in self.out_edges
-                        if e.name==name1]
-        l=[None]*len(material_edges)
-        for material_edge in material_edges:
-            index=material_edge.properties['index']
-            l[index]=material_edge
-        l=[e.end_node for e in l]
-        return l
+        materials=self._graph.relations().materials
+        return self._related([materials[x] for x in [n._id for n in self.Layers()] if x in materials])
     
     
     def outer_next_to(self):
         "Returns the outer next_to node"
-        for e in self.out_edges:
-            if e.name=='next_to' and e.properties.get('type')=='outer':
-                return e.start_node
-        return None
+        return self._related_node(self._graph.relations().outer_next_to.get(self._id))
+    
+    
+    def schedule(self,name):
+        "Returns the schedule node of an edge name, i.e. 'has_fraction_schedule'"
+        return self._related_node(self._graph.relations().schedules.get(self._id,{}).get(name))
+    
+    
+    def space(self):
+        "Returns the Space node of a People, Light, Appliance or RoomHeater node"
+        return self._related_node(self._graph.relations().spaces.get(self._id))
+    
+    
+    def space_surfaces(self):
+        "Returns the surfaces adjacent to a space"
+        return self._related(self._graph.relations().space_surfaces.get(self._id,[]))
     
     
+    def surface(self):
+        "Returns the Surface node which contains an opening"
+        return self._related_node(self._graph.relations().surfaces.get(self._id))
+
+
+class BimViewNode(BimNode):
+    "A node of a BimGraphView"
+
+
+    def __setattr__(self,attr,value):
+        """Sets an attribute
+
+        The node tuple is copied into the view before a property is set.
+
+        """
+        if not attr in ['_graph','_id','_node_tuple']:
+            self.__dict__['_node_tuple']=self._graph._own(self._id)
+        BimNode.__setattr__(self,attr,value)
+
+
 # TESTS
     
 if __name__=='__main__':
@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
 
-from graph import Graph
+try:
+    from .graph import Graph
+except ImportError:
+    from graph import Graph
 
 g=Graph()
 
@@ -39,9 +42,37 @@ d={
             'properties':{
                     'uvalue':{
                             'type':'float',
-                            'doc':"The U-value of the construction",
+                            'doc':"""The U-value of the construction, i.e. from the gbXML file. 
+                                     Where given, this is used in place of calculated_u_value, 
+                                     i.e. by MonthlyHeatBalance, as it is the value set by the 
+                                     source of the model. """,
                             'units':'W/m2K'
                             },
+                    'r_value':{
+                            'type':'float',
+                            'doc':"The R-value calculated from the layers, including the surface resistances",
+                            'units':'m2K/W'
+                            },
+                    'calculated_u_value':{
+                            'type':'float',
+                            'doc':"The U-value calculated from the layers by ConstructionArray",
+                            'units':'W/m2K'
+                            },
+                    'heat_capacity':{
+                            'type':'float',
+                            'doc':"The areal heat capacity of all layers",
+                            'units':'J/m2K'
+                            },
+                    'kappa':{
+                            'type':'float',
+                            'doc':"The areal heat capacity of the inner layers, as in BS EN ISO 13786",
+                            'units':'kJ/m2K'
+                            },
+                    'time_constant':{
+                            'type':'float',
+                            'doc':"The heat capacity divided by the U-value",
+                            'units':'hours'
+                            },
                     }
             },
     'Climate':{
@@ -59,8 +90,8 @@ d={
             'properties':{
                     'thickness':{
                             'type':'float',
-                            'doc':"The U-value of the construction",
-                            'units':'W/m2K'
+                            'doc':"The thickness of the layer",
+                            'units':'m'
                             },
                     }
             },
@@ -133,7 +164,7 @@ d={
                             'units':''
                             },
                     'roughness':{
-                            'type':'float',
+                            'type':'str',
                             'doc':"",
                             'units':''
                             },
@@ -197,7 +228,9 @@ d={
                             'doc':"",
                             'enum':[
                                     'electricity',
-                                    'gas'
+                                    'gas',
+                                    'Electric',
+                                    'Gas'
                                     ]
                             }
                     }
@@ -255,13 +288,23 @@ d={
                             'doc':"The cross-sectional area of the surface",
                             'units':'m2'
                             },   
+                    'tilt':{
+                            'type':'float',
+                            'doc':"The tilt of the surface; 0 faces up, 90 is vertical and 180 faces down",
+                            'units':'degrees'
+                            },
+                    'azimuth':{
+                            'type':'float',
+                            'doc':"The azimuth of the surface clockwise from the building's y axis",
+                            'units':'degrees'
+                            }
                     }
             },
     'WindowMaterialGas':{
             'doc':"An gas gap in an window construction",
             'properties':{
                     'gas_type':{
-                            'type':'float',
+                            'type':'str',
                             'doc':"",
                             'units':''
                             }
@@ -316,7 +359,7 @@ d={
                             'units':''
                             },
                     'optical_data_type':{
-                            'type':'float',
+                            'type':'str',
                             'doc':"",
                             'units':''
                             },
@@ -746,6 +789,38 @@ l=[
                          }  
          }
     ],
+    [
+         g.Space[0],
+         g.Appliance[0],
+         'has_people',
+         {
+                 'doc':"Space-Appliance edge, as created by GbxmlToBimMap",
+                 'from_node':{
+                         'min':0,
+                         'max':None
+                         },
+                 'to_node':{
+                         'min':0,
+                         'max':1
+                         }  
+         }
+    ],
+    [
+         g.Space[0],
+         g.Light[0],
+         'has_people',
+         {
+                 'doc':"Space-Light edge, as created by GbxmlToBimMap",
+                 'from_node':{
+                         'min':0,
+                         'max':None
+                         },
+                 'to_node':{
+                         'min':0,
+                         'max':1
+                         }  
+         }
+    ],
     [
          g.Space[0],
          g.People[0],
@@ -951,8 +1026,12 @@ for i in l:
 bim_graph_schema=g
 
 
-from pprint import pprint
-pprint(g.graph_dict())
+
+# tests
+
+if __name__=='__main__':
+    from pprint import pprint
+    pprint(g.graph_dict())
 
 
 
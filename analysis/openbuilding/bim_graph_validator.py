@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+
+import re
+import numpy as np
+import pandas as pd
+
+try:
+    from .bim_graph_schema import bim_graph_schema
+except ImportError:
+    from bim_graph_schema import bim_graph_schema
+
+
+_number=re.compile(r'\s*[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?\s*$')
+
+
+class BimGraphValidator():
+    """Validates and coerces the nodes and edges of a BimGraph against a schema
+
+    The schema (by default bim_graph_schema) is compiled once into:
+        - self.properties: {label:{key:(type,enum)}}
+        - self.edges: {(start label,name,end label):schema edge properties}
+        - self.from_node: {(start label,name):[end labels,min,max]}, the
+            number of edges which may start at a node. Rules with the same
+            start label and name, such as a Surface 'inner_next_to' a Space,
+            Climate or Ground, are combined.
+        - self.to_node: {(name,end label):[start labels,min,max]}, the
+            number of edges which may end at a node
+
+    validate() checks a whole BimGraph in one pass over the nodes and one
+        pass over the edges. Property values are grouped by label and key,
+        so each float property is converted for all nodes in one NumPy
+        operation. The result is a DataFrame with one row per problem.
+
+    Example:
+        report=bim_graph_validator.validate(bim)
+        errors=report[report.level=='error']
+
+    """
+
+    columns=['level','check','label','_id','id','key','value','message']
+
+
+    def __init__(self,schema=None):
+        self.schema=bim_graph_schema if schema is None else schema
+        self.compile()
+
+
+    def compile(self):
+        "Compiles the schema graph"
+        nodes=self.schema._nodes
+        self.properties={}
+        for labels,p,_,_ in nodes.values():
+            d={}
+            for k,v in p.get('properties',{}).items():
+                d[k]=(v.get('type'),v.get('enum'))
+            self.properties[labels[0]]=d
+        self.edges={}
+        self.from_node={}
+        self.to_node={}
+        for start,end,name,p in self.schema._edges.values():
+            start_label=nodes[start][0][0]
+            end_label=nodes[end][0][0]
+            self.edges[(start_label,name,end_label)]=p
+            for d,key,label,limits in ((self.from_node,(start_label,name),end_label,p['from_node']),
+                                       (self.to_node,(name,end_label),start_label,p['to_node'])):
+                if not key in d:
+                    d[key]=[set(),limits['min'],limits['max']]
+                rule=d[key]
+                rule[0].add(label)
+                rule[1]=min(rule[1],limits['min'])
+                if rule[2] is not None:
+                    rule[2]=None if limits['max'] is None else max(rule[2],limits['max'])
+        # {label:[(check,edge name,other labels,min,max)]}
+        self._rules={}
+        for (label,name),rule in self.from_node.items():
+            self._rules.setdefault(label,[]).append(('from_node',name)+tuple(rule))
+        for (name,label),rule in self.to_node.items():
+            self._rules.setdefault(label,[]).append(('to_node',name)+tuple(rule))
+
+
+    @staticmethod
+    def _issue(level,check,label,_id,properties,key,value,message):
+        "Returns a report row"
+        return (level,check,label,_id,properties.get('id'),key,value,message)
+
+
+    @staticmethod
+    def _is_type(value,type1):
+        "Returns True if value has the schema type"
+        if type1=='str':
+            return isinstance(value,str)
+        if type1=='list':
+            return isinstance(value,(list,tuple))
+        if type1=='float':
+            return isinstance(value,float)
+        if type1 and '.' in type1:  # a class, i.e. 'openbuilding.YearSchedule'
+            return type(value).__name__==type1.split('.')[-1]
+        return True
+
+
+    def _check_properties(self,bim,coerce,numbers):
+        "Returns the property issues, converting the values if coerce is True"
+        issues=[]
+        values={}  # {(label,key):[(_id,properties,value)]}
+        for _id,(labels,properties,_,_) in bim._nodes.items():
+            label=labels[0] if labels else None
+            schema=self.properties.get(label)
+            if schema is None:
+                issues.append(self._issue('warning','label',label,_id,properties,
+                                          None,None,'label not in schema'))
+                schema={}
+            for k,v in properties.items():
+                if v is None: continue
+                if k in schema:
+                    values.setdefault((label,k),[]).append((_id,properties,v))
+                elif coerce and numbers:
+                    if isinstance(v,str):
+                        if _number.match(v): properties[k]=float(v)
+                    elif isinstance(v,int) and not isinstance(v,bool):
+                        properties[k]=float(v)
+        for (label,k),l in values.items():
+            type1,enum=self.properties[label][k]
+            if type1=='float':
+                try:
+                    a=np.asarray([x[2] for x in l],dtype=float)
+                    ok=np.ones(len(l),dtype=bool)
+                except (ValueError,TypeError):
+                    ok=np.array([isinstance(x[2],(int,float,np.number)) and not isinstance(x[2],bool)
+                                 or isinstance(x[2],str) and bool(_number.match(x[2]))
+                                 for x in l])
+                    a=np.array([float(x[2]) if y else np.nan for x,y in zip(l,ok)])
+                if coerce:
+                    for (_id,properties,v),x,y in zip(l,a.tolist(),ok):
+                        if y: properties[k]=x
+                for (_id,properties,v),y in zip(l,ok):
+                    if not y:
+                        issues.append(self._issue('error','type',label,_id,properties,
+                                                  k,v,'not a float'))
+            else:
+                for _id,properties,v in l:
+                    if not self._is_type(v,type1):
+                        issues.append(self._issue('error','type',label,_id,properties,
+                                                  k,v,'not a {}'.format(type1)))
+            if enum:
+                for _id,properties,v in l:
+                    if not v in enum:
+                        issues.append(self._issue('error','enum',label,_id,properties,
+                                                  k,v,'not one of {}'.format(enum)))
+        return issues
+
+
+    def _check_edges(self,bim):
+        "Returns the edge and cardinality issues"
+        nodes=bim._nodes
+        issues=[]
+        counts={}  # {('from_node' or 'to_node',node _id,edge name):count}
+        for start,end,name,_ in bim._edges.values():
+            start_labels=nodes[start][0]
+            end_labels=nodes[end][0]
+            start_label=start_labels[0] if start_labels else None
+            end_label=end_labels[0] if end_labels else None
+            if not (start_label,name,end_label) in self.edges:
+                issues.append(self._issue('warning','edge',start_label,start,nodes[start][1],
+                                          name,end_label,'edge not in schema'))
+                continue
+            for key in (('from_node',start,name),('to_node',end,name)):
+                counts[key]=counts.get(key,0)+1
+        for _id,(labels,properties,_,_) in nodes.items():
+            label=labels[0] if labels else None
+            for check,name,labels1,minimum,maximum in self._rules.get(label,()):
+                n=counts.get((check,_id,name),0)
+                if n<minimum or (maximum is not None and n>maximum):
+                    issues.append(self._issue(
+                        'error',check,label,_id,properties,name,n,
+                        '{} {} edges {} {}, expected {} to {}'.format(
+                            n,name,
+                            'to' if check=='from_node' else 'from',
+                            '/'.join(sorted(labels1)),
+                            minimum,
+                            'any' if maximum is None else maximum)))
+        return issues
+
+
+    def coerce(self,bim,numbers=False):
+        """Converts the properties of a BimGraph to their schema types
+
+        Arguments:
+            - bim (BimGraph): changed in place
+            - numbers (bool): if True then properties which are not in the
+                schema are also converted to floats if they are numbers,
+                i.e. '0.5'
+
+        Returns a report DataFrame of the values which could not be
+            converted.
+
+        """
+        issues=self._check_properties(bim,coerce=True,numbers=numbers)
+        return pd.DataFrame([x for x in issues if x[1]!='label'],columns=self.columns)
+
+
+    def validate(self,bim,coerce=False,numbers=False):
+        """Checks a BimGraph against the schema
+
+        Arguments:
+            - bim (BimGraph): the graph to check
+            - coerce (bool): if True then the properties are also converted
+                to their schema types, as in coerce()
+            - numbers (bool): passed to coerce()
+
+        Returns a report DataFrame with the columns 'level' ('error' or
+            'warning'), 'check' ('label', 'type', 'enum', 'edge',
+            'from_node' or 'to_node'), 'label', '_id', 'id', 'key',
+            'value' and 'message'.
+
+        """
+        issues=self._check_properties(bim,coerce=coerce,numbers=numbers)
+        issues+=self._check_edges(bim)
+        return pd.DataFrame(issues,columns=self.columns)
+
+
+bim_graph_validator=BimGraphValidator()  # the default validator
+
+
+
+# tests
+
+if __name__=='__main__':
+    import time
+    from gbxml_graph import GbxmlGraph
+    from gbxml_to_bim_map import GbxmlToBimMap
+
+    print('TEST-BimGraphValidator')
+
+    gbxml=GbxmlGraph()
+    gbxml.read_xml(r'../01_D-original_gbXML/detached_house.gbxml')
+    o=GbxmlToBimMap()
+    o.input_gbxml=gbxml
+    o.run()
+    bim=o.output_bim
+
+    t=time.time()
+    report=bim_graph_validator.validate(bim)
+    print('validate',time.time()-t)
+    print(report.groupby(['level','check']).size())
+
+    bim.Space[0].area='large'
+    bim.remove_edge(bim.Surface[0].out_edges[0])
+    print(bim_graph_validator.validate(bim)[['check','id','key','message']])
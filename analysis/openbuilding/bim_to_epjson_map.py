@@ -5,8 +5,19 @@ try:
 except ImportError:
     from epjson_graph import EpjsonGraph
     
+try:
+    from .schedule_pool import schedule_pool
+except ImportError:
+    from schedule_pool import schedule_pool
+    
 class BimToEpjsonMap():
-    "A mapping object to transfer BimGraph to IdfGraph"
+    """A mapping object to transfer BimGraph to IdfGraph
+    
+    Schedule nodes with the same content are written once, with the name of
+        the first of them, and all nodes which use them refer to that name.
+        Set self.schedule_pool to None to write every Schedule node.
+    
+    """
     
     def __init__(self):
         
@@ -79,6 +90,8 @@ class BimToEpjsonMap():
         self.input_bim=None
         self.input_epjson=input_epjson
         self.output_epjson=None
+        self.schedule_pool=schedule_pool
+        self._schedule_names={}  # {schedule node _id:epjson schedule name}
     
    
     def _map_appliance_node(self,node):
@@ -86,10 +99,10 @@ class BimToEpjsonMap():
         Adds a ElectricEquipment node 
         """
         name=node.id
-        space_node=node.predeccessor_node(label='Space')
+        space_node=node.space()
         zone_name=space_node.id
-        schedule=node.successor_node(name='has_fraction_schedule')
-        schedule_name=schedule.id
+        schedule=node.schedule('has_fraction_schedule')
+        schedule_name=self._schedule_name(schedule)
         heat_gain_per_area=node.power_per_area
         #add Node
         n=self.output_epjson.add_node(
@@ -188,10 +201,10 @@ class BimToEpjsonMap():
         Adds a Lights node 
         """
         name=node.id
-        space_node=node.predeccessor_node(label='Space')
+        space_node=node.space()
         zone_name=space_node.id
-        schedule=node.successor_node(name='has_fraction_schedule')
-        schedule_name=schedule.id
+        schedule=node.schedule('has_fraction_schedule')
+        schedule_name=self._schedule_name(schedule)
         heat_gain_per_area=node.power_per_area
         #add Node
         n=self.output_epjson.add_node(
@@ -212,8 +225,7 @@ class BimToEpjsonMap():
         """
         Adds a Material node 
         """
-        layer_element=node.predeccessor_node(label='LayerElement')
-        layer=layer_element.predeccessor_node(label='Layer')
+        layer=node.material_layer()
         name=layer.id
         n=self.output_epjson.add_node(
                 labels='Material',
@@ -236,8 +248,7 @@ class BimToEpjsonMap():
         """
         Adds a 'Material:AirGap' node 
         """
-        layer_element=node.predeccessor_node(label='LayerElement')
-        layer=layer_element.predeccessor_node(label='Layer')
+        layer=node.material_layer()
         name=layer.id
         n=self.output_epjson.add_node(
                 labels='Material:AirGap',
@@ -263,11 +274,10 @@ class BimToEpjsonMap():
         a=node.openingType
         surface_type=opening_type_map[a]
         #construction_name
-        construction_node=node.Construction[0]
+        construction_node=node.construction()
         construction_name=construction_node.id
         #building_surface_name
-        surface_node=node.predeccessor_node(label='Surface',
-                                            name='contains')
+        surface_node=node.surface()
         building_surface_name=surface_node.id
         #vertices
         vertices=[]
@@ -301,11 +311,11 @@ class BimToEpjsonMap():
         Adds a People node 
         """
         name=node.id
-        space_node=node.predeccessor_node(label='Space')
+        space_node=node.space()
         zone_name=space_node.id
-        number_of_people_schedule=node.successor_node(name='has_fraction_schedule')
+        number_of_people_schedule=node.schedule('has_fraction_schedule')
         number_of_people_schedule_name=\
-            number_of_people_schedule.id
+            self._schedule_name(number_of_people_schedule)
         number_of_people=node.number_of_people
         activity_level_schedule_name=name+'_activity_level'
         #add activity schedule node
@@ -344,8 +354,7 @@ class BimToEpjsonMap():
         #name
         name=node.id
         #zone_name
-        space=node.predeccessor_node(label='Space',
-                                     name='contains')
+        space=node.space()
         zone_name=space.id
         #template_thermostat_name
         print(name)
@@ -368,8 +377,8 @@ class BimToEpjsonMap():
                 )
              
         #heating_setpoint_schedule_name
-        heating_schedule=node.successor_node(name='has_heating_schedule')
-        heating_setpoint_schedule_name=heating_schedule.id
+        heating_schedule=node.heating_schedule()
+        heating_setpoint_schedule_name=self._schedule_name(heating_schedule)
         #add 'HVACTemplate:Thermostat' node
         self.output_epjson.add_node(
                 labels='HVACTemplate:Thermostat',
@@ -387,6 +396,8 @@ class BimToEpjsonMap():
     def _map_schedule_node(self,node):
         "Adds a 'Schedule' node"
         name=node.id
+        if self._schedule_name(node)!=name:  # written for another node
+            return
         ys=node.year_schedule
         self._map_schedule_schedule_year(name,ys)
     
@@ -394,15 +405,19 @@ class BimToEpjsonMap():
     def _map_schedule_schedule_year(self,name,ys):
         "adds the Schedule:Year object"
         d={}
+        weeks={}  # {week content hash:name}
         for i,ps in enumerate(ys.seq):
-            name1=name+'_ws{}'.format(i+1)
+            k=ps.ws.content_hash()
+            name1=weeks.get(k)
+            if name1 is None:
+                name1=weeks[k]=name+'_ws{}'.format(i+1)
+                self._map_schedule_schedule_week_daily(name1,ps)
             e={'schedule_week_name_{}'.format(i+1):name1,
                'start_month_{}'.format(i+1):ps.begin_date.month,
                'start_day_{}'.format(i+1):ps.begin_date.day,
                'end_month_{}'.format(i+1):ps.end_date.month,
                'end_day_{}'.format(i+1):ps.end_date.day}
             d.update(e)
-            self._map_schedule_schedule_week_daily(name1,ps)
         n=self.output_epjson.add_node(
                 labels='Schedule:Year',
                 properties={
@@ -469,6 +484,11 @@ class BimToEpjsonMap():
         return n
         
     
+    def _schedule_name(self,node):
+        "Returns the epjson name of a Schedule node"
+        return self._schedule_names.get(node._id,node.id)
+        
+    
     def _map_space_node(self,node):
         """
         Adds a Zone 
@@ -507,22 +527,23 @@ class BimToEpjsonMap():
         #name
         name=node.id
         #surface_type
-        if node.Ground:
+        adjacent_type=self.input_bim.relations().surface_types.get(node._id)
+        if adjacent_type=='ground':
             surface_type='Floor'
-        elif node.Climate and node.tilt==90:
+        elif adjacent_type=='environment' and node.tilt==90:
             surface_type='Wall'
-        elif node.Climate and node.tilt!=90:
+        elif adjacent_type=='environment' and node.tilt!=90:
             surface_type='Roof'
         else:
             surface_type='Ceiling'
         #construction_name
-        construction_node=node.Construction[0]
+        construction_node=node.construction()
         construction_name=construction_node.id
         #zone name
-        inner_node=node.successor_node(name='inner_next_to')
+        inner_node=node.inner_next_to()
         zone_name=inner_node.id
         #outside_boundary_condition
-        outer_node=node.successor_node(name='outer_next_to')
+        outer_node=node.outer_next_to()
         for k,v in outside_boundary_condition_map.items():
             if k in outer_node.labels:
                 outside_boundary_condition=v
@@ -569,8 +590,7 @@ class BimToEpjsonMap():
         """
         Adds a 'WindowMaterial:Gas' node 
         """
-        layer_element=node.predeccessor_node(label='LayerElement')
-        layer=layer_element.predeccessor_node(label='Layer')
+        layer=node.material_layer()
         name=layer.id
         n=self.output_epjson.add_node(
                 labels='WindowMaterial:Gas',
@@ -588,8 +608,7 @@ class BimToEpjsonMap():
         """
         Adds a 'WindowMaterial:Glazing' node 
         """
-        layer_element=node.predeccessor_node(label='LayerElement')
-        layer=layer_element.predeccessor_node(label='Layer')
+        layer=node.material_layer()
         name=layer.id
         n=self.output_epjson.add_node(
                 labels='WindowMaterial:Glazing',
@@ -623,6 +642,12 @@ class BimToEpjsonMap():
         #SET UP SELF.OUTPUT_IDF
         self.output_epjson=self.input_epjson.copy()
         
+        #FIND THE SCHEDULES WITH THE SAME CONTENT
+        if self.schedule_pool is None:
+            self._schedule_names={}
+        else:
+            self._schedule_names=self.schedule_pool.names(self.input_bim)
+        
         #ADD NODES TO EpjsonGRAPH
         for n in self.input_bim.nodes:
             labels=n.labels
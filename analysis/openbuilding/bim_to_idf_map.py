@@ -1,13 +1,58 @@
 # -*- coding: utf-8 -*-
 
+import time
+import pandas as pd
+
 try:
     from .idf_graph import IdfGraph
 except ImportError:
     from idf_graph import IdfGraph
+
+try:
+    from .geometry import PolygonArray
+except ImportError:
+    from geometry import PolygonArray
+    
+try:
+    from .schedule_pool import schedule_pool
+except ImportError:
+    from schedule_pool import schedule_pool
     
 class BimToIdfMap():
-    "A mapping object to transfer BimGraph to IdfGraph"
+    """A mapping object to transfer BimGraph to IdfGraph
     
+    run() records which IdfGraph objects were created from each BimGraph 
+        node. update() then patches only the IdfGraph objects of the nodes 
+        which have changed, for example in a BimGraphView variant of 
+        self.input_bim, rather than mapping the whole model again.
+
+    The mapping rules are registered by label in self.rules. The number of
+        calls and the time taken by each rule are placed in self.rule_stats,
+        and rule_report() returns these as a DataFrame.
+
+    Schedule nodes with the same content are written once, with the name of
+        the first of them, and all nodes which use them refer to that name.
+        Set self.schedule_pool to None to write every Schedule node.
+
+    """
+
+    # {label:[rule names]} - the rules run in this order for each BimGraph node
+    rules={
+            'Building':['_map_building_node'],
+            'Space':['_map_space_node',
+                     '_map_infiltration_node'],
+            'Surface':['_map_surface_node'],
+            'Construction':['_map_construction_node'],
+            'Layer':['_map_layer_node'],
+            'Opening':['_map_opening_node'],
+            'Schedule':['_map_schedule_node'],
+            'RoomHeater':['_map_room_heater_node'],
+            'People':['_map_people_node'],
+            'Light':['_map_light_node'],
+            'Appliance':['_map_appliance_node']
+            }
+
+
     def __init__(self):
         
         input_idf=IdfGraph()
@@ -25,6 +70,64 @@ class BimToIdfMap():
         self.input_bim=None
         self.input_idf=input_idf
         self.output_idf=None
+        self.provenance={}  # {bim node _id:[idf node _ids]}
+        self.rule_stats={}  # {rule name:[calls,seconds]}
+        self.schedule_pool=schedule_pool
+        self._schedule_names={}  # {schedule node _id:idf schedule name}
+    
+    
+    @staticmethod
+    def _dependencies(bim,_id):
+        """Returns the _ids of the BimGraph nodes read when mapping a node
+        
+        If any of these nodes change then the node needs mapping again.
+        
+        """
+        nodes=bim._nodes
+        edges=bim._edges
+        
+        def out(i,name=None):
+            return [edges[e][1] for e in nodes[i][3] 
+                    if name is None or edges[e][2]==name]
+        
+        def layers(i):
+            l=[]
+            layer=out(i,'outer_layer')
+            while layer:
+                l.append(layer[0])
+                for element in out(layer[0],'contains'):
+                    l.append(element)
+                    l.extend(out(element,'has'))
+                layer=out(layer[0],'next_layer')
+            return l
+        
+        labels=nodes[_id][0]
+        s={_id}
+        if 'Layer' in labels:
+            for element in out(_id,'contains'):
+                s.add(element)
+                s.update(out(element,'has'))
+        elif 'Construction' in labels:
+            s.update(layers(_id))
+        elif 'Surface' in labels or 'Opening' in labels:
+            for i in out(_id):
+                s.add(i)
+                if 'Construction' in nodes[i][0]:
+                    s.update(layers(i))
+            s.update(edges[e][0] for e in nodes[_id][2] 
+                     if 'Surface' in nodes[edges[e][0]][0])
+        elif not 'Space' in labels and not 'Building' in labels \
+            and not 'Schedule' in labels:
+            s.update(out(_id))
+            s.update(edges[e][0] for e in nodes[_id][2])
+        return s
+    
+    
+    def _find_schedule_names(self,bim):
+        "Returns {schedule node _id:idf schedule name}"
+        if self.schedule_pool is None:
+            return {}
+        return self.schedule_pool.names(bim)
     
     
     def _map_appliance_node(self,node):
@@ -32,10 +135,10 @@ class BimToIdfMap():
         Adds a ElectricEquipment node to the IdfGraph
         """
         name=node.id
-        space_node=node.predeccessor_node(label='Space')
+        space_node=node.space()
         zone_name=space_node.id
-        schedule=node.successor_node(name='has_fraction_schedule')
-        schedule_name=schedule.id
+        schedule=node.schedule('has_fraction_schedule')
+        schedule_name=self._schedule_name(schedule)
         heat_gain_per_area=node.power_per_area
         #add Node
         n=self.output_idf.add_electric_equipment(
@@ -105,10 +208,10 @@ class BimToIdfMap():
         
         """
         name=node.id
-        layer_element=node.LayerElement[0]
+        material=node.material()
+        labels=material.labels if material else []
         
-        if layer_element.Material:
-            material=layer_element.Material[0]
+        if 'Material' in labels:
             n=self.output_idf.add_material(
                     name=name,
                     thickness=node.thickness,
@@ -122,16 +225,14 @@ class BimToIdfMap():
                     )
             return n
     
-        if layer_element.MaterialAirGap:
-            material=layer_element.MaterialAirGap[0]
+        if 'MaterialAirGap' in labels:
             n=self.output_idf.add_material_air_gap(
                 name=name,
                 thermal_resistance=material.thermal_resistance or 0.18
             ) 
             return n
     
-        if layer_element.WindowMaterialGlazing:
-            material=layer_element.WindowMaterialGlazing[0]
+        if 'WindowMaterialGlazing' in labels:
             n=self.output_idf.add_window_material_glazing(
                 name=name,
                 thickness=node.thickness,
@@ -147,8 +248,7 @@ class BimToIdfMap():
                 conductivity=material.conductivity or 0.9
             )
             
-        if layer_element.WindowMaterialGas:
-            material=layer_element.WindowMaterialGas[0]
+        if 'WindowMaterialGas' in labels:
             n=self.output_idf.add_window_material_gas(
                 name=name,
                 gas_type=material.gas_type,
@@ -162,10 +262,10 @@ class BimToIdfMap():
         Adds a Lights node to the IdfGraph
         """
         name=node.id
-        space_node=node.predeccessor_node(label='Space')
+        space_node=node.space()
         zone_name=space_node.id
-        schedule=node.successor_node(name='has_fraction_schedule')
-        schedule_name=schedule.id
+        schedule=node.schedule('has_fraction_schedule')
+        schedule_name=self._schedule_name(schedule)
         heat_gain_per_area=node.power_per_area
         #add Node
         n=self.output_idf.add_lights(
@@ -191,27 +291,25 @@ class BimToIdfMap():
         name=node.id
         surface_type='Door'
         #construction_name
-        construction_node=node.Construction[0]
+        construction_node=node.construction()
         construction_name=construction_node.id
         #surface_type
         layers=construction_node.Layers()
-        layer_elements=[n.LayerElement[0] for n in layers]
-        materials=[n.successor_node(name='has') for n in layer_elements]
-        material_labels=[n.labels[0] for n in materials]
+        materials=[n.material() for n in layers]
+        material_labels=[n.labels[0] for n in materials if n]
         if 'WindowMaterialGlazing' in material_labels:
             surface_type='Window'
         else:
             surface_type='Door'
         
         #building_surface_name
-        surface_node=node.predeccessor_node(label='Surface',
-                                            name='contains')
+        surface_node=node.surface()
         building_surface_name=surface_node.id
         #number_of_vertices
-        vertices=node.outer_vertices
-        number_of_vertices=len(vertices)
+        i=self._geometry.index(node._id)
+        number_of_vertices=int(self._geometry.offsets[i+1]-self._geometry.offsets[i])
         #vertices
-        l=[y for x in vertices for y in x]
+        l=self._geometry.flat_vertices(i)
         #add node
         n=self.output_idf.add_fenestration_surface_detailed(
                name=name,
@@ -234,11 +332,11 @@ class BimToIdfMap():
         Adds a People node to the IdfGraph
         """
         name=node.id
-        space_node=node.predeccessor_node(label='Space')
+        space_node=node.space()
         zone_name=space_node.id
-        number_of_people_schedule=node.successor_node(name='has_fraction_schedule')
+        number_of_people_schedule=node.schedule('has_fraction_schedule')
         number_of_people_schedule_name=\
-            number_of_people_schedule.id
+            self._schedule_name(number_of_people_schedule)
         number_of_people=node.number_of_people
         activity_level_schedule_name=name+'_activity_level'
         #add activity schedule node
@@ -273,8 +371,7 @@ class BimToIdfMap():
         #name
         name=node.id
         #zone_name
-        space=node.predeccessor_node(label='Space',
-                                     name='contains')
+        space=node.space()
         zone_name=space.id
         #template_thermostat_name
         template_thermostat_name=name+'_thermostat'
@@ -291,8 +388,8 @@ class BimToIdfMap():
               )
         
         #heating_setpoint_schedule_name
-        heating_schedule=node.successor_node(name='has_heating_schedule')
-        heating_setpoint_schedule_name=heating_schedule.id
+        heating_schedule=node.heating_schedule()
+        heating_setpoint_schedule_name=self._schedule_name(heating_schedule)
         #add 'HVACTemplate:Thermostat' node
         self.output_idf.add_HVAC_template_thermostat(
              name=template_thermostat_name,
@@ -312,6 +409,8 @@ class BimToIdfMap():
         #set up
         ys=node.year_schedule
         name=node.id
+        if self._schedule_name(node)!=name:  # written for another node
+            return
         
         #add_schedule_year
         self._map_schedule_schedule_year(name,ys)
@@ -349,19 +448,28 @@ class BimToIdfMap():
     def _map_schedule_schedule_year(self,name,ys):
         "adds the Schedule:Year object"
         l=[]
+        weeks={}  # {week content hash:name}
         for i,ps in enumerate(ys.seq):
-            name1=name+'_ws'+str(i)
+            k=ps.ws.content_hash()
+            name1=weeks.get(k)
+            if name1 is None:
+                name1=weeks[k]=name+'_ws'+str(i)
+                self._map_schedule_schedule_week_daily(name1,ps)
             d={'schedule_week_name':name1,
                'start_month':ps.begin_date.month,
                'start_day':ps.begin_date.day,
                'end_month':ps.end_date.month,
                'end_day':ps.end_date.day}
             l.append(d)
-            self._map_schedule_schedule_week_daily(name1,ps)
         self.output_idf.add_schedule_year(name=name,
                                           weekSchedules=l)
     
     
+    def _schedule_name(self,node):
+        "Returns the idf name of a Schedule node"
+        return self._schedule_names.get(node._id,node.id)
+    
+    
     def _map_space_node(self,node):
         """
         Adds a Zone to the IdfGraph
@@ -389,22 +497,23 @@ class BimToIdfMap():
         #name
         name=node.properties.get('id')
         #surface_type
-        if node.Ground:
+        adjacent_type=self.input_bim.relations().surface_types.get(node._id)
+        if adjacent_type=='ground':
             surface_type='Floor'
         elif node.tilt==90:
             surface_type='Wall'
-        elif node.Climate and node.tilt!=90:
+        elif adjacent_type=='environment' and node.tilt!=90:
             surface_type='Roof'
         else:
             surface_type='Ceiling'
         #construction_name
-        construction_node=node.Construction[0]
+        construction_node=node.construction()
         construction_name=construction_node.id
         #zone name
-        inner_node=node.successor_node(name='inner_next_to')
+        inner_node=node.inner_next_to()
         zone_name=inner_node.id
         #outside_boundary_condition
-        outer_node=node.successor_node(name='outer_next_to')
+        outer_node=node.outer_next_to()
         for k,v in outside_boundary_condition_map.items():
             if k in outer_node.labels:
                 outside_boundary_condition=v
@@ -420,10 +529,10 @@ class BimToIdfMap():
         #view_factor_to_ground
         view_factor_to_ground=''
         #number_of_vertices
-        vertices=node.outer_vertices
-        number_of_vertices=len(vertices)
+        i=self._geometry.index(node._id)
+        number_of_vertices=int(self._geometry.offsets[i+1]-self._geometry.offsets[i])
         #vertices
-        l=[y for x in vertices for y in x]
+        l=self._geometry.flat_vertices(i)
         #add node
         n=self.output_idf.add_building_surface_detailed(
               name=name,
@@ -441,39 +550,167 @@ class BimToIdfMap():
         return n
     
     
+    def _map_node(self,n):
+        "Adds the IdfGraph objects for a BimGraph node"
+        labels=n.labels
+        for label,rules in self.rules.items():
+            if label in labels:
+                for rule in rules:
+                    self._run_rule(rule,n)
+    
+    
+    def _run_rule(self,rule,*args):
+        "Runs a mapping rule and updates self.rule_stats"
+        t=time.perf_counter()
+        result=getattr(self,rule)(*args)
+        stats=self.rule_stats.setdefault(rule,[0,0.0])
+        stats[0]+=1
+        stats[1]+=time.perf_counter()-t
+        return result
+    
+    
+    def _record(self,_id):
+        "Records the dependencies of a mapped BimGraph node"
+        for _id1 in self._depends_on.pop(_id,()):
+            self._readers.get(_id1,set()).discard(_id)
+        s=self._dependencies(self.input_bim,_id)
+        self._depends_on[_id]=s
+        for _id1 in s:
+            self._readers.setdefault(_id1,set()).add(_id)
+        self._node_tuples[_id]=self.input_bim._nodes[_id]
+    
+    
+    def _patch(self,_id):
+        """Maps a BimGraph node again and patches self.output_idf
+        
+        Existing IdfGraph objects are changed in place where the object type
+            is unchanged, so the order of the idf file is kept.
+        
+        """
+        idf=self.output_idf
+        old=self.provenance.pop(_id,[])
+        new=[]
+        if _id in self.input_bim._nodes:
+            scratch=IdfGraph()
+            self.output_idf=scratch
+            try:
+                self._map_node(self.input_bim._Node(_id))
+            finally:
+                self.output_idf=idf
+            new=[scratch._nodes[i][:2] for i in scratch._nodes]
+        l=[]
+        for i,(labels,properties) in enumerate(new):
+            if i<len(old) and idf._nodes[old[i]][0]==labels:
+                p=idf._nodes[old[i]][1]
+                p.clear()
+                p.update(properties)
+                l.append(old[i])
+            else:
+                n=idf.add_node(labels=list(labels),properties=dict(properties))
+                l.append(n._id)
+        for _id1 in old:
+            if not _id1 in l:
+                idf.remove_node(idf._Node(_id1))
+        if l:
+            self.provenance[_id]=l
+        return l
+    
+    
+    def rule_report(self):
+        "Returns a DataFrame of the calls and time of each rule, slowest first"
+        df=pd.DataFrame.from_dict(self.rule_stats,
+                                  orient='index',
+                                  columns=['calls','time'])
+        df['time_per_call']=df['time']/df['calls']
+        return df.sort_values('time',ascending=False)
+    
+    
     def run(self):
         "Running the mapping, Bim object placed in self.output"
         
         #SET UP SELF.OUTPUT_IDF
         self.output_idf=self.input_idf.copy()
+        self.provenance={}
+        self.rule_stats={}
+        self._depends_on={}
+        self._readers={}
+        self._node_tuples={}
+        
+        #PACK ALL SURFACE AND OPENING VERTICES
+        self._geometry=PolygonArray.from_bim(self.input_bim)
+        
+        #FIND THE SCHEDULES WITH THE SAME CONTENT
+        self._schedule_names=self._find_schedule_names(self.input_bim)
         
         #ADD NODES TO IDFGRAPH
         
         for n in self.input_bim.nodes:
-            labels=n.labels
-            if 'Building' in labels:
-                self._map_building_node(n)
-            if 'Space' in labels:
-                self._map_space_node(n)
-                self._map_infiltration_node(n)
-            if 'Surface' in labels:
-                self._map_surface_node(n)
-            if 'Construction' in labels:
-                self._map_construction_node(n)
-            if 'Layer' in labels:
-                self._map_layer_node(n)
-            if 'Opening' in labels:
-                self._map_opening_node(n)
-            if 'Schedule' in labels:
-                self._map_schedule_node(n)
-            if 'RoomHeater' in labels:
-                self._map_room_heater_node(n)
-            if 'People' in labels:
-                self._map_people_node(n)
-            if 'Light' in labels:
-                self._map_light_node(n)
-            if 'Appliance' in labels:
-                self._map_appliance_node(n)
+            start=self.output_idf._id_count
+            self._map_node(n)
+            l=[i for i in range(start,self.output_idf._id_count) 
+               if i in self.output_idf._nodes]
+            if l:
+                self.provenance[n._id]=l
+            self._record(n._id)
+            
+    
+    def update(self,bim=None,changed=None):
+        """Patches self.output_idf for changes to the BimGraph
+        
+        Only the IdfGraph objects created from the changed nodes, and from 
+            nodes which read the changed nodes, are mapped again.
+        
+        Arguments:
+            - bim (BimGraph): the changed BimGraph, i.e. a BimGraphView of 
+                self.input_bim. If None then self.input_bim has been 
+                changed in place.
+            - changed (list): the changed nodes or node _ids. If None then
+                the changed nodes are found by comparing the node tuples with
+                those last mapped, which finds all changes in a BimGraphView
+                and all added or removed nodes.
+                
+        Returns the list of BimGraph node _ids which were mapped again.
+        
+        """
+        if bim is not None:
+            self.input_bim=bim
+        bim=self.input_bim
+        if changed is None:
+            changed={_id for _id,t in bim._nodes.items() 
+                     if self._node_tuples.get(_id) is not t}
+            changed.update(_id for _id in self._node_tuples 
+                           if not _id in bim._nodes)
+        else:
+            changed={getattr(x,'_id',x) for x in changed}
+        
+        #FIND THE SCHEDULES WHICH ARE NOW WRITTEN UNDER ANOTHER NAME
+        names=self._find_schedule_names(bim)
+        changed.update(_id for _id in set(names)|set(self._schedule_names)
+                       if names.get(_id)!=self._schedule_names.get(_id))
+        self._schedule_names=names
+        
+        #FIND THE NODES TO MAP AGAIN
+        affected=set(changed)
+        for _id in changed:
+            affected.update(self._readers.get(_id,()))
+        
+        #PACK THE VERTICES AGAIN IF ANY GEOMETRY HAS CHANGED
+        if any(_id in bim._nodes and 
+               ('Surface' in bim._nodes[_id][0] or 'Opening' in bim._nodes[_id][0])
+               for _id in changed):
+            self._geometry=PolygonArray.from_bim(bim)
+        
+        #PATCH
+        l=sorted(affected)
+        for _id in l:
+            self._patch(_id)
+            if _id in bim._nodes:
+                self._record(_id)
+            else:
+                for _id1 in self._depends_on.pop(_id,()):
+                    self._readers.get(_id1,set()).discard(_id)
+                self._node_tuples.pop(_id,None)
+        return l
     
     
     
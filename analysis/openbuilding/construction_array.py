@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+
+"""This module contains vectorised thermal calculations for constructions
+
+A ConstructionArray holds the layers of many constructions, for example all
+    the Construction nodes of one or many BimGraphs, in packed NumPy arrays.
+    The layers of construction i are layers[offsets[i]:offsets[i+1]], from
+    outer to inner. R-values, U-values, areal heat capacities, kappa values
+    and time constants are calculated for all constructions in one pass.
+
+Conventions:
+    - the R-value includes the surface resistances of both sides, as in 
+        BS EN ISO 6946: r_si and r_se for constructions of external and 
+        ground surfaces, and r_si on both sides for internal constructions
+        (those used only by surfaces between two spaces, i.e. partitions, 
+        ceilings and internal floors, and their openings)
+    - kappa is the areal heat capacity of the layers nearest the inside
+        surface, up to the first of: max_depth (0.1m), half the total
+        thickness or the first insulation layer (as in BS EN ISO 13786 and
+        the SAP kappa value)
+    - the time constant is the total areal heat capacity divided by the
+        U-value
+
+Example:
+    c=ConstructionArray.from_bim([bim1,bim2])
+    df=c.to_dataframe()
+    c.set_properties([bim1,bim2])
+
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class ConstructionArray():
+    """A packed array of construction layers
+
+    Attributes:
+        - thickness (np.ndarray): the thickness of each layer (m)
+        - conductivity (np.ndarray): the conductivity of each layer (W/mK),
+            or nan for a layer with a fixed resistance
+        - density (np.ndarray): the density of each layer (kg/m3)
+        - specific_heat (np.ndarray): the specific heat of each layer (J/kgK)
+        - resistance (np.ndarray): the fixed resistance of an air gap or gas
+            layer (m2K/W), or nan
+        - gaps (np.ndarray): True for the air gap and gas layers
+        - offsets (np.ndarray): a (n_constructions+1,) array of the index of
+            the first layer of each construction, and the total number of
+            layers
+        - ids (list): the id of each construction
+        - _ids (list): the node _id of each construction
+        - graphs (np.ndarray): the index of the BimGraph of each construction
+        - internal (np.ndarray): True for the internal constructions, which 
+            have r_si on both sides
+        - r_si, r_se (float): the inside and outside surface resistances 
+            (m2K/W)
+        - r_air_gap (float): the resistance of an air gap or gas layer with
+            no thermal_resistance (m2K/W)
+        - max_depth (float): the greatest depth included in kappa (m)
+        - insulation_conductivity (float): layers with a lower conductivity
+            (W/mK) are insulation, which ends the kappa depth
+
+    """
+
+    def __init__(self,thickness=None,conductivity=None,density=None,
+                 specific_heat=None,resistance=None,gaps=None,offsets=None,
+                 ids=None,_ids=None,graphs=None,internal=None):
+        def a(x):
+            return np.zeros(0) if x is None else np.asarray(x,dtype=float)
+        self.thickness=a(thickness)
+        n=len(self.thickness)
+        self.conductivity=np.full(n,np.nan) if conductivity is None else a(conductivity)
+        self.density=np.zeros(n) if density is None else a(density)
+        self.specific_heat=np.zeros(n) if specific_heat is None else a(specific_heat)
+        self.resistance=np.full(n,np.nan) if resistance is None else a(resistance)
+        self.gaps=np.zeros(n,dtype=bool) if gaps is None else np.asarray(gaps,dtype=bool)
+        self.offsets=np.zeros(1,dtype=np.int64) if offsets is None else np.asarray(offsets,dtype=np.int64)
+        m=len(self.offsets)-1
+        self.ids=list(range(m)) if ids is None else list(ids)
+        self._ids=[None]*m if _ids is None else list(_ids)
+        self.graphs=np.zeros(m,dtype=np.int64) if graphs is None else np.asarray(graphs,dtype=np.int64)
+        self.internal=np.zeros(m,dtype=bool) if internal is None else np.asarray(internal,dtype=bool)
+        self.r_si=0.13
+        self.r_se=0.04
+        self.r_air_gap=0.18
+        self.max_depth=0.1
+        self.insulation_conductivity=0.08
+
+
+    def __len__(self):
+        return len(self.offsets)-1
+
+
+    def __repr__(self):
+        return 'ConstructionArray(constructions={}, layers={})'.format(len(self),
+                                                                       len(self.thickness))
+
+
+    @classmethod
+    def from_bim(cls,bims):
+        """Returns a ConstructionArray of the Construction nodes of BimGraphs
+
+        Arguments:
+            - bims (BimGraph or list): one or many BimGraphs
+
+        The layers are read from BimGraph.relations(). The layer thickness is
+            the Layer 'thickness', or the material 'Thickness'. Glazing
+            layers have a default conductivity of 0.9 W/mK, as in
+            BimToIdfMap, and no heat capacity.
+
+        A construction is internal if all the surfaces and openings which 
+            use it are between two spaces (BimRelations.surface_types).
+
+        """
+        if not isinstance(bims,(list,tuple)):
+            bims=[bims]
+        columns={k:[] for k in ('thickness','conductivity','density',
+                                'specific_heat','resistance')}
+        gaps=[]
+        counts=[]
+        ids=[]
+        _ids=[]
+        graphs=[]
+        internal=[]
+        for i,bim in enumerate(bims):
+            nodes=bim._nodes
+            relations=bim.relations()
+            surface_types={}  # {construction _id:set of surface types}
+            for _id,construction in relations.constructions.items():
+                surface=relations.surfaces.get(_id,_id)  # the surface of an opening
+                surface_types.setdefault(construction,set()).add(relations.surface_types.get(surface))
+            for _id,(labels,properties,_,_) in nodes.items():
+                if not 'Construction' in labels: continue
+                layers=relations.layers.get(_id,[])
+                for layer in layers:
+                    p=nodes[layer][1]
+                    material=relations.materials.get(layer)
+                    labels1,p1=nodes[material][:2] if material is not None else ([],{})
+                    thickness=p.get('thickness')
+                    columns['thickness'].append(p1.get('Thickness') if thickness is None else thickness)
+                    gap='MaterialAirGap' in labels1 or 'WindowMaterialGas' in labels1
+                    gaps.append(gap)
+                    if gap:
+                        columns['conductivity'].append(None)
+                        columns['density'].append(None)
+                        columns['specific_heat'].append(None)
+                        columns['resistance'].append(p1.get('thermal_resistance'))
+                    else:
+                        conductivity=p1.get('conductivity')
+                        if conductivity is None and 'WindowMaterialGlazing' in labels1:
+                            conductivity=0.9
+                        columns['conductivity'].append(conductivity)
+                        columns['density'].append(p1.get('density'))
+                        columns['specific_heat'].append(p1.get('specific_heat'))
+                        columns['resistance'].append(None)
+                counts.append(len(layers))
+                ids.append(properties.get('id'))
+                _ids.append(_id)
+                graphs.append(i)
+                internal.append(surface_types.get(_id)=={'internal'})
+        offsets=np.zeros(len(counts)+1,dtype=np.int64)
+        np.cumsum(counts,out=offsets[1:])
+        d={k:pd.to_numeric(pd.Series(v,dtype=object),errors='coerce').to_numpy(dtype=float)
+           for k,v in columns.items()}
+        return cls(gaps=gaps,offsets=offsets,ids=ids,_ids=_ids,graphs=graphs,
+                   internal=internal,**d)
+
+
+    def _construction_index(self):
+        "Returns the index of the construction of each layer"
+        return np.repeat(np.arange(len(self)),np.diff(self.offsets))
+
+
+    def _sum_constructions(self,a):
+        "Returns the sum of a per layer array for each construction"
+        return np.bincount(self._construction_index(),weights=a,minlength=len(self))
+
+
+    def layer_heat_capacities(self):
+        "Returns the areal heat capacity of each layer (J/m2K)"
+        return np.nan_to_num(self.density*self.specific_heat*self.thickness)
+
+
+    def layer_resistances(self):
+        "Returns the thermal resistance of each layer (m2K/W)"
+        with np.errstate(divide='ignore',invalid='ignore'):
+            r=self.thickness/self.conductivity
+        gap=self.gaps
+        r[gap]=np.where(np.isnan(self.resistance[gap]),self.r_air_gap,self.resistance[gap])
+        return np.nan_to_num(r,nan=0.0,posinf=0.0)
+
+
+    def r_values(self):
+        "Returns the R-value of each construction, including the surface resistances (m2K/W)"
+        r_surfaces=self.r_si+np.where(self.internal,self.r_si,self.r_se)
+        return r_surfaces+self._sum_constructions(self.layer_resistances())
+
+
+    def u_values(self):
+        "Returns the U-value of each construction (W/m2K)"
+        return 1.0/self.r_values()
+
+
+    def heat_capacities(self):
+        "Returns the total areal heat capacity of each construction (J/m2K)"
+        return self._sum_constructions(self.layer_heat_capacities())
+
+
+    def kappas(self):
+        "Returns the kappa value of each construction (kJ/m2K)"
+        index=self._construction_index()
+        thickness=np.nan_to_num(self.thickness)
+        total=self._sum_constructions(thickness)
+        # depth of the inner face of each layer from the inside surface
+        outer_cumulative=np.cumsum(thickness)-np.repeat(np.cumsum(total)-total,
+                                                         np.diff(self.offsets))
+        inner_depth=total[index]-outer_cumulative
+        # the kappa depth of each construction
+        insulation_depth=np.full(len(self),np.inf)
+        insulation=self.conductivity<self.insulation_conductivity
+        np.minimum.at(insulation_depth,index[insulation],inner_depth[insulation])
+        depth=np.minimum(np.minimum(self.max_depth,total/2.0),insulation_depth)
+        effective=np.clip(depth[index]-inner_depth,0.0,thickness)
+        a=np.nan_to_num(self.density*self.specific_heat*effective)
+        return self._sum_constructions(a)/1000.0
+
+
+    def time_constants(self):
+        "Returns the time constant of each construction, the heat capacity divided by the U-value (hours)"
+        return self.heat_capacities()*self.r_values()/3600.0
+
+
+    def to_dataframe(self):
+        "Returns a DataFrame of the results with one row per construction"
+        return pd.DataFrame({'graph':self.graphs,
+                             '_id':self._ids,
+                             'id':self.ids,
+                             'layers':np.diff(self.offsets),
+                             'internal':self.internal,
+                             'thickness':self._sum_constructions(np.nan_to_num(self.thickness)),
+                             'r_value':self.r_values(),
+                             'u_value':self.u_values(),
+                             'heat_capacity':self.heat_capacities(),
+                             'kappa':self.kappas(),
+                             'time_constant':self.time_constants()})
+
+
+    def set_properties(self,bims):
+        """Places the results on the Construction nodes
+
+        Sets the 'r_value', 'calculated_u_value', 'heat_capacity', 'kappa'
+            and 'time_constant' properties. The calculated U-value is not
+            called 'u_value' so it is not confused with the 'uvalue' 
+            property read from a gbXML file.
+
+        The properties are set by attribute assignment, so for a 
+            BimGraphView the Construction node is copied into the view and
+            the base graph is not changed.
+
+        Arguments:
+            - bims (BimGraph or list): the BimGraphs passed to from_bim
+
+        """
+        if not isinstance(bims,(list,tuple)):
+            bims=[bims]
+        df=self.to_dataframe()
+        keys={'r_value':'r_value',
+              'u_value':'calculated_u_value',
+              'heat_capacity':'heat_capacity',
+              'kappa':'kappa',
+              'time_constant':'time_constant'}
+        for i,_id,*values in zip(df['graph'],df['_id'],*[df[k].tolist() for k in keys]):
+            node=bims[i]._Node(_id)
+            for key,value in zip(keys.values(),values):
+                setattr(node,key,value)
+
+
+
+# tests
+
+if __name__=='__main__':
+    import time
+    from gbxml_graph import GbxmlGraph
+    from gbxml_to_bim_map import GbxmlToBimMap
+
+    print('TEST-ConstructionArray')
+
+    gbxml=GbxmlGraph()
+    gbxml.read_xml(r'../01_D-original_gbXML/detached_house.gbxml')
+    o=GbxmlToBimMap()
+    o.input_gbxml=gbxml
+    o.run()
+    bim=o.output_bim
+
+    t=time.time()
+    c=ConstructionArray.from_bim([bim]*1000)
+    print('from_bim',time.time()-t,c)
+    t=time.time()
+    df=c.to_dataframe()
+    print('calculate',time.time()-t)
+    df1=df[df.graph==0].set_index('id')
+    df1['uvalue']=[bim._nodes[x][1].get('uvalue') for x in df1._id]
+    print(df1[['layers','internal','thickness','u_value','uvalue','kappa','time_constant']])
+    c=ConstructionArray.from_bim(bim)
+    c.set_properties(bim)
+    print(bim.Construction[0].properties)
+
+    # each BimGraphView keeps its own values
+    from bim_graph import BimGraphView
+    views=[BimGraphView(bim) for factor in (0.5,1.0,2.0)]
+    for factor,view in zip((0.5,1.0,2.0),views):
+        material=view.Construction[0].ordered_materials()[0]
+        material.conductivity=material.conductivity*factor
+    c=ConstructionArray.from_bim(views)
+    c.set_properties(views)
+    u=[sum(x.calculated_u_value for x in view.Construction) for view in views]
+    print(u)
+    assert np.allclose(u,c.to_dataframe().groupby('graph')['u_value'].sum())
+    assert len(set(u))==3
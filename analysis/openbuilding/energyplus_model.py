@@ -1,8 +1,8 @@
 # -*- coding: utf-8 -*-
 
-import subprocess
 import os
 import copy
+import contextlib
 import shutil
 import datetime
 
@@ -20,14 +20,49 @@ try:
     from .eso_to_bim_map import EsoToBimMap
 except ImportError:
     from eso_to_bim_map import EsoToBimMap
+
+try:
+    from .variable_registry import variable_registry
+except ImportError:
+    from variable_registry import variable_registry
+
+try:
+    from .bim_graph_validator import bim_graph_validator
+except ImportError:
+    from bim_graph_validator import bim_graph_validator
     
 try:
     from .gbxml_to_bim_map import GbxmlToBimMap
 except ImportError:
     from gbxml_to_bim_map import GbxmlToBimMap
 
+try:
+    from .profiling import profiler, graph_counters, file_size
+except ImportError:
+    from profiling import profiler, graph_counters, file_size
+
+try:
+    from .energyplus_runner import EnergyPlusRunner
+except ImportError:
+    from energyplus_runner import EnergyPlusRunner
+
 class EnergyPlusModel():
-    "A model object for running EnergyPlus simulations"
+    """A model object for running EnergyPlus simulations
+    
+    Each stage of a run (gbxml_to_bim, validate, bim_to_idf, copy_idf, 
+        write_idf, energyplus, read_eso, eso_to_bim) is 
+        timed by self.profiler, with the node and edge counts of the graphs 
+        and the bytes read and written. The default profiler keeps the 
+        latest 10000 records. Set self.profiler to None to switch this off.
+    
+    ExpandObjects and EnergyPlus are run by self.energyplus_runner, each in
+        the simulation folder as its working directory, so models can be run
+        from several threads at once. The output lines of the processes are
+        passed to self.on_energyplus_event, i.e. an EnergyPlusProgress. To 
+        run many idf files at once use EnergyPlusRunner.run_many. A run 
+        which takes longer than self.timeout seconds is stopped.
+    
+    """
     
     def __init__(self):
         self.input_idf=None  # an IdfGraph object
@@ -36,9 +71,27 @@ class EnergyPlusModel():
         self.input_gbxml=None
         self.simulation_folder=''
         self.output_err=None
+        self.output_status=None  # the status of the last EnergyPlus run
+        self.output_result=None  # the result dict of the last EnergyPlus run
         self.output_rdd=None
         self.output_eso=None  # an EsoGraph object
         self.output_bim=None
+        self.bim_to_idf_map=None  # an optional BimToIdfMap to update
+        self.variable_registry=variable_registry  # the eso variables to read
+        self.output_skipped=None  # a list of the eso variables not mapped
+        self.validator=bim_graph_validator  # checks self.bim before running
+        self.output_validation=None  # the validation report DataFrame
+        self.profiler=profiler  # records the time of each stage
+        self.energyplus_runner=EnergyPlusRunner()  # runs the EnergyPlus processes
+        self.on_energyplus_event=None  # called with the EnergyPlusRunner events
+        self.timeout=None  # the most seconds an EnergyPlus run can take
+    
+    
+    def _stage(self,name,**counters):
+        "Returns a self.profiler stage context manager, which yields the stage record"
+        if self.profiler is None:
+            return contextlib.nullcontext(dict(counters))
+        return self.profiler.stage(name,**counters)
     
     
     def run_gbxml(self,
@@ -58,14 +111,18 @@ class EnergyPlusModel():
             
         """
         
-        #CONVERT GBXML TO BIM
-        o=GbxmlToBimMap()
-        o.input_gbxml=self.input_gbxml
-        o.run()
-        self.bim=o.output_bim
+        with self._stage('run_gbxml',**graph_counters(self.input_gbxml)):
         
-        #RUN ENERGYPLUS
-        self.run_bim(output_variables=output_variables)
+            #CONVERT GBXML TO BIM
+            with self._stage('gbxml_to_bim') as record:
+                o=GbxmlToBimMap()
+                o.input_gbxml=self.input_gbxml
+                o.run()
+                self.bim=o.output_bim
+                record.update(graph_counters(self.bim))
+            
+            #RUN ENERGYPLUS
+            self.run_bim(output_variables=output_variables)
         
         return
     
@@ -84,31 +141,71 @@ class EnergyPlusModel():
             - self.output_rdd
             - self.output_eso
             - self.output_bim        
+            - self.output_skipped
+            - self.output_validation
+            
+        Raises a ValueError if self.validator finds errors in self.bim, 
+            before any simulation time is spent.
             
         """
+        with self._stage('run_bim',**graph_counters(self.bim)):
+            self._run_bim(output_variables)
+            
+    
+    def _run_bim(self,output_variables):
+        "The stages of run_bim"
+        
+        #VALIDATE
+        if self.validator is not None:
+            with self._stage('validate') as record:
+                report=self.validator.validate(self.bim)
+                self.output_validation=report
+                errors=report[report.level=='error']
+                record['errors']=len(errors)
+            if len(errors):
+                raise ValueError('The BimGraph has {} schema errors, '.format(len(errors))
+                                 +'see self.output_validation. First error: '
+                                 +'{} {} {}'.format(*errors.iloc[0][['label','id','message']]))
         
         #CONVERT BIM TO IDF
-        o=BimToIdfMap()
-        o.input_bim=self.bim
-        o.run()
-        self.input_idf=o.output_idf
+        # if self.bim_to_idf_map has already been run, i.e. for another 
+        #  variant of the same building, only the changes are mapped
+        o=self.bim_to_idf_map
+        with self._stage('bim_to_idf') as record:
+            if o is None or o.output_idf is None:
+                o=o or BimToIdfMap()
+                o.input_bim=self.bim
+                o.run()
+                record['update']=False
+            else:
+                o.update(self.bim)
+                record['update']=True
+            self.input_idf=o.output_idf
+            record.update(graph_counters(self.input_idf))
         
         #RUN ENERGYPLUS
         result=self.run_idf(output_variables=output_variables)
         if not result: return
         
         #READ ESO FILE
-        eso=EsoGraph()
         folder=os.path.abspath(self.simulation_folder)
         fp=os.path.join(folder,'eplusout.eso')
-        eso.read_eso(fp)
+        with self._stage('read_eso',bytes_read=file_size(fp)) as record:
+            eso=EsoGraph(registry=self.variable_registry)
+            eso.read_eso(fp)
+            record.update(graph_counters(eso),skipped=len(eso.skipped))
         
         #MAP ESO TO BIM
-        o1=EsoToBimMap()
-        o1.bim=self.bim
-        o1.input_eso=eso
-        o1.run()
+        with self._stage('eso_to_bim') as record:
+            o1=EsoToBimMap()
+            o1.bim=self.bim
+            o1.input_eso=eso
+            o1.registry=self.variable_registry
+            o1.run()
+            record.update(graph_counters(o1.bim),skipped=len(o1.skipped))
+        self.output_eso=eso
         self.output_bim=o1.bim
+        self.output_skipped=eso.skipped+o1.skipped
     
     
     def run_idf(self,
@@ -122,21 +219,27 @@ class EnergyPlusModel():
             
         Sets:
             - self.output_err
+            - self.output_status
             - self.output_rdd
         
-        """
-        idf=copy.deepcopy(self.input_idf)
+        Returns False if the simulation did not complete, i.e. EnergyPlus
+            terminated or self.timeout was reached.
         
-        #ADD OUTPUT VARIABLES
-        if not output_variables:
-            output_variables=\
-                ['Site Outdoor Air Drybulb Temperature',
-                 'Zone Mean Air Temperature']
-        for variable_name in output_variables:
-            idf.add_output_variable(variable_name=variable_name)
+        """
+        with self._stage('copy_idf') as record:
+            idf=copy.deepcopy(self.input_idf)
+        
+            #ADD OUTPUT VARIABLES
+            if not output_variables:
+                output_variables=\
+                    ['Site Outdoor Air Drybulb Temperature',
+                     'Zone Mean Air Temperature']
+            for variable_name in output_variables:
+                idf.add_output_variable(variable_name=variable_name)
+            record.update(graph_counters(idf))
         
         #SET ENERGYPLUS EXE FILEPATH
-        epexe_fp=r'C:\EnergyPlusV8-9-0\EnergyPlus'
+        epexe_fp=self.energyplus_runner.energyplus_exe
         
         #CREATE THE SIMULATION FOLDER IF IT DOESN'T EXIST
         folder=os.path.abspath(self.simulation_folder)
@@ -150,7 +253,9 @@ class EnergyPlusModel():
         #SAVE THE IDF FILE IN SIMULATION_FOLDER
         file='in.idf'
         idf_fp=os.path.join(folder,file)
-        idf.write_idf(idf_fp)
+        with self._stage('write_idf') as record:
+            idf.write_idf(idf_fp)
+            record['bytes_written']=file_size(idf_fp)
         
         #SET ENERGYPLUS WEATHER FILE NAME 
         epw_fp=self.input_epw
@@ -162,15 +267,10 @@ class EnergyPlusModel():
                             out_fp=folder,
                             )
         
-        #READ ERR FILE
-        fp=os.path.join(folder,'eplusout.err')
-        if os.path.isfile(fp):
-            with open(fp,'r') as f:
-                self.output_err=f.read()
-        
-        #RETURNS FALSE IF PROCESS TERMINATED
-        if 'Terminated' in self.output_err:
-            print(self.output_err)
+        #RETURNS FALSE IF THE SIMULATION DID NOT COMPLETE
+        if self.output_status!='completed':
+            print('EnergyPlus {}: {}'.format(self.output_status,folder))
+            if self.output_err: print(self.output_err)
             return False
         
         #READ RDD FILE
@@ -196,47 +296,35 @@ class EnergyPlusModel():
             - idf_fp (str): the filepath of the idf file - including the extension
             - epw_fp (str): the filepath of the epw file - including the extension
         
-        """
-        #print(epexe_fp,out_fp,idf_fp,epw_fp)
-        
-        
-        #CREATES THE 'OUT' FOLDER IF IT DOESN'T EXIST
-        if not os.path.isdir(out_fp):
-            os.mkdir(out_fp)
-        
-        #COPY IDF TO 'IN.IDF' FILE IN THE OUT FOLDER
-        try:
-            shutil.copyfile(idf_fp,
-                            os.path.join(out_fp,'in.idf'))
-        except shutil.SameFileError:
-            pass
-        
-        #RUN EXPAND OBJECTS
-        cwd=os.getcwd()
-        os.chdir(out_fp)
-        os.system(r'C:\EnergyPlusV8-9-0\ExpandObjects')
-        os.chdir(cwd)
-        idf_fp_new=os.path.join(out_fp,'expanded.idf')
-        
-        #RUN ENERGYPLUS VIA OS.SYSTEM
-        l=[epexe_fp,
-           '-r',
-           '-c',
-           '-d','"'+out_fp+'"',
-           '-w','"'+epw_fp+'"',
-           '"'+idf_fp_new+'"']
-        
-        st=' '.join(l)
-        
-        print(st)
-        
-        os.system(st)
+        Sets:
+            - self.output_result: the result dict of EnergyPlusRunner.run
+            - self.output_status: 'completed', 'terminated', 'failed', 
+                'timeout' or 'error'
+            - self.output_err: the eplusout.err text, or None
         
-        #READ ERR FILE
-        fp=os.path.join(out_fp,'eplusout.err')
-        if os.path.isfile(fp):
-            with open(fp,'r') as f:
-                self.output_err=f.read()
+        """
+        #RUN EXPAND OBJECTS AND ENERGYPLUS
+        # the idf is copied to 'in.idf' in out_fp and any old 'expanded.idf' 
+        #  and 'eplusout.err' files are removed before running
+        runner=self.energyplus_runner
+        with self._stage('energyplus',bytes_read=file_size(idf_fp)) as record:
+            result=runner.run_sync(
+                runner.run(idf_fp,
+                           epw_fp,
+                           out_fp,
+                           on_event=self.on_energyplus_event,
+                           timeout=self.timeout,
+                           energyplus_exe=epexe_fp))
+            out_fp=result['out_fp']
+            record.update(status=result['status'],
+                          returncode=result['returncode'])
+            record['bytes_written']=sum(file_size(os.path.join(out_fp,x)) or 0
+                                        for x in os.listdir(out_fp)
+                                        if x.startswith('eplusout'))
+        
+        self.output_result=result
+        self.output_status=result['status']
+        self.output_err=result['err']
         
         return
     
@@ -0,0 +1,391 @@
+# -*- coding: utf-8 -*-
+
+"""This module runs ExpandObjects and EnergyPlus processes with asyncio
+
+Each process is started with asyncio.create_subprocess_exec in its own
+    working directory, so no os.chdir is needed and many simulations can run
+    at once from one controller process. The output of the processes is
+    read line by line and passed to an on_event callback as event dicts, so
+    the progress of each simulation can be followed while it runs.
+
+Events are dicts with the keys 'job', 'event' and 'time' and:
+    - 'start': 'program', 'args'
+    - 'output': 'program', 'line'
+    - 'progress': 'program', 'line', 'environment', 'date' ('MM/DD'),
+        'progress' (the fraction of the year simulated, 0 to 1)
+    - 'end': 'program', 'returncode', 'wall'
+    - 'cancelled': 'program'
+    - 'timeout', 'error' ('message') and 'finished' ('status') of a job
+
+Example:
+    runner=EnergyPlusRunner(max_processes=8)
+    jobs=[{'job':name,'idf_fp':idf_fp,'epw_fp':epw_fp,'out_fp':folder}
+          for name,idf_fp,folder in ...]
+    results=runner.run_sync(runner.run_many(jobs,
+                                            on_event=EnergyPlusProgress(),
+                                            timeout=3600))
+
+"""
+
+import asyncio
+import concurrent.futures
+import datetime
+import os
+import re
+import shutil
+import time
+
+
+energyplus_exe=r'C:\EnergyPlusV8-9-0\EnergyPlus'
+expand_objects_exe=r'C:\EnergyPlusV8-9-0\ExpandObjects'
+
+# i.e. 'Starting Simulation at 01/01 for RUN PERIOD 1' or
+#      'Continuing Simulation at 06/10/2001 for RUN PERIOD 1'
+_progress_pattern=re.compile(r'(?:Starting|Continuing) Simulation at '
+                             r'(\d{1,2})/(\d{1,2})(?:/\d{4})? for (.*)')
+
+
+def parse_progress(line):
+    """Returns (environment, 'MM/DD', fraction of the year) of an EnergyPlus
+    progress line, or None
+    """
+    m=_progress_pattern.search(line)
+    if m is None:
+        return None
+    month,day,environment=int(m.group(1)),int(m.group(2)),m.group(3).strip()
+    try:
+        dayofyear=datetime.date(2001,month,day).timetuple().tm_yday
+    except ValueError:
+        return None
+    return environment,'%02d/%02d' % (month,day),(dayofyear-1)/365.0
+
+
+class EnergyPlusRunner():
+    """Runs EnergyPlus simulations as asyncio subprocesses
+
+    Attributes:
+        - energyplus_exe (str): the filepath of the EnergyPlus program
+        - expand_objects_exe (str): the filepath of the ExpandObjects program
+        - max_processes (int): the most simulations run at once by run_many
+        - energyplus_args (list): the options passed to EnergyPlus before
+            '-d', '-w' and the idf filepath
+
+    A timed out or cancelled job has its process killed.
+
+    """
+
+    def __init__(self,
+                 energyplus_exe=energyplus_exe,
+                 expand_objects_exe=expand_objects_exe,
+                 max_processes=None):
+        self.energyplus_exe=energyplus_exe
+        self.expand_objects_exe=expand_objects_exe
+        self.max_processes=max_processes or os.cpu_count() or 1
+        self.energyplus_args=['-r','-c']
+
+
+    @staticmethod
+    def _emit(on_event,job,event,**kwargs):
+        "Calls on_event with an event dict"
+        if on_event is None: return
+        d={'job':job,'event':event,'time':time.time()}
+        d.update(kwargs)
+        on_event(d)
+
+
+    @staticmethod
+    def _kill(process):
+        "Kills a process if it is still running"
+        if process.returncode is None:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+
+
+    async def run_process(self,args,cwd,job=None,on_event=None):
+        """Runs a process and returns its return code
+
+        Arguments:
+            - args (list): the program filepath and its arguments
+            - cwd (str): the working directory of the process
+            - job: the job name passed in the events
+            - on_event (function): called with each event dict
+
+        The stdout and stderr of the process are read line by line and
+            passed to on_event as 'output' events, or 'progress' events for
+            the EnergyPlus progress lines. If this coroutine is cancelled
+            the process is killed.
+
+        """
+        program=os.path.basename(args[0])
+        t=time.perf_counter()
+        process=await asyncio.create_subprocess_exec(*args,
+                                                     cwd=cwd,
+                                                     stdin=asyncio.subprocess.DEVNULL,
+                                                     stdout=asyncio.subprocess.PIPE,
+                                                     stderr=asyncio.subprocess.STDOUT)
+        self._emit(on_event,job,'start',program=program,args=list(args))
+        try:
+            while True:
+                line=await process.stdout.readline()
+                if not line: break
+                line=line.decode(errors='replace').rstrip()
+                progress=parse_progress(line)
+                if progress is None:
+                    self._emit(on_event,job,'output',program=program,line=line)
+                else:
+                    self._emit(on_event,job,'progress',program=program,line=line,
+                               environment=progress[0],date=progress[1],
+                               progress=progress[2])
+            returncode=await process.wait()
+        except asyncio.CancelledError:
+            self._kill(process)
+            await asyncio.shield(process.wait())
+            self._emit(on_event,job,'cancelled',program=program)
+            raise
+        self._emit(on_event,job,'end',program=program,returncode=returncode,
+                   wall=time.perf_counter()-t)
+        return returncode
+
+
+    async def expand_objects(self,out_fp,job=None,on_event=None):
+        """Runs ExpandObjects on the 'in.idf' file of out_fp
+
+        Returns the return code. ExpandObjects writes 'expanded.idf' if the
+            idf has HVACTemplate objects.
+
+        """
+        return await self.run_process([self.expand_objects_exe],
+                                      cwd=out_fp,
+                                      job=job,
+                                      on_event=on_event)
+
+
+    async def energyplus(self,idf_fp,epw_fp,out_fp,job=None,on_event=None,
+                         energyplus_exe=None):
+        """Runs EnergyPlus with its output in out_fp, returns the return code
+
+        energyplus_exe is the EnergyPlus filepath, the default is
+            self.energyplus_exe.
+
+        """
+        args=([energyplus_exe or self.energyplus_exe]
+              +list(self.energyplus_args)
+              +['-d',out_fp,'-w',epw_fp,idf_fp])
+        return await self.run_process(args,
+                                      cwd=out_fp,
+                                      job=job,
+                                      on_event=on_event)
+
+
+    async def _run(self,idf_fp,epw_fp,out_fp,job,on_event,energyplus_exe):
+        "The steps of run, returns the EnergyPlus return code"
+        in_fp=os.path.join(out_fp,'in.idf')
+        try:
+            shutil.copyfile(idf_fp,in_fp)
+        except shutil.SameFileError:
+            pass
+        expanded_fp=os.path.join(out_fp,'expanded.idf')
+        if os.path.isfile(expanded_fp):
+            os.remove(expanded_fp)  # so an old version is not used
+        await self.expand_objects(out_fp,job=job,on_event=on_event)
+        if not os.path.isfile(expanded_fp):
+            expanded_fp=in_fp  # no HVACTemplate objects to expand
+        return await self.energyplus(expanded_fp,epw_fp,out_fp,job=job,
+                                     on_event=on_event,
+                                     energyplus_exe=energyplus_exe)
+
+
+    async def run(self,idf_fp,epw_fp,out_fp,job=None,on_event=None,timeout=None,
+                  energyplus_exe=None):
+        """Runs ExpandObjects and EnergyPlus for an idf file
+
+        Arguments:
+            - idf_fp (str): the idf filepath, copied to 'in.idf' in out_fp
+            - epw_fp (str): the weather filepath
+            - out_fp (str): the output folder, created if it does not exist
+            - job: the job name passed in the events, the default is out_fp
+            - on_event (function): called with each event dict
+            - timeout (float): the most seconds the job can take
+            - energyplus_exe (str): the EnergyPlus filepath, the default is
+                self.energyplus_exe
+
+        Returns a dict with the keys 'job', 'out_fp', 'status', 'returncode',
+            'err' (the eplusout.err text or None) and 'wall'. The status is
+            'completed', 'terminated' (EnergyPlus stopped with a fatal
+            error), 'failed', 'timeout' or 'error' (the job could not be
+            run, i.e. the program was not found).
+
+        """
+        job=out_fp if job is None else job
+        out_fp=os.path.abspath(out_fp)
+        os.makedirs(out_fp,exist_ok=True)
+        err_fp=os.path.join(out_fp,'eplusout.err')
+        if os.path.isfile(err_fp):
+            os.remove(err_fp)
+        result={'job':job,'out_fp':out_fp,'status':None,'returncode':None,
+                'err':None,'wall':None}
+        t=time.perf_counter()
+        try:
+            result['returncode']=await asyncio.wait_for(
+                self._run(os.path.abspath(idf_fp),os.path.abspath(epw_fp),
+                          out_fp,job,on_event,energyplus_exe),
+                timeout)
+        except asyncio.TimeoutError:
+            result['status']='timeout'
+            self._emit(on_event,job,'timeout',timeout=timeout)
+        except OSError as err:
+            result['status']='error'
+            self._emit(on_event,job,'error',message=str(err))
+        result['wall']=time.perf_counter()-t
+        if os.path.isfile(err_fp):
+            with open(err_fp,'r',errors='replace') as f:
+                result['err']=f.read()
+        if result['status'] is None:
+            err=result['err'] or ''
+            if 'Terminated' in err:
+                result['status']='terminated'
+            elif 'Completed Successfully' in err:
+                result['status']='completed'
+            else:
+                result['status']='failed'
+        self._emit(on_event,job,'finished',status=result['status'])
+        return result
+
+
+    async def run_many(self,jobs,on_event=None,timeout=None):
+        """Runs many jobs at once, at most self.max_processes at a time
+
+        Arguments:
+            - jobs (list): dicts of the arguments of run, i.e.
+                {'job':name,'idf_fp':...,'epw_fp':...,'out_fp':...}
+            - on_event (function): called with the events of all jobs
+            - timeout (float): the default timeout of each job
+
+        Returns a list of the result dicts of run, in the order of jobs. If
+            run_many is cancelled, all running processes are killed.
+
+        """
+        semaphore=asyncio.Semaphore(self.max_processes)
+        async def run1(kwargs):
+            kwargs=dict(kwargs)
+            kwargs.setdefault('on_event',on_event)
+            kwargs.setdefault('timeout',timeout)
+            async with semaphore:
+                return await self.run(**kwargs)
+        return await asyncio.gather(*[run1(kwargs) for kwargs in jobs])
+
+
+    @staticmethod
+    def run_sync(coroutine):
+        """Runs a coroutine to completion and returns its result
+
+        If an event loop is already running in this thread (i.e. in a
+            Jupyter notebook), the coroutine is run in a new event loop in
+            another thread.
+
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(coroutine)
+        with concurrent.futures.ThreadPoolExecutor(1) as executor:
+            return executor.submit(asyncio.run,coroutine).result()
+
+
+class EnergyPlusProgress():
+    """An on_event callback which keeps the latest state of each job
+
+    Attributes:
+        - jobs (dict): {job:{'status':...,'progress':...,'date':...,
+            'environment':...}}
+        - verbose (bool): if True, a line is printed when a job starts a new
+            environment, passes each 10% of its run period, or finishes
+
+    """
+
+    def __init__(self,verbose=True):
+        self.jobs={}
+        self.verbose=verbose
+
+
+    def __call__(self,event):
+        d=self.jobs.setdefault(event['job'],{'status':'waiting','progress':0.0,
+                                             'date':None,'environment':None})
+        kind=event['event']
+        message=None
+        if kind=='start':
+            d['status']='running'
+        elif kind=='progress':
+            new_step=int(event['progress']*10)>int(d['progress']*10)
+            new_environment=event['environment']!=d['environment']
+            d.update(progress=event['progress'],date=event['date'],
+                     environment=event['environment'])
+            if new_step or new_environment:
+                message='{:.0%} {} {}'.format(d['progress'],d['environment'],d['date'])
+        elif kind=='finished':
+            d['status']=event['status']
+            if event['status']=='completed':
+                d['progress']=1.0
+            message=event['status']
+        elif kind in ('timeout','cancelled','error'):
+            d['status']=kind
+        if self.verbose and message is not None:
+            print('{}: {}'.format(event['job'],message))
+
+
+    def summary(self):
+        "Returns a dict of the number of jobs with each status"
+        d={}
+        for x in self.jobs.values():
+            d[x['status']]=d.get(x['status'],0)+1
+        return d
+
+
+    def to_dataframe(self):
+        "Returns a DataFrame with a row for each job"
+        import pandas as pd
+        return pd.DataFrame.from_dict(self.jobs,orient='index')
+
+
+
+# tests
+
+if __name__=='__main__':
+    import sys
+    import tempfile
+
+    print('TEST-EnergyPlusRunner')
+
+    # a stand in for EnergyPlus which prints progress lines
+    folder=tempfile.mkdtemp()
+    fake_fp=os.path.join(folder,'fake_energyplus.py')
+    with open(fake_fp,'w') as f:
+        f.write('import sys, time, os\n'
+                'for m in range(1,13):\n'
+                '    print("Continuing Simulation at %02d/01 for RUN PERIOD 1" % m, flush=True)\n'
+                '    time.sleep(float(os.environ.get("FAKE_SLEEP","0.01")))\n'
+                'open("eplusout.err","w").write("EnergyPlus Completed Successfully")\n')
+    idf_fp=os.path.join(folder,'test.idf')
+    open(idf_fp,'w').write('Version,8.9;\n')
+
+    class FakeRunner(EnergyPlusRunner):
+        async def expand_objects(self,out_fp,job=None,on_event=None):
+            return 0
+        async def energyplus(self,idf_fp,epw_fp,out_fp,job=None,on_event=None,
+                             energyplus_exe=None):
+            return await self.run_process([sys.executable,fake_fp],cwd=out_fp,
+                                          job=job,on_event=on_event)
+
+    runner=FakeRunner(max_processes=4)
+    progress=EnergyPlusProgress(verbose=False)
+    jobs=[{'job':'job%d' % i,'idf_fp':idf_fp,'epw_fp':idf_fp,
+           'out_fp':os.path.join(folder,'sim%d' % i)} for i in range(8)]
+    t=time.time()
+    results=runner.run_sync(runner.run_many(jobs,on_event=progress))
+    print('run_many',time.time()-t,progress.summary())
+    os.environ['FAKE_SLEEP']='1'
+    result=runner.run_sync(runner.run(idf_fp,idf_fp,os.path.join(folder,'sim_timeout'),
+                                      on_event=progress,timeout=0.5))
+    print(result['status'],progress.summary())
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+
+import copy
+import numpy as np
+import pandas as pd
+
+try:
+    from .uncertainty import NumpyRandomNormal, RandomChoice
+except ImportError:
+    from uncertainty import NumpyRandomNormal, RandomChoice
+
+try:
+    from .timeseries import TimeSeries
+except ImportError:
+    from timeseries import TimeSeries
+
+
+class Ensemble():
+    """A Monte Carlo ensemble of an uncertain BimGraph
+
+    The input BimGraph is scanned once for node properties which hold a
+        NumpyRandomNormal or RandomChoice object, or a TimeSeries with one
+        of these objects in its index or data. All n samples of every
+        uncertain value are then drawn in a single vectorised pass.
+
+    Each ensemble member is returned as a BimGraphView, which shares all
+        nodes and edges with the input BimGraph except the nodes holding
+        the sampled values. These can be passed to BimToIdfMap or
+        EnergyPlusModel as for any other BimGraph.
+
+    Example:
+        o=Ensemble()
+        o.input_bim=bim
+        o.run(n=1000,seed=1)
+        for bim1 in o.variants():
+            ...
+
+    """
+
+    def __init__(self):
+        self.input_bim=None
+        self.n=0
+        self.uncertain=[]  # a list of (_id,key,value) tuples
+        self.samples={}  # a dict of {(_id,key):samples}
+
+
+    @staticmethod
+    def _is_distribution(value):
+        "Returns True if value is one of the uncertainty classes"
+        return isinstance(value,(NumpyRandomNormal,RandomChoice))
+
+
+    def _column_name(self,_id,key):
+        "Returns the design matrix column name for a property"
+        id1=self.input_bim._nodes[_id][1].get('id',_id)
+        return '{}.{}'.format(id1,key)
+
+
+    def _sample_timeseries(self,ts,n,rng):
+        """Returns the samples for a TimeSeries
+
+        Returns a dict of {'index' or 'data':(positions,2D array)}, where
+            the 2D array has a row for each sample and a column for each
+            uncertain value in the series.
+
+        """
+        d={}
+        for part,values in (('index',ts.series.index),
+                            ('data',ts.series.values)):
+            positions=[i for i,v in enumerate(values)
+                       if self._is_distribution(v)]
+            if not positions: continue
+            a=np.empty((n,len(positions)),dtype=object)
+            for j,i in enumerate(positions):
+                a[:,j]=values[i].sample(n,rng=rng)
+            d[part]=(positions,a)
+        return d
+
+
+    def _variant_timeseries(self,ts,d,i):
+        "Returns a copy of ts with the values of sample i"
+        index=list(ts.series.index)
+        data=np.array(ts.series.values,dtype=object)
+        if 'index' in d:
+            positions,a=d['index']
+            for j,k in enumerate(positions):
+                index[k]=a[i,j]
+        if 'data' in d:
+            positions,a=d['data']
+            data[positions]=a[i]
+        ts1=copy.copy(ts)
+        ts1.series=pd.Series(data=list(data),index=index)
+        return ts1
+
+
+    @staticmethod
+    def _value(v):
+        "Returns a numpy scalar as the equivalent Python value"
+        if isinstance(v,np.generic):
+            return v.item()
+        return v
+
+
+    def design_matrix(self):
+        """Returns the sampled values as a DataFrame
+
+        There is a row for each ensemble member and a column for each
+            uncertain scalar property, named '<node id>.<property key>'.
+            Uncertain TimeSeries values are named
+            '<node id>.<property key>.<index or data>[<position>]'.
+
+        """
+        d={}
+        for (_id,key),samples in self.samples.items():
+            name=self._column_name(_id,key)
+            if isinstance(samples,dict):
+                for part,(positions,a) in samples.items():
+                    for j,k in enumerate(positions):
+                        d['{}.{}[{}]'.format(name,part,k)]=a[:,j]
+            else:
+                d[name]=samples
+        return pd.DataFrame(d)
+
+
+    def scan(self):
+        "Finds the uncertain node properties in self.input_bim"
+        l=[]
+        for _id,node_tuple in self.input_bim._nodes.items():
+            for key,value in node_tuple[1].items():
+                if self._is_distribution(value):
+                    l.append((_id,key,value))
+                elif isinstance(value,TimeSeries):
+                    values=list(value.series.index)+list(value.series.values)
+                    if any(self._is_distribution(v) for v in values):
+                        l.append((_id,key,value))
+        self.uncertain=l
+        return l
+
+
+    def run(self,n,seed=None):
+        """Draws n samples of all uncertain properties
+
+        Arguments:
+            - n (int): the number of ensemble members
+            - seed (int, SeedSequence or numpy.random.Generator): sets the
+                random generator used for all samples
+
+        """
+        rng=np.random.default_rng(seed)
+        self.n=n
+        self.scan()
+        self.samples={}
+        for _id,key,value in self.uncertain:
+            if isinstance(value,TimeSeries):
+                self.samples[(_id,key)]=self._sample_timeseries(value,n,rng)
+            else:
+                self.samples[(_id,key)]=value.sample(n,rng=rng)
+
+
+    def variant(self,i):
+        "Returns ensemble member i as a BimGraphView"
+        d={}
+        for _id,key,value in self.uncertain:
+            samples=self.samples[(_id,key)]
+            if isinstance(value,TimeSeries):
+                v=self._variant_timeseries(value,samples,i)
+            else:
+                v=self._value(samples[i])
+            d.setdefault(_id,{})[key]=v
+        return self.input_bim.view(d)
+
+
+    def variants(self):
+        "Yields each ensemble member in turn as a BimGraphView"
+        for i in range(self.n):
+            yield self.variant(i)
+
+
+
+# tests
+
+if __name__=='__main__':
+    import time
+    from bim_graph import BimGraph
+
+    print('TEST-Ensemble')
+
+    bim=BimGraph()
+    building=bim.add_node(labels='Building',
+                          properties={'id':'building',
+                                      'orientation':RandomChoice(list(range(0,360,5)))})
+    for i in range(10):
+        space=bim.add_node(labels='Space',
+                           properties={'id':'space_{}'.format(i),
+                                       'infiltration':NumpyRandomNormal(loc=0.5,scale=0.2,min1=0.1)})
+        bim.add_edge(building,space,'contains')
+
+    o=Ensemble()
+    o.input_bim=bim
+    t=time.time()
+    o.run(n=100000,seed=1)
+    print('run',time.time()-t)
+    print(o.design_matrix().head())
+    bim1=o.variant(0)
+    print(bim1.Building[0].orientation, bim.Building[0].orientation)
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 
 import json
+import re
+import numpy as np
 
 try:
     from .graph import Graph
@@ -13,39 +15,147 @@ except ImportError:
     from graph import Node
 
 
+_whitespace=re.compile(rb'\s*')
+_string=re.compile(rb'"(?:[^"\\]|\\.)*"')
+
+
+def _value_ends(b):
+    """Returns the indices after each '}' or ']' of a json text which closes 
+    a value at the top level or at depth 1 (i.e. the value of a class)
+    
+    The brackets are counted with NumPy, skipping over strings, so no Python
+        objects are created for the values.
+    
+    """
+    a=np.frombuffer(b,dtype=np.uint8)
+    quote=a==34  # '"'
+    backslashes=np.flatnonzero(a==92)
+    if len(backslashes):
+        escaped=[]
+        for j in backslashes.tolist():
+            if escaped and escaped[-1]==j: continue  # an escaped backslash
+            escaped.append(j+1)
+        escaped=np.array(escaped)
+        quote[escaped[escaped<len(a)]]=False
+    inside=np.logical_xor.accumulate(quote)  # True inside strings
+    delta=np.zeros(len(a),dtype=np.int8)
+    delta[(a==123)|(a==91)]=1  # '{' '['
+    delta[(a==125)|(a==93)]=-1  # '}' ']'
+    delta[inside]=0
+    depth=np.cumsum(delta,dtype=np.int32)
+    return np.flatnonzero((depth<=1)&(delta==-1))+1
+
+
+def _char(b,i):
+    "Returns the character of b at i, raises a ValueError at the end of b"
+    if i>=len(b):
+        raise ValueError('Unexpected end of epJSON file at character {}'.format(i))
+    return b[i:i+1]
+
+
 class EpjsonGraph(Graph):
     """An EnergyPlus JSON (epJSON) graph
     """
     
-    def read_epjson(self,fp):
-        with open(fp,'r') as f:
-            epjson=json.load(f)
-        for k,v in epjson.items():
-            label=k
-            for k1,v1 in v.items():
-                n=self.add_node(labels=label)
-                n.id=k1
-                n.properties.update(v1)
+    def read_epjson(self,fp,labels=None):
+        """Reads an epJSON file
+        
+        Arguments:
+            - fp (str): the filepath of an epJSON file
+            - labels (list): the object classes to read, i.e. ['Zone',
+                'BuildingSurface:Detailed']. If None then all classes are 
+                read. The objects of the other classes are skipped by 
+                counting their brackets, without decoding them.
+        
+        Raises a ValueError if the file is empty, truncated or not a json 
+            object of classes.
+        
+        """
+        if isinstance(labels,str): labels=[labels]
+        with open(fp,'rb') as f:
+            b=f.read()
+        ends=_value_ends(b)
+        i=_whitespace.match(b,0).end()
+        if _char(b,i)!=b'{':
+            raise ValueError('An epJSON file must contain a json object')
+        i=_whitespace.match(b,i+1).end()
+        while _char(b,i)!=b'}':
+            m=_string.match(b,i)
+            if m is None:
+                raise ValueError('Expected a class name at character {}'.format(i))
+            label=json.loads(m.group())
+            i=_whitespace.match(b,m.end()).end()
+            if _char(b,i)!=b':':
+                raise ValueError('Expected \':\' at character {}'.format(i))
+            i=_whitespace.match(b,i+1).end()
+            if _char(b,i)!=b'{':
+                raise ValueError('Expected a json object for {} at character {}'.format(label,i))
+            k=np.searchsorted(ends,i)
+            if k==len(ends):
+                raise ValueError('Unexpected end of epJSON file in {}'.format(label))
+            end=int(ends[k])
+            if labels is None or label in labels:
+                v=json.loads(b[i:end])
+                for k1,v1 in v.items():
+                    properties={'id':k1}
+                    properties.update(v1)
+                    self.add_node(labels=label,properties=properties)
+            i=_whitespace.match(b,end).end()
+            c=_char(b,i)
+            if c==b',':
+                i=_whitespace.match(b,i+1).end()
+                if _char(b,i)==b'}':
+                    raise ValueError('Expected a class name at character {}'.format(i))
+            elif c!=b'}':
+                raise ValueError('Expected \',\' or \'}}\' at character {}'.format(i))
+        i=_whitespace.match(b,i+1).end()
+        if i<len(b):
+            raise ValueError('Extra data after the epJSON object at character {}'.format(i))
     
     
-    def write_epjson(self,fp):
+    def write_epjson(self,fp,indent=4,sort_keys=True):
+        """Writes an epJSON file
+        
+        The objects are grouped by class and written to the file one at a 
+            time, rather than building and dumping a single dict.
+        
+        Arguments:
+            - fp (str): the filepath of the epJSON file
+            - indent (int): the indent for pretty printing, or None for a 
+                compact file
+            - sort_keys (bool): if True then the classes, objects and fields
+                are sorted
+        
+        """
         d={}
-        for n in self.nodes:
-            label=n.labels[0]
-            name=n.id
-            fields={}
-            for k,v in n.properties.items():
-                if not k=='id':
-                    fields[k]=v
-            if not label in d:
-                d[label]={name:fields}
-            else:
-                d[label][name]=fields
+        for _id,node_tuple in self._nodes.items():
+            d.setdefault(node_tuple[0][0],[]).append(node_tuple[1])
+        if indent is None:
+            sep,sep1,pad,pad1=',',':','',''
+        else:
+            sep,sep1=',',': '
+            pad='\n'+' '*indent
+            pad1=pad+' '*indent
+        labels=sorted(d) if sort_keys else list(d)
         with open(fp,'w') as f:
-            json.dump(d,
-                      f,
-                      sort_keys=True,
-                      indent=4)
+            f.write('{')
+            for i,label in enumerate(labels):
+                if i: f.write(sep)
+                f.write(pad+json.dumps(label)+sep1+'{')
+                l=[(properties.get('id'),properties) for properties in d[label]]
+                if sort_keys: l.sort(key=lambda x:x[0])
+                for j,(name,properties) in enumerate(l):
+                    if j: f.write(sep)
+                    fields={k:v for k,v in properties.items() if not k=='id'}
+                    st=json.dumps(fields,
+                                  sort_keys=sort_keys,
+                                  indent=indent,
+                                  separators=(sep,sep1))
+                    if indent is not None:
+                        st=st.replace('\n',pad1)
+                    f.write(pad1+json.dumps(name)+sep1+st)
+                f.write((pad if l else '')+'}')
+            f.write(('\n' if indent is not None and labels else '')+'}')
         
         
 from pprint import pprint
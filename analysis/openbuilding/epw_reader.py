@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+
+import calendar
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+
+try:
+    from .timeseries import IntervalTimeSeries, Variable
+except ImportError:
+    from timeseries import IntervalTimeSeries, Variable
+
+try:
+    from .series_pool import series_pool
+except ImportError:
+    from series_pool import series_pool
+
+
+_cache={}  # a dict of {file hash:(header,data)} of parsed epw files
+_cache_size=32
+
+
+def clear_cache():
+    "Empties the in-memory cache of parsed epw files"
+    _cache.clear()
+
+
+class EpwReader():
+    """Reads an EnergyPlus weather (.epw) file into NumPy arrays
+
+    The header is placed in self.header and the hourly (or sub-hourly) data
+        in self.data, a dict of {field name:numpy array}.
+
+    Parsed files are cached by the SHA-1 hash of the file contents, both in
+        memory and as a .npz file in cache_dir, or next to the .epw file if
+        cache_dir is None, so each weather file is only parsed once. The 
+        in-memory cache holds up to 32 files.
+
+    Example:
+        epw=EpwReader(r'GBR_Birmingham.035340_IWEC.epw')
+        epw.map_climate(bim)
+
+    """
+
+    # the epw data fields
+    fields=['year','month','day','hour','minute','data_source',
+            'dry_bulb_temperature','dew_point_temperature',
+            'relative_humidity','atmospheric_station_pressure',
+            'extraterrestrial_horizontal_radiation',
+            'extraterrestrial_direct_normal_radiation',
+            'horizontal_infrared_radiation_intensity',
+            'global_horizontal_radiation','direct_normal_radiation',
+            'diffuse_horizontal_radiation','global_horizontal_illuminance',
+            'direct_normal_illuminance','diffuse_horizontal_illuminance',
+            'zenith_luminance','wind_direction','wind_speed',
+            'total_sky_cover','opaque_sky_cover','visibility',
+            'ceiling_height','present_weather_observation',
+            'present_weather_codes','precipitable_water',
+            'aerosol_optical_depth','snow_depth','days_since_last_snowfall',
+            'albedo','liquid_precipitation_depth',
+            'liquid_precipitation_quantity']
+
+    # the fields which are not read
+    text_fields=['data_source','present_weather_codes']
+
+    # {epw field:(Variable name,units)} - names as used by EsoToBimMap
+    variable_map={
+        'dry_bulb_temperature':('air_drybulb_temperature','C'),
+        'diffuse_horizontal_radiation':('diffuse_solar_radiation','W/m2'),
+        'direct_normal_radiation':('direct_solar_radiation','W/m2'),
+        'global_horizontal_radiation':('global_horizontal_solar_radiation','W/m2'),
+        'dew_point_temperature':('air_dewpoint_temperature','C'),
+        'relative_humidity':('air_relative_humidity','%'),
+        'atmospheric_station_pressure':('air_pressure','Pa'),
+        'wind_speed':('wind_speed','m/s'),
+        'wind_direction':('wind_direction','deg')
+        }
+
+
+    def __init__(self,fp=None,cache=True,cache_dir=None):
+        self.header={}
+        self.data={}
+        self.cache=cache
+        self.cache_dir=cache_dir  # the folder of the .npz cache files
+        if fp: self.read_epw(fp)
+
+
+    @staticmethod
+    def _parse_header(lines):
+        "Returns a dict of the epw header lines"
+        d={}
+        for line in lines:
+            items=[x.strip() for x in line.split(',')]
+            key=items[0]
+            if key=='LOCATION':
+                d['location']={'city':items[1],
+                               'state':items[2],
+                               'country':items[3],
+                               'source':items[4],
+                               'wmo':items[5],
+                               'latitude':float(items[6]),
+                               'longitude':float(items[7]),
+                               'time_zone':float(items[8]),
+                               'elevation':float(items[9])}
+            elif key=='GROUND TEMPERATURES':
+                l=[]
+                values=items[2:]
+                for i in range(int(items[1])):
+                    a=values[i*16:(i+1)*16]
+                    l.append({'depth':float(a[0]),
+                              'temperatures':[float(x) for x in a[4:16]]})
+                d['ground_temperatures']=l
+            elif key=='DATA PERIODS':
+                d['records_per_hour']=int(items[2])
+            else:
+                d[key.lower()]=items[1:]
+        return d
+
+
+    def _parse(self,fp):
+        "Returns (header,data) for the epw file"
+        with open(fp,'r') as f:
+            header_lines=[f.readline() for i in range(8)]
+            usecols=[i for i,k in enumerate(self.fields)
+                     if not k in self.text_fields]
+            a=np.loadtxt(f,delimiter=',',usecols=usecols,ndmin=2)
+        header=self._parse_header(header_lines)
+        return header,a
+
+
+    def dataframe(self):
+        "Returns the data as a DataFrame with a DatetimeIndex"
+        return pd.DataFrame(self.data,index=self.index())
+
+
+    def index(self,year=None):
+        """Returns a DatetimeIndex of the start of each interval
+
+        Arguments:
+            - year (int): the year used for the timestamps. If None this is 
+                2001, the same as EsoGraph, or the year of the first record
+                if the data has a 29 February (i.e. an actual year file of 
+                a leap year).
+
+        Raises a ValueError if the data has a 29 February and year is not a
+            leap year.
+
+        """
+        leap_day=(self.data['month']==2)&(self.data['day']==29)
+        if year is None:
+            year=int(self.data['year'][0]) if leap_day.any() else 2001
+        if leap_day.any() and not calendar.isleap(year):
+            raise ValueError('The weather data has 29 February, which is not '
+                             'in the year {}'.format(year))
+        records_per_hour=self.header.get('records_per_hour',1)
+        minutes=(self.data['hour']-1)*60
+        if records_per_hour>1:
+            interval=60//records_per_hour
+            minutes+=(self.data['minute']-interval)%60
+        dates=pd.to_datetime(pd.DataFrame({'year':year,
+                                           'month':self.data['month'].astype(int),
+                                           'day':self.data['day'].astype(int)}))
+        return pd.DatetimeIndex(dates+pd.to_timedelta(minutes,unit='min'))
+
+
+    def interval(self):
+        "Returns the data interval as a string"
+        records_per_hour=self.header.get('records_per_hour',1)
+        if records_per_hour==1:
+            return '1H'
+        return '{}min'.format(60//records_per_hour)
+
+
+    def map_climate(self,bim,year=None):
+        """Places the weather data as Variables on the Climate node of bim
+
+        The Variables have the same names as those set by EsoToBimMap, so
+            this can be used in place of running a simulation. The time
+            series are interned in the series pool.
+
+        The location and the monthly ground temperatures at the shallowest
+            depth are placed as properties on the Climate node.
+
+        year is passed to self.index.
+
+        """
+        climate=bim.Climate[0]
+        location=self.header.get('location',{})
+        for k in ('latitude','longitude','time_zone','elevation'):
+            if k in location:
+                setattr(climate,k,location[k])
+        ground_temperatures=self.header.get('ground_temperatures')
+        if ground_temperatures:
+            climate.ground_temperatures=ground_temperatures[0]['temperatures']
+        index=self.index(year)
+        interval=self.interval()
+        for field,(name,units) in self.variable_map.items():
+            s=pd.Series(index=index,data=self.data[field])
+            ts=series_pool.intern(IntervalTimeSeries(series=s,interval=interval,method='mean'))
+            setattr(climate,name,Variable(name=name,ts=ts,units=units))
+        return climate
+
+
+    def read_epw(self,fp):
+        """Reads the epw file
+
+        Arguments:
+            - fp (str): the filepath of an epw file
+
+        """
+        with open(fp,'rb') as f:
+            key=hashlib.sha1(f.read()).hexdigest()
+        npz_fp='{}.{}.npz'.format(os.path.splitext(fp)[0],key[:16])
+        if self.cache_dir is not None:
+            npz_fp=os.path.join(self.cache_dir,os.path.basename(npz_fp))
+        if self.cache and key in _cache:
+            header,a=_cache[key]
+        elif self.cache and os.path.isfile(npz_fp):
+            with np.load(npz_fp) as npz:
+                header=json.loads(str(npz['header']))
+                a=npz['data']
+        else:
+            header,a=self._parse(fp)
+            if self.cache:
+                try:
+                    if self.cache_dir is not None:
+                        os.makedirs(self.cache_dir,exist_ok=True)
+                    np.savez(npz_fp,header=json.dumps(header),data=a)
+                except OSError:
+                    pass
+        if self.cache:
+            if len(_cache)>=_cache_size:
+                _cache.clear()
+            _cache[key]=(header,a)
+        self.header=header
+        columns=[k for k in self.fields if not k in self.text_fields]
+        self.data={k:a[:,i] for i,k in enumerate(columns)}
+
+
+
+# tests
+
+if __name__=='__main__':
+    import time
+    from bim_graph import BimGraph
+
+    print('TEST-EpwReader')
+    fp=r'../04_C-run_energyplus/GBR_Birmingham.035340_IWEC.epw'
+
+    t=time.time()
+    epw=EpwReader(fp)
+    print('read',time.time()-t)
+    print(epw.header['location'])
+    print(epw.dataframe().head())
+
+    bim=BimGraph()
+    bim.add_node(labels='Climate')
+    epw.map_climate(bim)
+    print(bim.Climate[0].air_drybulb_temperature)
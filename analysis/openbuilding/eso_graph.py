@@ -18,10 +18,16 @@ class EsoGraph(Graph):
     ONLY WORKS FOR SIMULATION VARIABLES AT PRESENT
         NOT DAILY, MONTHLY OR RUNPERIOD REPORT VARIABLES
     
+    If a VariableRegistry is given, only the variables in the registry are
+        read. The other variables are listed in self.skipped and their data 
+        is never parsed.
+    
     """
     
-    def __init__(self,fp=None):
+    def __init__(self,fp=None,registry=None):
         Graph.__init__(self)
+        self.registry=registry
+        self.skipped=[]
         if fp: self.read_eso(fp)
 
     def read_eso(self,fp):
@@ -30,10 +36,14 @@ class EsoGraph(Graph):
         Arguments:
             - fp (str): the filepath of an eso file
         
+        Returns self.skipped, a list of dicts of the variables not read as
+            they are not in self.registry.
+        
         """
         #setup
         flag_data_dictionary=True
         self._node_dict={}
+        self.skipped=[]
         # reads the lines in the eso file
         for line in open(fp,'r'):
             if line.startswith('End of Data Dictionary'):
@@ -56,7 +66,7 @@ class EsoGraph(Graph):
             # cleanup by removing 'index' and 'data'
             del n.properties['index']
             del n.properties['data']
-        return
+        return self.skipped
 
 
     def _read_data_dictionary(self,line):
@@ -80,10 +90,6 @@ class EsoGraph(Graph):
             variable_name=c[0].strip()
             units=d[0].strip()
             interval=e[1].strip()
-            if interval=='Hourly': # converts interval to a pandas Timedelta string
-                interval='1H'
-            else:
-                raise Exception('More code needed to parse interval')
             return variable_eso_code,label,variable_name,units,interval
         
         items=line.split(',')
@@ -94,6 +100,17 @@ class EsoGraph(Graph):
         if x>6:  # THIS SEEMED TO CHANGE IN V8.9 - IS THIS A CONSTANT?
             variable_eso_code,label,variable_name,units,interval=\
                 parse_data_dictionary_variable_line(line)
+            if self.registry is not None and not variable_name in self.registry:
+                self.skipped.append({'key':label,
+                                     'variable_name':variable_name,
+                                     'units':units,
+                                     'interval':interval,
+                                     'variable_eso_code':variable_eso_code})
+                return
+            if interval=='Hourly': # converts interval to a pandas Timedelta string
+                interval='1H'
+            else:
+                raise Exception('More code needed to parse interval')
             ts=IntervalTimeSeries(interval=interval)
             properties={'variable_name':variable_name,
                         'index':[],
@@ -145,8 +162,9 @@ class EsoGraph(Graph):
             dt=parse_timestamp_line(items)
             self._dt=dt
         elif variable_eso_code>6:
+            n=self._node_dict.get(variable_eso_code)
+            if n is None: return  # a skipped variable
             value=float(items[1])
-            n=self._node_dict[variable_eso_code]
             n.properties['index'].append(self._dt)
             n.properties['data'].append(value)
         return
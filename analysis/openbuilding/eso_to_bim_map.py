@@ -1,6 +1,5 @@
 # -*- coding: utf-8 -*-
 
-import copy
 import sys
 import pandas as pd
 
@@ -14,74 +13,109 @@ try:
 except ImportError:
     from timeseries import Variable
 
+try:
+    from .series_pool import series_pool
+except ImportError:
+    from series_pool import series_pool
+
+try:
+    from .variable_registry import variable_registry
+except ImportError:
+    from variable_registry import variable_registry
+
 class EsoToBimMap():
     """A mapping object to transfer EsoGraph to BimGraph
     
     This requires an input bim object, and the data in the EsoGraph is
         incorporated into this BimGraph based on the node property ids
         
-    ONLY WORKS IF THE ESO VARIABLE HAS BEEN LISTED IN ONE OF THE 'map_dicts' BELOW
+    The bim nodes are indexed by id once and each eso key is resolved once,
+        so the mapping is linear in the number of eso variables.
+        
+    The property names are looked up in self.registry, a VariableRegistry.
+        Variables which are not in the registry, have different units or 
+        have no matching bim node are not mapped and are listed in 
+        self.skipped.
     
     """
     
     def __init__(self):
         self.input_eso=None
         self.bim=None
+        self.series_pool=series_pool
+        self.registry=variable_registry
+        self.skipped=[]
     
-
-    def _find_bim_node(self,eso_node):
-        "Returns the Bim node that matches eso_node label"
-        # id of eso node
-        id1=eso_node.labels[0]
-                
+    
+    def _index(self):
+        """Indexes the bim nodes in a single pass
+        
+        Sets self._id_index ({'id' property:node _id}, the first node with
+            each id) and self._label_index ({label:first node _id}) for the
+            Climate and Building nodes.
+        
+        """
+        self._id_index={}
+        self._label_index={}
+        for _id,(labels,properties,_,_) in self.bim._nodes.items():
+            id1=properties.get('id')
+            if id1 is not None and not id1 in self._id_index:
+                self._id_index[id1]=_id
+            for label in ('Climate','Building'):
+                if label in labels and not label in self._label_index:
+                    self._label_index[label]=_id
+    
+    
+    def _resolve(self,id1):
+        "Returns the bim node _id for an eso key, or None"
         # environment
         if id1=='Environment':
-            return self.bim.Climate[0]
+            return self._label_index.get('Climate')
         # building
         if id1.startswith('Whole Building'):
-            return self.bim.Building[0]
+            return self._label_index.get('Building')
         
         # baseboard heat
         if id1.endswith('BASEBOARD HEAT'):
             space_id=id1[:-len(' BASEBOARD HEAT')]
-            space_node=self.bim.filter_node_by_property(key='id',
-                                                        value=space_id)
-            electric_room_heater_node=\
-                space_node.RoomHeater[0]
-            return electric_room_heater_node
+            space_id=self._id_index.get(space_id)
+            if space_id is None: return None
+            nodes=self.bim._nodes
+            edges=self.bim._edges
+            for e in nodes[space_id][3]:
+                end=edges[e][1]
+                if 'RoomHeater' in nodes[end][0]:
+                    return end
+            return None
         
         # all other nodes
         else:
-            return self.bim.filter_node_by_property(key='id',
-                                                    value=id1)
-    
-    
-    def _map_building(self,bim_node,eso_node):
-        ""
-        map_dict=\
-            {'Facility Total Building Electric Demand Power':'electric_power'}
-        variable_name=map_dict[eso_node.properties['variable_name']]
-        self._map_node(bim_node,eso_node,variable_name)
-                    
-    
-    def _map_environment(self,bim_node,eso_node):
-        ""
-        map_dict=\
-            {'Site Outdoor Air Drybulb Temperature':'air_drybulb_temperature',
-             'Site Diffuse Solar Radiation Rate per Area':'diffuse_solar_radiation',
-             'Site Direct Solar Radiation Rate per Area':'direct_solar_radiation',
-             'Site Surface Ground Temperature':'surface_ground_temperature',
-             }
-        variable_name=map_dict[eso_node.properties['variable_name']]
-        self._map_node(bim_node,eso_node,variable_name)
+            return self._id_index.get(id1)
+    
+    
+    def _find_bim_node(self,eso_node):
+        "Returns the Bim node that matches eso_node label"
+        if not hasattr(self,'_id_index'):
+            self._index()
+        _id=self._resolve(eso_node.labels[0])
+        if _id is None: return None
+        return self.bim._Node(_id)
     
     
     def _map_node(self,
                  bim_node,
                  eso_node,
                  variable_name):
-        "Maps the properties from eso to bim"
-        ts=copy.deepcopy(eso_node.properties['ts'])
+        """Maps the properties from eso to bim
+        
+        The time series is attached by reference, not copied. If 
+            self.series_pool is set then it is interned first, so identical
+            series (such as the climate data) are shared between BimGraphs.
+            
+        """
+        ts=eso_node.properties['ts']
+        if self.series_pool is not None:
+            ts=self.series_pool.intern(ts)
         units=eso_node.properties['units']  
         var=Variable(name=variable_name,
                      ts=ts,
@@ -89,63 +123,41 @@ class EsoToBimMap():
         setattr(bim_node,variable_name,var)      
         
         
-    def _map_roomHeater(self,bim_node,eso_node):
-        ""
-        map_dict=\
-            {'Baseboard Total Heating Energy':'heating_energy',
-             'Baseboard Electric Energy':'electric_energy'
-             }
-        variable_name=map_dict[eso_node.properties['variable_name']]
-        self._map_node(bim_node,eso_node,variable_name)
-    
-    
-    def _map_space(self,bim_node,eso_node):
-        ""
-        map_dict=\
-            {'Zone Total Internal Total Heating Energy':'internal_heat_gain',
-             'Zone People Total Heating Energy':'people_heat_gain',
-             'Zone Lights Total Heating Energy':'light_heat_gain',
-             'Zone Electric Equipment Total Heating Energy':'appliance_heat_gain',
-             'Zone Windows Total Transmitted Solar Radiation Energy':'solar_gain',
-             'Zone Windows Total Heat Gain Energy':'windows_heat_gain',
-             'Zone Windows Total Heat Loss Energy':'windows_heat_loss',
-             'Zone Mean Air Temperature':'air_temperature',
-             'Zone Infiltration Total Heat Loss Energy':'infiltration_heat_loss',
-             'Zone Infiltration Total Heat Gain Energy':'infiltration_heat_gain',
-             'Zone Thermostat Heating Setpoint Temperature':'thermostat_setpoint'
-             }
-        variable_name=map_dict[eso_node.properties['variable_name']]
-        self._map_node(bim_node,eso_node,variable_name)
-        
-        
-    def _map_surface(self,bim_node,eso_node):
-        ""
-        map_dict=\
-            {'Surface Inside Face Conduction Heat Transfer Energy':'inside_conduction'
-             }
-        variable_name=map_dict[eso_node.properties['variable_name']]
-        self._map_node(bim_node,eso_node,variable_name)
-        
-    
     def run(self):
         "Running the mapping, Bim object placed in self.output"
         
+        self._index()
+        
+        #FIND BIM NODES TO MAP TO, ONCE FOR EACH ESO KEY
+        keys={}
+        for node_tuple in self.input_eso._nodes.values():
+            id1=node_tuple[0][0]
+            if not id1 in keys:
+                keys[id1]=self._resolve(id1)
+        
         #MAP OBJECTS
-        for eso_node in self.input_eso.nodes:
-            #FIND BIM NODE TO MAP TO
-            bim_node=self._find_bim_node(eso_node)
-            if not bim_node: continue
-            #MAP
-            if 'Climate' in bim_node.labels:
-                self._map_environment(bim_node,eso_node)
-            elif 'Building' in bim_node.labels:
-                self._map_building(bim_node,eso_node)
-            elif 'Space' in bim_node.labels:
-                self._map_space(bim_node,eso_node)
-            elif 'Surface' in bim_node.labels:
-                self._map_surface(bim_node,eso_node)
-            elif 'RoomHeater' in bim_node.labels:
-                self._map_roomHeater(bim_node,eso_node)
+        self.skipped=[]
+        bim=self.bim
+        for _id,(labels,properties,_,_) in self.input_eso._nodes.items():
+            variable_name=properties['variable_name']
+            _id1=keys[labels[0]]
+            if _id1 is None:
+                rule,reason=None,'no bim node'
+            else:
+                rule=self.registry.rule(variable_name,bim._nodes[_id1][0])
+                reason='not in registry'
+            if rule and rule[3] is not None and rule[3]!=properties['units']:
+                rule,reason=None,'units'
+            if rule is None:
+                self.skipped.append({'key':labels[0],
+                                     'variable_name':variable_name,
+                                     'units':properties['units'],
+                                     'reason':reason})
+                continue
+            self._map_node(bim._Node(_id1),
+                           self.input_eso._Node(_id),
+                           rule[2])
+        return self.skipped
         
                 
 # tests
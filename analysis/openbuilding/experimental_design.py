@@ -0,0 +1,461 @@
+# -*- coding: utf-8 -*-
+
+"""This module contains experimental designs for parametric studies
+
+A design is made from a list of parameters. Each parameter is bound to
+    a property of BimGraph nodes (BimParameter) or to the text or an
+    attribute of GbxmlGraph nodes (GbxmlParameter).
+
+Running a design creates a design matrix, a DataFrame with one row per
+    simulation and one column per parameter. Simulation results are added
+    to the design so that they are recorded alongside the design matrix.
+
+Example:
+    d=LatinHypercubeDesign([
+        BimParameter('orientation','Building','orientation',low=0,high=360),
+        BimParameter('infiltration','Space','infiltration',low=0.2,high=1.5)
+        ])
+    d.run(n=200,seed=1)
+    for i,bim1 in d.bim_variants(bim):
+        ...
+        d.add_result(i,heating_energy=...)
+    d.write_csv('design.csv')
+
+"""
+
+import abc
+import itertools
+import numpy as np
+import pandas as pd
+
+
+class Parameter():
+    """An input parameter of an experimental design
+
+    A continuous parameter has 'low' and 'high' values.
+    A discrete parameter has a list of 'levels'.
+
+    """
+
+    def __init__(self,
+                 name,
+                 low=None,
+                 high=None,
+                 levels=None):
+        self.name=name
+        self.low=low
+        self.high=high
+        self.levels=levels
+
+
+    def __repr__(self):
+        if self.levels is not None:
+            return '{}(name={},levels={})'.format(self.__class__.__name__,
+                                                 self.name,
+                                                 self.levels)
+        return '{}(name={},low={},high={})'.format(self.__class__.__name__,
+                                                  self.name,
+                                                  self.low,
+                                                  self.high)
+
+
+    def factorial_values(self,n_levels=2):
+        "Returns the parameter values used in a full factorial design"
+        if self.levels is not None:
+            return list(self.levels)
+        return list(np.linspace(self.low,self.high,n_levels))
+
+
+    def values(self,u):
+        """Returns the parameter values for unit values u
+
+        Arguments:
+            - u (array): values in the range [0,1)
+
+        """
+        u=np.asarray(u,dtype=float)
+        if self.levels is not None:
+            i=np.minimum((u*len(self.levels)).astype(int),len(self.levels)-1)
+            a=np.empty(len(self.levels),dtype=object)
+            a[:]=list(self.levels)
+            return a[i]
+        return self.low+u*(self.high-self.low)
+
+
+class BimParameter(Parameter):
+    """A parameter bound to a property of BimGraph nodes
+
+    The parameter sets property 'key' of all nodes with label 'label', or
+        only the node with id 'node_id' if given.
+
+    """
+
+    def __init__(self,
+                 name,
+                 label,
+                 key,
+                 node_id=None,
+                 low=None,
+                 high=None,
+                 levels=None):
+        Parameter.__init__(self,name,low,high,levels)
+        self.label=label
+        self.key=key
+        self.node_id=node_id
+
+
+    def nodes(self,bim):
+        "Returns the nodes in bim which the parameter is bound to"
+        nodes=bim.filter_nodes_by_label(self.label)
+        if self.node_id is None:
+            return nodes
+        return [n for n in nodes if n.properties.get('id')==self.node_id]
+
+
+    def properties(self,bim,value):
+        "Returns a dict of {node._id:{key:value}} for BimGraph.view"
+        return {n._id:{self.key:value} for n in self.nodes(bim)}
+
+
+class GbxmlParameter(Parameter):
+    """A parameter bound to the text or an attribute of GbxmlGraph nodes
+
+    The parameter sets the text (or 'attribute' if given) of all nodes with
+        label 'label', or only the node with id attribute 'node_id' if given.
+
+    """
+
+    def __init__(self,
+                 name,
+                 label,
+                 attribute=None,
+                 node_id=None,
+                 low=None,
+                 high=None,
+                 levels=None):
+        Parameter.__init__(self,name,low,high,levels)
+        self.label=label
+        self.attribute=attribute
+        self.node_id=node_id
+
+
+    def apply(self,gbxml,value):
+        "Sets the parameter value in gbxml"
+        for n in gbxml.filter_nodes_by_label(self.label):
+            if not self.node_id is None and n.attributes.get('id')!=self.node_id:
+                continue
+            if self.attribute is None:
+                n.text=str(value)
+            else:
+                n.attributes[self.attribute]=str(value)
+
+
+class Design(abc.ABC):
+    """The base class of an experimental design
+
+    Subclasses implement unit_samples.
+
+    Attributes:
+        - parameters (list): a list of Parameter objects
+        - matrix (pd.DataFrame): the design matrix, with a row for each
+            simulation and a column for each parameter
+        - results (dict): a dict of {row:{output name:value}}
+
+    """
+
+    def __init__(self,parameters=None):
+        self.parameters=parameters or []
+        self.matrix=None
+        self.results={}
+
+
+    @abc.abstractmethod
+    def unit_samples(self,n,rng):
+        "Returns an (n,d) array of samples in the unit hypercube"
+
+
+    def run(self,n,seed=None):
+        """Creates the design matrix
+
+        Arguments:
+            - n (int): the number of simulations
+            - seed (int, SeedSequence or numpy.random.Generator)
+
+        """
+        rng=np.random.default_rng(seed)
+        u=self.unit_samples(n,rng)
+        d={p.name:p.values(u[:,j]) for j,p in enumerate(self.parameters)}
+        self.matrix=pd.DataFrame(d)
+        self.results={}
+        return self.matrix
+
+
+    def add_result(self,i,**outputs):
+        "Records the simulation outputs for row i of the design matrix"
+        self.results.setdefault(i,{}).update(outputs)
+
+
+    def bim_variants(self,bim):
+        """Yields (row,BimGraphView) for each row of the design matrix
+
+        Only BimParameter parameters are applied.
+
+        """
+        parameters=[p for p in self.parameters if isinstance(p,BimParameter)]
+        for i,row in self.matrix.iterrows():
+            d={}
+            for p in parameters:
+                for _id,properties in p.properties(bim,_value(row[p.name])).items():
+                    d.setdefault(_id,{}).update(properties)
+            yield i,bim.view(d)
+
+
+    def gbxml_variant(self,gbxml,i):
+        """Sets the values of row i in gbxml and returns gbxml
+
+        Only GbxmlParameter parameters are applied. The gbxml graph is
+            changed in place.
+
+        """
+        row=self.matrix.loc[i]
+        for p in self.parameters:
+            if isinstance(p,GbxmlParameter):
+                p.apply(gbxml,_value(row[p.name]))
+        return gbxml
+
+
+    def to_dataframe(self):
+        "Returns the design matrix joined with the results"
+        results=pd.DataFrame.from_dict(self.results,orient='index')
+        return self.matrix.join(results)
+
+
+    def write_csv(self,fp):
+        "Writes the design matrix and results to a csv file"
+        self.to_dataframe().to_csv(fp,index_label='run')
+
+
+class LatinHypercubeDesign(Design):
+    """A Latin hypercube design
+
+    Each parameter range is divided into n equal strata and each stratum
+        is sampled exactly once.
+
+    """
+
+    def unit_samples(self,n,rng):
+        d=len(self.parameters)
+        strata=rng.permuted(np.tile(np.arange(n),(d,1)),axis=1).T
+        return (strata+rng.random((n,d)))/n
+
+
+class SobolDesign(Design):
+    """A Sobol low-discrepancy sequence design
+
+    Up to 41 parameters are supported. Designs with n equal to a power of
+        2 have the best space filling properties. If a seed is given then
+        the sequence is randomised with a random digital shift.
+
+    """
+
+    def __init__(self,parameters=None):
+        Design.__init__(self,parameters)
+        self.seed=None
+
+
+    def run(self,n,seed=None):
+        self.seed=seed
+        return Design.run(self,n,seed)
+
+
+    def unit_samples(self,n,rng):
+        d=len(self.parameters)
+        x=sobol_sequence(n,d)
+        if not self.seed is None:
+            shift=rng.integers(0,2**_SOBOL_BITS,size=d,dtype=np.uint64)
+            x=(x*2.0**_SOBOL_BITS).astype(np.uint64)^shift
+            x=x/2.0**_SOBOL_BITS
+        return x
+
+
+class FullFactorialDesign(Design):
+    """A full factorial design
+
+    Every combination of the parameter values is included. Continuous
+        parameters are divided into n_levels equally spaced values.
+
+    """
+
+    def __init__(self,parameters=None,n_levels=2):
+        Design.__init__(self,parameters)
+        self.n_levels=n_levels
+
+
+    def unit_samples(self,n=None,rng=None):
+        """Returns the unit values of every combination of the parameter values
+
+        n and rng are not used. A continuous parameter has n_levels values
+            from 0 to 1, and a discrete parameter the midpoint of the unit
+            range of each level.
+
+        """
+        values=[]
+        for p in self.parameters:
+            if p.levels is not None:
+                values.append((np.arange(len(p.levels))+0.5)/len(p.levels))
+            else:
+                values.append(np.linspace(0,1,self.n_levels))
+        return np.array(list(itertools.product(*values)),dtype=float).reshape(-1,len(values))
+
+
+    def run(self,n=None,seed=None):
+        """Creates the design matrix
+
+        n and seed are not used, the number of rows is the product of the
+            number of values of each parameter.
+
+        """
+        values=[p.factorial_values(self.n_levels) for p in self.parameters]
+        l=list(itertools.product(*values))
+        self.matrix=pd.DataFrame(l,columns=[p.name for p in self.parameters])
+        self.results={}
+        return self.matrix
+
+
+def _value(v):
+    "Returns a numpy scalar as the equivalent Python value"
+    if isinstance(v,np.generic):
+        return v.item()
+    return v
+
+
+# Sobol sequence direction numbers for dimensions 2 to 41, as
+#     (degree s, coefficients a, initial direction numbers m).
+# From S. Joe and F. Y. Kuo, 'new-joe-kuo-6.21201'.
+
+_SOBOL_BITS=32
+
+_SOBOL_DIRECTIONS=[
+    (1,0,[1]),
+    (2,1,[1,3]),
+    (3,1,[1,3,1]),
+    (3,2,[1,1,1]),
+    (4,1,[1,1,3,3]),
+    (4,4,[1,3,5,13]),
+    (5,2,[1,1,5,5,17]),
+    (5,4,[1,1,5,5,5]),
+    (5,7,[1,1,7,11,19]),
+    (5,11,[1,1,5,1,1]),
+    (5,13,[1,1,1,3,11]),
+    (5,14,[1,3,5,5,31]),
+    (6,1,[1,3,3,9,7,49]),
+    (6,13,[1,1,1,15,21,21]),
+    (6,16,[1,3,1,13,27,49]),
+    (6,19,[1,1,1,15,7,5]),
+    (6,22,[1,3,1,15,13,25]),
+    (6,25,[1,1,5,5,19,61]),
+    (7,1,[1,3,7,11,23,15,103]),
+    (7,4,[1,3,7,13,13,15,69]),
+    (7,7,[1,1,3,13,7,35,63]),
+    (7,8,[1,3,5,9,1,25,53]),
+    (7,14,[1,3,1,13,9,35,107]),
+    (7,19,[1,3,1,5,27,61,31]),
+    (7,21,[1,1,5,11,19,41,61]),
+    (7,28,[1,3,5,3,3,13,69]),
+    (7,31,[1,1,7,13,1,19,1]),
+    (7,32,[1,3,7,5,13,19,59]),
+    (7,37,[1,1,3,9,25,29,41]),
+    (7,41,[1,3,5,13,23,1,55]),
+    (7,42,[1,3,7,3,13,59,17]),
+    (7,50,[1,3,1,3,5,53,69]),
+    (7,55,[1,1,5,5,23,33,13]),
+    (7,56,[1,1,7,7,1,61,123]),
+    (7,59,[1,1,7,9,13,61,49]),
+    (7,62,[1,3,3,5,3,55,33]),
+    (8,14,[1,3,1,15,31,13,49,245]),
+    (8,21,[1,3,5,15,31,59,63,97]),
+    (8,22,[1,3,1,11,11,11,77,249]),
+    (8,38,[1,3,1,11,27,43,71,9]),
+    ]
+
+
+def _sobol_direction_numbers(d):
+    "Returns a (d,_SOBOL_BITS) array of Sobol direction numbers"
+    L=_SOBOL_BITS
+    if d>len(_SOBOL_DIRECTIONS)+1:
+        raise ValueError('Sobol sequences are limited to {} dimensions'.format(len(_SOBOL_DIRECTIONS)+1))
+    v=np.zeros((d,L),dtype=np.uint64)
+    v[0]=[1<<(L-k) for k in range(1,L+1)]
+    for j,(s,a,m) in enumerate(_SOBOL_DIRECTIONS[:d-1],1):
+        for k in range(1,L+1):
+            if k<=s:
+                x=m[k-1]<<(L-k)
+            else:
+                x=int(v[j,k-s-1])
+                x^=x>>s
+                for l in range(1,s):
+                    if (a>>(s-1-l))&1:
+                        x^=int(v[j,k-l-1])
+            v[j,k-1]=x
+    return v
+
+
+def sobol_sequence(n,d):
+    """Returns the first n points of a d-dimensional Sobol sequence
+
+    The points are calculated in a single vectorised pass using their
+        Gray code representation.
+
+    """
+    if n>2**_SOBOL_BITS:
+        raise ValueError('n must be <= 2**{}'.format(_SOBOL_BITS))
+    v=_sobol_direction_numbers(d)
+    i=np.arange(n,dtype=np.uint64)
+    gray=i^(i>>np.uint64(1))
+    x=np.zeros((n,d),dtype=np.uint64)
+    for b in range(_SOBOL_BITS):
+        mask=((gray>>np.uint64(b))&np.uint64(1)).astype(bool)
+        if not mask.any(): break
+        x[mask]^=v[:,b]
+    return x/2.0**_SOBOL_BITS
+
+
+
+# tests
+
+if __name__=='__main__':
+    from bim_graph import BimGraph
+
+    print('TEST-experimental_design.py')
+
+    parameters=[
+        BimParameter('orientation','Building','orientation',low=0,high=360),
+        BimParameter('infiltration','Space','infiltration',low=0.2,high=1.5),
+        BimParameter('roughness','Material','roughness',levels=['Smooth','Rough'])
+        ]
+
+    d=LatinHypercubeDesign(parameters)
+    print(d.run(n=5,seed=1))
+
+    d=SobolDesign(parameters)
+    print(d.run(n=8))
+
+    d=FullFactorialDesign(parameters,n_levels=3)
+    print(d.run())
+    u=d.unit_samples()
+    for j,p in enumerate(parameters):
+        assert list(p.values(u[:,j]))==list(d.matrix[p.name])
+
+    class IncompleteDesign(Design):
+        pass
+    try:
+        IncompleteDesign(parameters)
+        raise AssertionError('a Design without unit_samples was created')
+    except TypeError as err:
+        print('TypeError:',err)
+
+    bim=BimGraph()
+    bim.add_node(labels='Building',properties={'id':'building','orientation':0})
+    for i,bim1 in d.bim_variants(bim):
+        d.add_result(i,north_axis=bim1.Building[0].orientation)
+    print(d.to_dataframe())
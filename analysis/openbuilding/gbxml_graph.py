@@ -118,11 +118,12 @@ class GbxmlNode(XmlNode):
         """Returns the coordinates of a Geometry node"""
         label='CartesianPoint'
         cartesianPoint_nodes=self.descendent_nodes(label=label)
-        l=[(float(cp.child_nodes()[0].text),
-            float(cp.child_nodes()[1].text),
-            float(cp.child_nodes()[2].text)
-            )
-            for cp in cartesianPoint_nodes]
+        l=[]
+        for cp in cartesianPoint_nodes:
+            c=cp.child_nodes()
+            l.append((float(c[0].text),
+                      float(c[1].text),
+                      float(c[2].text)))
         return l
     
     
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+import time
 import pandas as pd
 
 try:
@@ -12,9 +13,43 @@ try:
 except ImportError:
     from schedules import YearSchedule,PeriodSchedule,WeekSchedule,DaySchedule
 
+try:
+    from .schedule_pool import schedule_pool
+except ImportError:
+    from schedule_pool import schedule_pool
+
+try:
+    from .geometry import PolygonArray
+except ImportError:
+    from geometry import PolygonArray
+
+try:
+    from .bim_graph_validator import bim_graph_validator
+except ImportError:
+    from bim_graph_validator import bim_graph_validator
+
 
 class GbxmlToBimMap():
-    "A mapping object to transfer gbXML to Bim"
+    """A mapping object to transfer gbXML to Bim
+
+    The gbXML graph is indexed in a single traversal (the 'id' attributes,
+        the child and parent nodes and the coordinates of all surfaces), so
+        the mapping rules look up the nodes they need rather than searching
+        the graph.
+
+    The mapping rules are registered by label in self.rules and all run in a
+        single pass over the BimGraph nodes. The number of calls and the time
+        taken by each rule are placed in self.rule_stats, and rule_report()
+        returns these as a DataFrame.
+
+    The property values are converted to their types in bim_graph_schema by
+        self.validator once all nodes are mapped. Other properties which are
+        numbers are converted to floats.
+
+    The YearSchedule objects are interned in self.schedule_pool, so
+        schedules with the same content share one object across BimGraphs.
+
+    """
     
     
     map_keys={
@@ -43,60 +78,126 @@ class GbxmlToBimMap():
                     }
             }
         
+    # the gbXML elements which are mapped to BimGraph nodes
+    node_labels=['Location','Building','Space',
+                 'Surface','Opening',
+                 'Construction','Layer','Material',
+                 'WindowType','Glaze','Gap',
+                 'Zone',
+                 'Schedule','YearSchedule','WeekSchedule','DaySchedule'
+                 ]
+
+    # {label:[rule names]} - the rules run in order on each BimGraph node
+    # with that label
+    rules={
+            'Building':['_map_building'],
+            'Space':['_map_space',
+                     '_map_space_People',
+                     '_map_space_Light',
+                     '_map_space_Appliance'],
+            'Zone':['_map_zone'],
+            'Surface':['_map_surface'],
+            'Opening':['_map_opening'],
+            'Construction':['_map_construction'],
+            'Material':['_map_material'],
+            'WindowType':['_map_window_type'],
+            'Glaze':['_map_glaze'],
+            'Gap':['_map_gap'],
+            'Schedule':['_map_schedule']
+            }
+
     
     def __init__(self):
         self.input_gbxml=None
         self.output_bim=None
+        self.rule_stats={}  # {rule name:[calls,seconds]}
+        self.validator=bim_graph_validator
+        self.coerce_report=None  # the values which could not be converted
+        self.schedule_pool=schedule_pool  # shares schedules with the same content
+    
+    
+    def _ancestor_id(self,_id,label):
+        "Returns the _id of the nearest gbxml ancestor node with label"
+        nodes=self.input_gbxml._nodes
+        _id=self._parent.get(_id)
+        while _id is not None and not label in nodes[_id][0]:
+            _id=self._parent.get(_id)
+        return _id
+
+
+    def _attributes(self,_id):
+        "Returns the attributes of a gbxml node"
+        return self.input_gbxml._nodes[_id][1]['attributes']
+
+
+    def _bim_node(self,_id):
+        "Returns the bim node with the same 'id' as the gbxml node _id"
+        return self._bim_dict[self._attributes(_id).get('id')]
+
+
+    def _child_ids(self,_id,label=None):
+        "Returns the _ids of the child nodes of a gbxml node"
+        l=self._children.get(_id,[])
+        if label is None: return l
+        nodes=self.input_gbxml._nodes
+        return [x for x in l if label in nodes[x][0]]
     
     
-    def _bim_node(self,gbxml_node):
-        "Returns the bim node with the same 'id' as the gbxml node"
-        return self._bim_dict[gbxml_node.attributes.get('id')]
+    def _coerce(self):
+        "Converts the properties of self.output_bim using self.validator"
+        return self.validator.coerce(self.output_bim,numbers=True)
     
     
     def _gbxml_node(self,bim_node):
-        "Returns the gbxml node with the same 'id' as the bim node"
+        "Returns the _id of the gbxml node with the same 'id' as the bim node"
         return self._gbxml_dict[bim_node.id]
     
     
-    def _map_attributes(self,gbxml_node,bim_node):
+    def _map_attributes(self,_id,properties):
         "Maps the attributes of the gbxml node"
-        bim_node.properties.update(gbxml_node.attributes)
+        properties.update(self._attributes(_id))
         
 
     def _map_building(self,building_out):
         "Maps a space node"
         building_in=self._gbxml_node(building_out)
-        building_out.orientation=float(building_in.CAD_model_azimuth())
+        campus_in=self._ancestor_id(building_in,'Campus')
+        location_in=self._child_ids(campus_in,'Location')[0]
+        azimuth_in=self._child_ids(location_in,'CADModelAzimuth')[0]
+        building_out.orientation=float(self._text(azimuth_in))
         building_out.origin_vertex=[0.0,0.0,0.0]
         self.output_bim.add_edge(self.output_bim.Location[0],
                                  building_out,
                                  'contains')
      
     
-    def _map_child_nodes_attributes(self,gbxml_node,bim_node):
+    def _map_child_nodes_attributes(self,_id,properties):
         "Maps child nodes with attributes only"
+        nodes=self.input_gbxml._nodes
         d={}
-        for cn in gbxml_node.child_nodes():
-            if cn.attributes and not cn.text and not cn.child_nodes():
-                tag=cn.labels[0]
-                for k,v in cn.attributes.items():
+        for c in self._child_ids(_id):
+            labels,p=nodes[c][:2]
+            if p['attributes'] and not p['text'] and not c in self._children:
+                tag=labels[0]
+                for k,v in p['attributes'].items():
                     key=tag+'_'+k
                     if key in d:
                         d[key].append(v)
                     else:
                         d[key]=[v]
         if d:
-            bim_node.properties.update(d)
+            properties.update(d)
         
         
-    def _map_child_nodes_text(self,gbxml_node,bim_node):
+    def _map_child_nodes_text(self,_id,properties):
         "Maps child nodes with text"
+        nodes=self.input_gbxml._nodes
         d={}
-        for cn in gbxml_node.child_nodes():
-            text=cn.text
+        for c in self._child_ids(_id):
+            labels,p=nodes[c][:2]
+            text=p['text']
             if text:
-                key=cn.labels[0]#.replace('-','')
+                key=labels[0]#.replace('-','')
                 if key in d:
                         if not isinstance(d[key],list):
                             d[key]=[d[key]]
@@ -104,20 +205,17 @@ class GbxmlToBimMap():
                 else:
                     d[key]=text
         if d:
-            bim_node.properties.update(d)
+            properties.update(d)
 
 
     def _map_construction(self,construction_out):
         "Maps a construction node"
-        #print(construction_out._node_tuple)
         k=1
         layer_out1_previous=None
         for i in construction_out.LayerId_layerIdRef:
             layer_out=self._bim_dict[i]
-            #print(layer_out._node_tuple)
             for j in layer_out.MaterialId_materialIdRef:
                 material_out=self._bim_dict[j]
-                #print(material_out._node_tuple)
                 
                 layer_out1=self.output_bim.add_node(
                     labels='Layer',
@@ -150,12 +248,13 @@ class GbxmlToBimMap():
                                          'has')
                 
 
-    def _map_coordinates(self,gbxml_node,bim_node):
+    def _map_coordinates(self,bim_node):
+        "Maps the coordinates of a Surface or Opening node"
         try:
-            c=gbxml_node.PlanarGeometry[0].coordinates()
-            bim_node.outer_vertices=c
-        except IndexError:
-            pass
+            i=self._geometry.index(bim_node.id)
+        except KeyError:
+            return
+        bim_node.outer_vertices=[tuple(x) for x in self._geometry.polygon(i).tolist()]
         
         
     def _map_gap(self,gap_out):
@@ -170,10 +269,8 @@ class GbxmlToBimMap():
         glaze_out.labels.append('WindowMaterialGlazing')
         
         
-    def _map_keys(self,bim_node):
+    def _map_keys(self,label,properties):
         "Changes the properties key names"
-        label=bim_node.labels[0]
-        properties=bim_node.properties
         try:
             for k,v in GbxmlToBimMap.map_keys[label].items():
                 try:
@@ -188,9 +285,9 @@ class GbxmlToBimMap():
         "Maps the edges of a Surface node"
         opening_in=self._gbxml_node(opening_out)
         
-        self._map_coordinates(opening_in,opening_out)
+        self._map_coordinates(opening_out)
         
-        surface_in=opening_in.parent_node()
+        surface_in=self._parent[opening_in]
         surface_out=self._bim_node(surface_in)
         self.output_bim.add_edge(surface_out,
                                  opening_out,
@@ -214,15 +311,27 @@ class GbxmlToBimMap():
             material_out.labels.append('MaterialAirGap')
     
     
+    def _map_properties(self,_id,label):
+        "Returns the properties of the bim node for a gbxml node"
+        properties={}
+        self._map_attributes(_id,properties)
+        self._map_child_nodes_text(_id,properties)
+        self._map_child_nodes_attributes(_id,properties)
+        self._map_keys(label,properties)
+        return properties
+
+
     def _map_schedule(self,schedule_out):
         "Maps a Schedule node"
         schedule_in=self._gbxml_node(schedule_out)
         seq=[]
-        for year_schedule_in in schedule_in.YearSchedule:
+        for year_schedule_in in self._child_ids(schedule_in,'YearSchedule'):
             year_schedule_out=self._bim_node(year_schedule_in)
             ps=self._map_schedule_YearSchedule(year_schedule_out)
             seq.append(ps)
         ys=YearSchedule(seq=seq) 
+        if self.schedule_pool is not None:
+            ys=self.schedule_pool.intern(ys)
         schedule_out.year_schedule=ys
     
     
@@ -263,7 +372,7 @@ class GbxmlToBimMap():
     def _map_space(self,space_out):
         "Maps a space node"
         space_in=self._gbxml_node(space_out)
-        building_in=space_in.parent_node()
+        building_in=self._parent[space_in]
         building_out=self._bim_node(building_in)
         self.output_bim.add_edge(building_out,space_out,'contains')
         
@@ -332,25 +441,28 @@ class GbxmlToBimMap():
                                      'has_fraction_schedule')
             
 
-    def _map_surface(self,surface_out,climate_out,ground_out):
+    def _map_surface(self,surface_out):
         "Maps the edges of a Surface node"
         surface_in=self._gbxml_node(surface_out)
         
-        self._map_coordinates(surface_in,surface_out)
+        self._map_coordinates(surface_out)
         
-        surface_out.tilt=surface_in.RectangularGeometry[0].Tilt[0].text
-        surface_out.azimuth=surface_in.RectangularGeometry[0].Azimuth[0].text
+        rectangular_geometry_in=self._child_ids(surface_in,'RectangularGeometry')[0]
+        surface_out.tilt=self._text(self._child_ids(rectangular_geometry_in,'Tilt')[0])
+        surface_out.azimuth=self._text(self._child_ids(rectangular_geometry_in,'Azimuth')[0])
         
-        surfaceType=surface_in.attributes.get('surfaceType')
+        surfaceType=surface_out.surfaceType
         if surfaceType in ['SlabOnGrade']:
-            adjacent_node=ground_out
+            adjacent_node=self._ground_out
         elif surfaceType in ['ExteriorWall','Roof']:
-            adjacent_node=climate_out
+            adjacent_node=self._climate_out
+
+        spaces_in=[self._gbxml_dict.get(self._attributes(x)['spaceIdRef'])
+                   for x in self._child_ids(surface_in,'AdjacentSpaceId')]
         
         #inner next_to
-        n=surface_in.surface_inner_object()
-        if n:
-            space_out=self._bim_node(n)
+        if len(spaces_in)>0 and spaces_in[0] is not None:
+            space_out=self._bim_node(spaces_in[0])
             self.output_bim.add_edge(surface_out,
                                      space_out,
                                      'inner_next_to')
@@ -360,9 +472,8 @@ class GbxmlToBimMap():
                                      'inner_next_to')
         
         #outer next_to
-        n=surface_in.surface_outer_object()
-        if n:
-            space_out=self._bim_node(n)
+        if len(spaces_in)>1 and spaces_in[1] is not None:
+            space_out=self._bim_node(spaces_in[1])
             self.output_bim.add_edge(surface_out,
                                      space_out,
                                      'outer_next_to')
@@ -379,10 +490,14 @@ class GbxmlToBimMap():
                                      construction_out,
                                      'has_construction')
         
-        #building edge
-        l=surface_in.surface_building_nodes()
-        for n in l:
-            building_out=self._bim_node(n)
+        #building edge, once for each building
+        buildings_in=[]
+        for space_in in spaces_in[:2]:
+            if space_in is None: continue
+            building_in=self._parent[space_in]
+            if building_in in buildings_in: continue
+            buildings_in.append(building_in)
+            building_out=self._bim_node(building_in)
             self.output_bim.add_edge(building_out,
                                      surface_out,
                                      'contains')
@@ -393,10 +508,12 @@ class GbxmlToBimMap():
         window_type_out.labels.clear()
         window_type_out.labels.append('Construction')
         window_type_in=self._gbxml_node(window_type_out)
-        materials_in=window_type_in.window_type_material_nodes()
+        nodes=self.input_gbxml._nodes
+        materials_in=[x for x in self._child_ids(window_type_in)
+                      if 'Glaze' in nodes[x][0] or 'Gap' in nodes[x][0]]
         layer_out_previous=None
         for material_in in materials_in:
-            material_id=material_in.attributes.get('id')
+            material_id=self._attributes(material_in).get('id')
             material_out=self._bim_dict[material_id]
             layer_id=material_id+'_layer'
             layer_element_id=layer_id+'_element'
@@ -434,8 +551,7 @@ class GbxmlToBimMap():
     
     def _map_zone(self,zone_out):
         "Maps a zone node"
-        zone_in=self._gbxml_node(zone_out)
-        spaces_in=zone_in.zone_space_node()
+        spaces_in=self._zone_spaces.get(zone_out.id,[])
         
         for space_in in spaces_in:
         
@@ -464,73 +580,100 @@ class GbxmlToBimMap():
                                      'has_heating_schedule')
             
         
+    def _prefetch(self):
+        """Indexes the gbxml graph in a single traversal
+
+        Sets self._children ({_id:[child _ids]}), self._parent
+            ({_id:parent _id}), self._gbxml_dict ({'id' attribute:_id}),
+            self._zone_spaces ({zone id:[space _ids]}) and self._geometry
+            (a PolygonArray of all Surface and Opening coordinates).
+
+        """
+        gbxml=self.input_gbxml
+        first_child={}
+        next_sibling={}
+        for start,end,name,_ in gbxml._edges.values():
+            if name=='first_child':
+                first_child[start]=end
+            elif name=='next_sibling':
+                next_sibling[start]=end
+        self._children={}
+        self._parent={}
+        for parent,child in first_child.items():
+            l=[]
+            while child is not None:
+                l.append(child)
+                self._parent[child]=parent
+                child=next_sibling.get(child)
+            self._children[parent]=l
+        self._gbxml_dict={}
+        self._zone_spaces={}
+        for _id,(labels,properties,_,_) in gbxml._nodes.items():
+            attributes=properties['attributes']
+            id1=attributes.get('id')
+            if id1: self._gbxml_dict[id1]=_id
+            if 'Space' in labels and 'zoneIdRef' in attributes:
+                self._zone_spaces.setdefault(attributes['zoneIdRef'],[]).append(_id)
+        self._geometry=PolygonArray.from_gbxml(gbxml)
+
+
+    def _run_rule(self,rule,*args):
+        "Runs a mapping rule and updates self.rule_stats"
+        t=time.perf_counter()
+        result=getattr(self,rule)(*args)
+        stats=self.rule_stats.setdefault(rule,[0,0.0])
+        stats[0]+=1
+        stats[1]+=time.perf_counter()-t
+        return result
+
+
+    def _text(self,_id):
+        "Returns the text of a gbxml node"
+        return self.input_gbxml._nodes[_id][1]['text']
+
+
+    def rule_report(self):
+        "Returns a DataFrame of the calls and time of each rule, slowest first"
+        df=pd.DataFrame.from_dict(self.rule_stats,
+                                  orient='index',
+                                  columns=['calls','time'])
+        df['time_per_call']=df['time']/df['calls']
+        return df.sort_values('time',ascending=False)
+
 
     def run(self):
         "Running the mapping, Bim object placed in self.output"
         
         o=self.output_bim=BimGraph()
-        self._gbxml_dict={}
         self._bim_dict={}
+        self.rule_stats={}
         
-        climate_out=o.add_node(labels='Climate')
-        ground_out=o.add_node(labels='Ground')
+        self._climate_out=o.add_node(labels='Climate')
+        self._ground_out=o.add_node(labels='Ground')
+
+        #Index the gbxml graph
+        self._run_rule('_prefetch')
         
         #Initial Node mappings
-        for n in self.input_gbxml.nodes:
-            id1=n.attributes.get('id')
-            if id1: self._gbxml_dict[id1]=n
-            label=n.labels[0]
-            if label in ['Location','Building','Space',
-                         'Surface','Opening',
-                         'Construction','Layer','Material',
-                         'WindowType','Glaze','Gap',
-                         'Zone',
-                         'Schedule','YearSchedule','WeekSchedule','DaySchedule'
-                         ]:
-                n1=o.add_node(labels=label)
+        node_labels=set(self.node_labels)
+        for _id,node_tuple in self.input_gbxml._nodes.items():
+            label=node_tuple[0][0]
+            if label in node_labels:
+                properties=self._run_rule('_map_properties',_id,label)
+                n1=o.add_node(labels=label,properties=properties)
+                id1=properties.get('id')
                 if id1: self._bim_dict[id1]=n1
-                self._map_attributes(n,n1)
-                self._map_child_nodes_text(n,n1)
-                self._map_child_nodes_attributes(n,n1)
-                self._map_keys(n1)
-        
-        #Edges and additional mapping
-        for n in o.nodes:
-            label=n.labels[0]
-            if label in 'Building':
-                self._map_building(n)
-            elif label in 'Space':
-                self._map_space(n)
-                self._map_space_People(n)
-                self._map_space_Light(n)
-                self._map_space_Appliance(n)
-            elif label in 'Zone':
-                self._map_zone(n)
-            elif label in 'Surface':
-                self._map_surface(n,climate_out,ground_out)
-            elif label in 'Opening':
-                self._map_opening(n)
-            elif label in 'Construction':
-                self._map_construction(n)
-            elif label in 'Material':
-                self._map_material(n)
-            elif label in 'WindowType':
-                self._map_window_type(n)
-            elif label in 'Glaze':
-                self._map_glaze(n)
-            elif label in 'Gap':
-                self._map_gap(n)
-            elif label in 'Schedule':
-                self._map_schedule(n)
-            for k,v in n.properties.items():
-                try:
-                    n.properties[k]=float(v)
-                except ValueError:
-                    pass
-                except TypeError:
-                    pass
+        
+        #Edges and additional mapping, in a single pass
+        for _id in list(o._nodes):
+            n=o._Node(_id)
+            for rule in self.rules.get(n.labels[0],[]):
+                self._run_rule(rule,n)
     
         o.remove_orphan_nodes()
+        
+        #Convert the properties to the schema types, and other numbers to floats
+        self.coerce_report=self._run_rule('_coerce')
 
 
     
@@ -551,6 +694,7 @@ if __name__=='__main__':
     bim=o.output_bim
     #pprint(bim.graph_dict()['edges'])
     pprint(bim.Surface[0]._node_tuple)
+    print(o.rule_report())
     
    
     #print(o.output_bim)
@@ -0,0 +1,368 @@
+# -*- coding: utf-8 -*-
+
+"""This module contains vectorised geometry calculations for building models
+
+A PolygonArray holds the vertices of many polygons, for example all the
+    surfaces and openings of a BimGraph, in a single packed NumPy array. The
+    vertices of polygon i are vertices[offsets[i]:offsets[i+1]]. Areas,
+    normals, tilts, azimuths and centroids are calculated for all polygons
+    in one pass.
+
+Conventions are the same as gbXML:
+    - the vertices are ordered anticlockwise when seen from outside, so the
+        normal points outwards
+    - tilt is 0 for a surface facing up, 90 for a wall and 180 for a
+        surface facing down
+    - azimuth is measured clockwise from the y axis of the model
+
+Example:
+    g=PolygonArray.from_bim(bim)
+    df=pd.DataFrame({'id':g.ids,
+                     'area':g.areas(),
+                     'tilt':g.tilts(),
+                     'azimuth':g.true_azimuths()})
+
+"""
+
+import numpy as np
+
+
+class PolygonArray():
+    """A packed array of 3D polygons
+
+    Attributes:
+        - vertices (np.ndarray): a (n_vertices,3) array of all vertices
+        - offsets (np.ndarray): a (n_polygons+1,) array of the index of the
+            first vertex of each polygon, and the total number of vertices
+        - ids (list): the id of each polygon
+        - labels (list): the label of each polygon, i.e. 'Surface' or
+            'Opening'
+        - parents (np.ndarray): the index of the polygon which contains each
+            polygon (i.e. the Surface of an Opening) or -1
+        - north_axis (float): the angle of the model y axis clockwise from
+            true north, in degrees (the Building orientation or gbXML
+            CADModelAzimuth)
+
+    """
+
+    def __init__(self,vertices=None,offsets=None,ids=None,labels=None,
+                 parents=None,north_axis=0.0):
+        self.vertices=np.zeros((0,3)) if vertices is None else np.asarray(vertices,dtype=float)
+        self.offsets=np.zeros(1,dtype=np.int64) if offsets is None else np.asarray(offsets,dtype=np.int64)
+        n=len(self.offsets)-1
+        self.ids=list(range(n)) if ids is None else list(ids)
+        self.labels=[None]*n if labels is None else list(labels)
+        self.parents=np.full(n,-1) if parents is None else np.asarray(parents)
+        self.north_axis=north_axis
+        self._index=None
+
+
+    def __len__(self):
+        return len(self.offsets)-1
+
+
+    def __repr__(self):
+        return 'PolygonArray(polygons={}, vertices={})'.format(len(self),
+                                                                 len(self.vertices))
+
+
+    @classmethod
+    def from_polygons(cls,polygons,**kwargs):
+        """Returns a PolygonArray from a list of polygons
+
+        Arguments:
+            - polygons (list): a list of polygons, each a list of (x,y,z)
+                vertices
+            - kwargs: passed to PolygonArray
+
+        """
+        counts=[len(p) for p in polygons]
+        offsets=np.zeros(len(polygons)+1,dtype=np.int64)
+        np.cumsum(counts,out=offsets[1:])
+        vertices=np.array([v for p in polygons for v in p],dtype=float).reshape(-1,3)
+        return cls(vertices=vertices,offsets=offsets,**kwargs)
+
+
+    @classmethod
+    def from_bim(cls,bim,labels=('Surface','Opening')):
+        """Returns a PolygonArray of the outer_vertices of a BimGraph
+
+        The ids are the graph node _ids. The north_axis is the Building
+            orientation.
+
+        """
+        nodes=bim._nodes
+        edges=bim._edges
+        polygons=[]
+        _ids=[]
+        labels1=[]
+        for _id,(node_labels,properties,_,_) in nodes.items():
+            for label in labels:
+                if label in node_labels:
+                    vertices=properties.get('outer_vertices')
+                    if vertices is None: break
+                    polygons.append(vertices)
+                    _ids.append(_id)
+                    labels1.append(label)
+                    break
+        index={_id:i for i,_id in enumerate(_ids)}
+        parents=np.full(len(_ids),-1)
+        for i,_id in enumerate(_ids):
+            for e in nodes[_id][2]:
+                start,end,name=edges[e][:3]
+                if name=='contains' and start in index:
+                    parents[i]=index[start]
+        north_axis=0.0
+        for n in bim.Building:
+            north_axis=float(n.properties.get('orientation') or 0.0)
+        return cls.from_polygons(polygons,
+                                 ids=_ids,
+                                 labels=labels1,
+                                 parents=parents,
+                                 north_axis=north_axis)
+
+
+    @classmethod
+    def from_gbxml(cls,gbxml,labels=('Surface','Opening')):
+        """Returns a PolygonArray of the PlanarGeometry of a GbxmlGraph
+
+        All coordinates are read in a single pass over the graph and
+            converted to floats in one operation. The ids are the gbXML 'id'
+            attributes. The north_axis is the CADModelAzimuth.
+
+        """
+        nodes=gbxml._nodes
+        first_child={}
+        next_sibling={}
+        for start,end,name,_ in gbxml._edges.values():
+            if name=='first_child':
+                first_child[start]=end
+            elif name=='next_sibling':
+                next_sibling[start]=end
+
+        def children(_id,label=None):
+            l=[]
+            c=first_child.get(_id)
+            while c is not None:
+                if label is None or label in nodes[c][0]:
+                    l.append(c)
+                c=next_sibling.get(c)
+            return l
+
+        texts=[]
+        counts=[]
+        ids=[]
+        labels1=[]
+        parents=[]
+        index={}
+        north_axis=0.0
+        for _id,(node_labels,properties,_,_) in nodes.items():
+            if 'CADModelAzimuth' in node_labels:
+                north_axis=float(properties['text'])
+                continue
+            label=[x for x in labels if x in node_labels]
+            if not label: continue
+            geometry=children(_id,'PlanarGeometry')
+            if not geometry: continue
+            n=0
+            for loop in children(geometry[0],'PolyLoop'):
+                for point in children(loop,'CartesianPoint'):
+                    texts.extend(nodes[c][1]['text'] for c in children(point,'Coordinate'))
+                    n+=1
+            index[_id]=len(ids)
+            ids.append(properties['attributes'].get('id'))
+            labels1.append(label[0])
+            counts.append(n)
+            parents.append(_id)
+        # the parent is the nearest ancestor which is also a polygon
+        parent_of={}
+        for parent,child in first_child.items():
+            c=child
+            while c is not None:
+                parent_of[c]=parent
+                c=next_sibling.get(c)
+        for i,_id in enumerate(parents):
+            p=parent_of.get(_id)
+            while p is not None and not p in index:
+                p=parent_of.get(p)
+            parents[i]=index[p] if p is not None else -1
+        offsets=np.zeros(len(counts)+1,dtype=np.int64)
+        np.cumsum(counts,out=offsets[1:])
+        vertices=np.array(texts,dtype=float).reshape(-1,3)
+        return cls(vertices=vertices,
+                   offsets=offsets,
+                   ids=ids,
+                   labels=labels1,
+                   parents=parents,
+                   north_axis=north_axis)
+
+
+    def _polygon_index(self):
+        "Returns the polygon index of each vertex"
+        return np.repeat(np.arange(len(self)),np.diff(self.offsets))
+
+
+    def _next_vertex(self):
+        "Returns the index of the next vertex of each vertex, within each polygon"
+        i=np.arange(len(self.vertices))+1
+        ends=self.offsets[1:]
+        starts=self.offsets[:-1]
+        nonempty=ends>starts
+        i[ends[nonempty]-1]=starts[nonempty]
+        return i
+
+
+    def _sum_polygons(self,a):
+        "Returns the sum of the vertex values a for each polygon"
+        out=np.zeros((len(self),)+a.shape[1:])
+        np.add.at(out,self._polygon_index(),a)
+        return out
+
+
+    def index(self,id1):
+        "Returns the position of a polygon from its id"
+        if self._index is None:
+            self._index={x:i for i,x in enumerate(self.ids)}
+        return self._index[id1]
+
+
+    def polygon(self,i):
+        "Returns the vertices of polygon i as an array"
+        return self.vertices[self.offsets[i]:self.offsets[i+1]]
+
+
+    def flat_vertices(self,i):
+        "Returns the vertices of polygon i as a flat list [x1,y1,z1,x2,...]"
+        return self.polygon(i).ravel().tolist()
+
+
+    def to_polygons(self):
+        "Returns a list of polygons, each a list of (x,y,z) tuples"
+        l=[tuple(x) for x in self.vertices.tolist()]
+        return [l[a:b] for a,b in zip(self.offsets[:-1],self.offsets[1:])]
+
+
+    def newell_vectors(self):
+        "Returns the Newell normal vectors, with a length of twice the area"
+        v=self.vertices
+        return self._sum_polygons(np.cross(v,v[self._next_vertex()]))
+
+
+    def areas(self):
+        "Returns the area of each polygon"
+        return 0.5*np.linalg.norm(self.newell_vectors(),axis=1)
+
+
+    def normals(self):
+        "Returns the unit normal vector of each polygon"
+        n=self.newell_vectors()
+        length=np.linalg.norm(n,axis=1)
+        return np.divide(n,length[:,None],out=np.zeros_like(n),where=length[:,None]>0)
+
+
+    def tilts(self):
+        "Returns the tilt of each polygon in degrees"
+        return np.degrees(np.arccos(np.clip(self.normals()[:,2],-1.0,1.0)))
+
+
+    def azimuths(self):
+        """Returns the azimuth of each polygon in degrees
+
+        The azimuth is clockwise from the model y axis. Horizontal polygons
+            have an azimuth of 0.
+
+        """
+        n=self.normals()
+        horizontal=np.hypot(n[:,0],n[:,1])<1e-9
+        a=np.degrees(np.arctan2(n[:,0],n[:,1]))%360.0
+        a[horizontal]=0.0
+        return a
+
+
+    def true_azimuths(self):
+        "Returns the azimuth of each polygon clockwise from true north"
+        return (self.azimuths()+self.north_axis)%360.0
+
+
+    def centroids(self):
+        """Returns the area weighted centroid of each polygon
+
+        Uses a fan of triangles from the first vertex, so is correct for
+            non-convex planar polygons. Polygons with no area return the
+            mean of their vertices.
+
+        """
+        v=self.vertices
+        p=self._polygon_index()
+        v0=v[self.offsets[:-1]][p]
+        v1=v
+        v2=v[self._next_vertex()]
+        n=self.normals()[p]
+        a=0.5*(np.cross(v1-v0,v2-v0)*n).sum(axis=1)  # signed triangle areas
+        c=self._sum_polygons(a[:,None]*(v0+v1+v2)/3.0)
+        area=self._sum_polygons(a)
+        counts=np.diff(self.offsets)
+        mean=np.divide(self._sum_polygons(v),np.maximum(counts,1)[:,None])
+        return np.where(np.abs(area)[:,None]>1e-12,
+                        c/np.where(area==0,1.0,area)[:,None],
+                        mean)
+
+
+    def rotated(self,angle=None,origin=(0.0,0.0,0.0)):
+        """Returns a copy with all vertices rotated about a vertical axis
+
+        The rotation is clockwise when seen from above, so the azimuth of
+            every polygon increases by angle.
+
+        Arguments:
+            - angle (float): the rotation in degrees. If None then the
+                north_axis is used, giving a copy in true north coordinates
+                with a north_axis of 0.
+            - origin (tuple): a point on the axis of rotation
+
+        """
+        north_axis=self.north_axis
+        if angle is None:
+            angle=north_axis
+            north_axis=0.0
+        t=np.radians(angle)
+        origin=np.asarray(origin,dtype=float)
+        v=self.vertices-origin
+        m=np.array([[np.cos(t),-np.sin(t),0.0],
+                    [np.sin(t),np.cos(t),0.0],
+                    [0.0,0.0,1.0]])
+        return PolygonArray(vertices=v@m+origin,
+                            offsets=self.offsets.copy(),
+                            ids=self.ids,
+                            labels=self.labels,
+                            parents=self.parents.copy(),
+                            north_axis=north_axis)
+
+
+
+# tests
+
+if __name__=='__main__':
+    import time
+    from gbxml_graph import GbxmlGraph
+    from gbxml_to_bim_map import GbxmlToBimMap
+
+    print('TEST-PolygonArray')
+
+    gbxml=GbxmlGraph()
+    gbxml.read_xml(r'../01_D-original_gbXML/detached_house.gbxml')
+
+    t=time.time()
+    g=PolygonArray.from_gbxml(gbxml)
+    print('from_gbxml',time.time()-t,g)
+    print(g.areas()[:5],g.tilts()[:5],g.azimuths()[:5])
+    print(g.centroids()[:2])
+    walls=np.isclose(g.tilts(),90)
+    d=(g.rotated(90).azimuths()[walls]-g.azimuths()[walls]-90+180)%360-180
+    print(np.allclose(d,0))
+
+    o=GbxmlToBimMap()
+    o.input_gbxml=gbxml
+    o.run()
+    g1=PolygonArray.from_bim(o.output_bim)
+    print(g1,np.allclose(g1.areas(),g.areas()))
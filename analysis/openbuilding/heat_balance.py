@@ -0,0 +1,465 @@
+# -*- coding: utf-8 -*-
+
+"""This module contains a simplified heat balance model of BimGraphs
+
+MonthlyHeatBalance is a quasi-steady-state monthly heating model based on
+    the ISO 13790 monthly method. It is intended for screening large numbers
+    of buildings where EnergyPlus is too slow. The geometry, constructions,
+    infiltration, internal gains and heating setpoints are read from each
+    BimGraph into arrays and the heat balance of every space in every
+    building is then solved in a single vectorised pass.
+
+The results are placed on the BimGraph nodes as Variables with the same
+    names and units as those set by EsoToBimMap, so the same analysis code
+    can be used for simulated and estimated results.
+
+Simplifications:
+    - surfaces between spaces are adiabatic
+    - ground floors lose heat to the monthly ground temperature through the
+        construction U-value, with no ISO 13370 ground resistance
+    - solar gains are through openings only, with an isotropic sky, and no
+        external shading or sky radiation losses
+    - the effective heat capacity is a fixed value per floor area
+    - the setpoint is the daily mean of the heating schedule, and days with a
+        setpoint of zero or less are unheated
+
+Example:
+    o=MonthlyHeatBalance()
+    o.bims=[bim]  # each with Variables on the Climate node, i.e. from EpwReader
+    o.run()
+    print(o.results)
+    print(bim.RoomHeater[0].heating_energy)
+
+"""
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .timeseries import IntervalTimeSeries, Variable
+except ImportError:
+    from timeseries import IntervalTimeSeries, Variable
+
+try:
+    from .geometry import PolygonArray
+except ImportError:
+    from geometry import PolygonArray
+
+try:
+    from .construction_array import ConstructionArray
+except ImportError:
+    from construction_array import ConstructionArray
+
+
+class MonthlyHeatBalance():
+    """A monthly heat balance model of the spaces of one or more BimGraphs
+
+    Attributes:
+        - bims (list): the BimGraphs to model. The results are placed on the
+            nodes of these BimGraphs.
+        - heat_capacity_per_area (float): the effective internal heat
+            capacity per floor area (J/m2K), default is the ISO 13790
+            'medium' class
+        - g_value (float): the total solar energy transmittance of glazing
+        - frame_fraction (float): the frame area fraction of openings
+        - ground_reflectance (float): the albedo for reflected solar
+        - r_si, r_se (float): the surface resistances (m2K/W) used when a
+            construction has no 'uvalue' property
+        - r_air_gap (float): the resistance of an air gap layer (m2K/W)
+        - results (pd.DataFrame): the annual results of each space
+
+    """
+
+    rho_c_air=1200.0  # J/m3K
+
+    def __init__(self):
+        self.bims=[]
+        self.heat_capacity_per_area=165000.0
+        self.g_value=0.63
+        self.frame_fraction=0.0
+        self.ground_reflectance=0.2
+        self.r_si=0.13
+        self.r_se=0.04
+        self.r_air_gap=0.18
+        self.results=None
+
+
+    @staticmethod
+    def _out(nodes,edges,_id,name):
+        "Returns the _ids of the end nodes of the out edges called name"
+        return [edges[e][1] for e in nodes[_id][3] if edges[e][2]==name]
+
+
+    def _schedule_daily_means(self,nodes,_id):
+        "Returns the daily means of a Schedule node, cached by schedule"
+        ys=nodes[_id][1]['year_schedule']
+        a=self._schedules.get(id(ys))
+        if a is None:
+            hourly=ys.to_array(timestep=1,year=self._days[0].year)
+            a=self._schedules[id(ys)]=hourly.reshape(len(self._days),24).mean(axis=1)
+        return a
+
+
+    def _location(self,bim):
+        "Returns (latitude,longitude,time_zone) from the Climate or Location node"
+        for label,keys in (('Climate',('latitude','longitude','time_zone')),
+                           ('Location',('Latitude','Longitude','TimeZone'))):
+            for n in bim.filter_nodes_by_label(label):
+                p=n.properties
+                if p.get(keys[0]) is not None and p.get(keys[1]) is not None:
+                    lat=float(p[keys[0]])
+                    lon=float(p[keys[1]])
+                    tz=p.get(keys[2])
+                    tz=float(tz) if tz is not None else round(lon/15.0)
+                    return lat,lon,tz
+        raise ValueError('No latitude and longitude on the Climate or Location node')
+
+
+    def _climate(self,bim):
+        """Returns a dict of the processed climate data of a BimGraph
+
+        Uses the air_drybulb_temperature, direct_solar_radiation and
+            diffuse_solar_radiation Variables of the Climate node. The result
+            is cached by the time series objects, so BimGraphs sharing
+            interned climate series are only processed once.
+
+        """
+        climate=bim.Climate[0]
+        variables=[climate.properties.get(k) for k in ('air_drybulb_temperature',
+                                                       'direct_solar_radiation',
+                                                       'diffuse_solar_radiation')]
+        if any(not isinstance(v,Variable) for v in variables):
+            raise ValueError('The Climate node needs air_drybulb_temperature, '
+                             'direct_solar_radiation and diffuse_solar_radiation Variables')
+        location=self._location(bim)
+        key=tuple(id(v.ts) for v in variables)+location
+        if key in self._climates:
+            return self._climates[key]
+
+        s=variables[0].ts.series
+        index=s.index
+        step=np.median((index[1:]-index[:-1]).total_seconds())  # seconds
+        month=index.month.to_numpy()-1
+        m=np.zeros((12,len(index)))
+        m[month,np.arange(len(index))]=1.0
+        counts=m.sum(axis=1)
+        theta_e=m@s.to_numpy(dtype=float)/counts
+
+        ground=climate.properties.get('surface_ground_temperature')
+        if isinstance(ground,Variable):
+            g=ground.ts.series
+            mg=np.zeros((12,len(g)))
+            mg[g.index.month.to_numpy()-1,np.arange(len(g))]=1.0
+            theta_g=mg@g.to_numpy(dtype=float)/mg.sum(axis=1)
+        elif climate.properties.get('ground_temperatures') is not None:
+            theta_g=np.asarray(climate.ground_temperatures,dtype=float)
+        else:
+            theta_g=np.full(12,s.mean())
+
+        #SUN POSITION at the middle of each interval
+        lat,lon,tz=location
+        mid=index+pd.Timedelta(seconds=step/2.0)
+        doy=mid.dayofyear.to_numpy()
+        hour=(mid.hour+mid.minute/60.0).to_numpy()
+        b=2*np.pi*(doy-1)/365.0
+        decl=(0.006918-0.399912*np.cos(b)+0.070257*np.sin(b)
+              -0.006758*np.cos(2*b)+0.000907*np.sin(2*b)
+              -0.002697*np.cos(3*b)+0.00148*np.sin(3*b))
+        eot=229.18*(0.000075+0.001868*np.cos(b)-0.032077*np.sin(b)
+                    -0.014615*np.cos(2*b)-0.04089*np.sin(2*b))
+        solar_time=hour+(4*(lon-15*tz)+eot)/60.0
+        omega=np.radians(15*(solar_time-12))
+        phi=np.radians(lat)
+        sun=np.array([-np.cos(decl)*np.sin(omega),  # east
+                      np.sin(decl)*np.cos(phi)-np.cos(decl)*np.sin(phi)*np.cos(omega),  # north
+                      np.sin(decl)*np.sin(phi)+np.cos(decl)*np.cos(phi)*np.cos(omega)])  # up
+        sun[:,sun[2]<=0]=0.0
+
+        d={'step':step,
+           'm':m,
+           'theta_e':theta_e,
+           'theta_g':theta_g,
+           'sun':sun,
+           'dni':variables[1].ts.series.to_numpy(dtype=float),
+           'dhi':variables[2].ts.series.to_numpy(dtype=float)}
+        self._climates[key]=d
+        return d
+
+
+    def _monthly_irradiation(self,climate,tilt,azimuth):
+        """Returns the monthly solar irradiation on surfaces (J/m2)
+
+        Arguments:
+            - climate (dict): from self._climate
+            - tilt, azimuth (array): the surface tilts (0 is facing up) and
+                true azimuths (clockwise from north) in degrees
+
+        Returns an array of shape (len(tilt),12)
+
+        """
+        beta=np.radians(tilt)
+        alpha=np.radians(azimuth)
+        normal=np.column_stack([np.sin(beta)*np.sin(alpha),
+                                np.sin(beta)*np.cos(alpha),
+                                np.cos(beta)])
+        cos_incidence=np.maximum(normal@climate['sun'],0.0)  # (k,t)
+        dni=climate['dni']
+        dhi=climate['dhi']
+        ghi=dni*climate['sun'][2]+dhi
+        i=(dni*cos_incidence
+           +dhi*((1+np.cos(beta))/2.0)[:,None]
+           +self.ground_reflectance*ghi*((1-np.cos(beta))/2.0)[:,None])
+        return i@climate['m'].T*climate['step']
+
+
+    def _extract(self,b,bim):
+        "Adds the spaces, surfaces and openings of a BimGraph to the arrays"
+        nodes=bim._nodes
+        edges=bim._edges
+        out=self._out
+        relations=bim.relations()
+        c=ConstructionArray.from_bim(bim)
+        c.r_si=self.r_si
+        c.r_se=self.r_se
+        c.r_air_gap=self.r_air_gap
+        constructions=dict(zip(c._ids,c.u_values()))
+        for _id in constructions:
+            if nodes[_id][1].get('uvalue') is not None:
+                constructions[_id]=float(nodes[_id][1]['uvalue'])
+
+        def u_value(_id):
+            return constructions.get(relations.constructions.get(_id),0.0)
+
+        geometry=PolygonArray.from_bim(bim)
+        areas=dict(zip(geometry.ids,geometry.areas()))
+        tilts=dict(zip(geometry.ids,geometry.tilts()))
+        azimuths=dict(zip(geometry.ids,geometry.true_azimuths()))
+        climate_key=len(self._climate_keys)
+        self._climate_keys.append(self._climate(bim))
+
+        spaces=self._spaces
+        space_index={}
+        for _id,(labels,p,_,_) in nodes.items():
+            if not 'Space' in labels: continue
+            space_index[_id]=i=len(spaces['_id'])
+            spaces['bim'].append(b)
+            spaces['_id'].append(_id)
+            spaces['id'].append(p.get('id'))
+            spaces['climate'].append(climate_key)
+            spaces['area'].append(float(p.get('area') or 0.0))
+            spaces['volume'].append(float(p.get('volume') or 0.0))
+            spaces['infiltration'].append(float(p.get('infiltration') or 0.0))
+            gains={'People':np.zeros(365),'Light':np.zeros(365),'Appliance':np.zeros(365)}
+            heaters=[]
+            setpoint=np.zeros(365)
+            for _id1 in out(nodes,edges,_id,'has_people')+out(nodes,edges,_id,'contains'):
+                labels1,p1=nodes[_id1][:2]
+                if 'People' in labels1:
+                    w=float(p1.get('number_of_people') or 0)*float(p1.get('heat_gain_per_person') or 0)
+                    label='People'
+                elif 'Light' in labels1 or 'Appliance' in labels1:
+                    w=float(p1.get('power_per_area') or 0)*spaces['area'][i]
+                    label='Light' if 'Light' in labels1 else 'Appliance'
+                elif 'RoomHeater' in labels1:
+                    heaters.append(_id1)
+                    s=relations.schedules.get(_id1,{}).get('has_heating_schedule')
+                    if s is not None:
+                        setpoint=self._schedule_daily_means(nodes,s)
+                    continue
+                else:
+                    continue
+                s=relations.schedules.get(_id1,{}).get('has_fraction_schedule')
+                fraction=self._schedule_daily_means(nodes,s) if s is not None else 1.0
+                gains[label]=gains[label]+w*fraction
+            for k,v in gains.items():
+                spaces[k].append(v)
+            spaces['setpoint'].append(setpoint if heaters else np.zeros(365))
+            spaces['heaters'].append(heaters)
+
+        elements=self._elements
+        for _id,(labels,p,_,_) in nodes.items():
+            if not 'Surface' in labels: continue
+            adjacent=[x for x in (relations.inner_next_to.get(_id),relations.outer_next_to.get(_id))
+                      if x is not None]
+            space=[x for x in adjacent if x in space_index]
+            other=[x for x in adjacent if not x in space_index]
+            if len(space)!=1 or not other: continue  # internal surface
+            ground='Ground' in nodes[other[0]][0]
+            area=areas.get(_id,0.0)
+            for _id1 in out(nodes,edges,_id,'contains'):
+                if not _id1 in areas: continue
+                area-=areas[_id1]
+                elements['space'].append(space_index[space[0]])
+                elements['area'].append(areas[_id1])
+                elements['u'].append(u_value(_id1))
+                elements['ground'].append(False)
+                elements['opening'].append(True)
+                elements['tilt'].append(tilts[_id1])
+                elements['azimuth'].append(azimuths[_id1])
+            elements['space'].append(space_index[space[0]])
+            elements['area'].append(max(area,0.0))
+            elements['u'].append(u_value(_id))
+            elements['ground'].append(ground)
+            elements['opening'].append(False)
+            elements['tilt'].append(tilts.get(_id,0.0))
+            elements['azimuth'].append(azimuths.get(_id,0.0))
+
+
+    def _write(self,bim,_id,name,data,units,method):
+        "Places a monthly Variable on a node"
+        ts=IntervalTimeSeries(series=pd.Series(index=self._months,data=data),
+                              interval='1MS',
+                              method=method)
+        setattr(bim._Node(_id),name,Variable(name=name,ts=ts,units=units))
+
+
+    def run(self):
+        "Runs the heat balance and places the results on the BimGraphs"
+        self._days=pd.date_range('2001-01-01','2001-12-31',freq='D')
+        self._months=pd.date_range('2001-01-01',periods=12,freq='MS')
+        self._schedules={}
+        self._climates={}
+        self._climate_keys=[]
+        self._spaces={k:[] for k in ('bim','_id','id','climate','area','volume',
+                                     'infiltration','People','Light','Appliance',
+                                     'setpoint','heaters')}
+        self._elements={k:[] for k in ('space','area','u','ground','opening',
+                                       'tilt','azimuth')}
+        for b,bim in enumerate(self.bims):
+            self._extract(b,bim)
+
+        spaces={k:np.asarray(v) if k!='heaters' else v
+                for k,v in self._spaces.items()}
+        elements={k:np.asarray(v) for k,v in self._elements.items()}
+        n=len(spaces['_id'])
+        if n==0:
+            self.results=pd.DataFrame()
+            return self.results
+        day_month=self._days.month.to_numpy()-1
+        dm=np.zeros((365,12))
+        dm[np.arange(365),day_month]=1.0
+        days_in_month=dm.sum(axis=0)
+        t=days_in_month*86400.0  # seconds in each month
+
+        #CLIMATE (n,12)
+        theta_e=np.array([c['theta_e'] for c in self._climate_keys])[spaces['climate']]
+        theta_g=np.array([c['theta_g'] for c in self._climate_keys])[spaces['climate']]
+
+        #HEAT TRANSFER COEFFICIENTS (n,)
+        space=elements['space'].astype(int) if len(elements['space']) else np.zeros(0,int)
+        ua=elements['u']*elements['area'] if len(space) else np.zeros(0)
+        ground=elements['ground'].astype(bool) if len(space) else np.zeros(0,bool)
+        h_tr=np.bincount(space[~ground],weights=ua[~ground],minlength=n)
+        h_g=np.bincount(space[ground],weights=ua[ground],minlength=n)
+        h_ve=self.rho_c_air/3600.0*spaces['infiltration']*spaces['volume']
+
+        #SOLAR GAINS (n,12)
+        q_sol=np.zeros((n,12))
+        opening=elements['opening'].astype(bool) if len(space) else np.zeros(0,bool)
+        climate=spaces['climate'][space[opening]]
+        tilt=elements['tilt'][opening] if len(space) else np.zeros(0)
+        azimuth=elements['azimuth'][opening] if len(space) else np.zeros(0)
+        irradiation=np.zeros((len(climate),12))
+        for c in np.unique(climate):
+            mask=climate==c
+            pairs,inverse=np.unique(np.round(np.column_stack([tilt[mask],azimuth[mask]]),1),
+                                    axis=0,return_inverse=True)
+            irradiation[mask]=self._monthly_irradiation(self._climate_keys[c],
+                                                        pairs[:,0],
+                                                        pairs[:,1])[inverse.ravel()]
+        a_sol=self.g_value*(1-self.frame_fraction)*elements['area'][opening] if len(space) else np.zeros(0)
+        np.add.at(q_sol,space[opening],a_sol[:,None]*irradiation)
+
+        #INTERNAL GAINS (n,12) mean W
+        people=spaces['People']@dm/days_in_month
+        light=spaces['Light']@dm/days_in_month
+        appliance=spaces['Appliance']@dm/days_in_month
+        q_int=(people+light+appliance)*t
+
+        #SETPOINTS (n,12)
+        on=spaces['setpoint']>0
+        f_on=on.astype(float)@dm/days_in_month
+        theta_i=np.divide((spaces['setpoint']*on)@dm,on.astype(float)@dm,
+                          out=np.zeros((n,12)),where=f_on>0)
+
+        #HEAT BALANCE
+        q_tr=(h_tr[:,None]*(theta_i-theta_e)+h_g[:,None]*(theta_i-theta_g))*t
+        q_ve=h_ve[:,None]*(theta_i-theta_e)*t
+        q_ht=q_tr+q_ve
+        q_gn=q_int+q_sol
+        h=h_tr+h_g+h_ve
+        tau=np.divide(self.heat_capacity_per_area*spaces['area'],h*3600.0,
+                      out=np.zeros(n),where=h>0)  # hours
+        a=(1.0+tau/15.0)[:,None]
+        heated=(q_ht>0)&(f_on>0)
+        gamma=np.divide(q_gn,q_ht,out=np.ones((n,12)),where=heated)
+        with np.errstate(over='ignore',invalid='ignore',divide='ignore'):
+            eta=np.where(np.abs(gamma-1.0)<1e-9,
+                         a/(a+1.0),
+                         (1.0-gamma**a)/(1.0-gamma**(a+1.0)))
+        eta=np.nan_to_num(eta,nan=0.0)
+        q_h=np.where(heated,np.maximum(q_ht-eta*q_gn,0.0),0.0)*f_on
+        self.heating_energy=q_h
+
+        #WRITE RESULTS
+        for i in range(n):
+            bim=self.bims[spaces['bim'][i]]
+            _id=spaces['_id'][i]
+            self._write(bim,_id,'people_heat_gain',people[i]*t,'J','sum')
+            self._write(bim,_id,'light_heat_gain',light[i]*t,'J','sum')
+            self._write(bim,_id,'appliance_heat_gain',appliance[i]*t,'J','sum')
+            self._write(bim,_id,'internal_heat_gain',q_int[i],'J','sum')
+            self._write(bim,_id,'solar_gain',q_sol[i],'J','sum')
+            heaters=spaces['heaters'][i]
+            if not heaters: continue
+            self._write(bim,_id,'infiltration_heat_loss',np.maximum(q_ve[i]*f_on[i],0.0),'J','sum')
+            self._write(bim,_id,'thermostat_setpoint',theta_i[i],'C','mean')
+            for _id1 in heaters:
+                q=q_h[i]/len(heaters)
+                self._write(bim,_id1,'heating_energy',q,'J','sum')
+                if bim._nodes[_id1][1].get('fuel_type')=='Electric':
+                    self._write(bim,_id1,'electric_energy',q,'J','sum')
+
+        self.results=pd.DataFrame({'bim':spaces['bim'],
+                                   'id':spaces['id'],
+                                   'H_tr':h_tr,
+                                   'H_ground':h_g,
+                                   'H_ve':h_ve,
+                                   'time_constant':tau,
+                                   'internal_heat_gain':q_int.sum(axis=1),
+                                   'solar_gain':q_sol.sum(axis=1),
+                                   'heating_energy':q_h.sum(axis=1)})
+        return self.results
+
+
+
+# tests
+
+if __name__=='__main__':
+    import time
+    from gbxml_graph import GbxmlGraph
+    from gbxml_to_bim_map import GbxmlToBimMap
+    from epw_reader import EpwReader
+
+    print('TEST-MonthlyHeatBalance')
+
+    gbxml=GbxmlGraph()
+    gbxml.read_xml(r'../01_D-original_gbXML/detached_house.gbxml')
+    epw=EpwReader(r'../04_C-run_energyplus/GBR_Birmingham.035340_IWEC.epw')
+    bims=[]
+    for orientation in range(0,360,5):
+        o=GbxmlToBimMap()
+        o.input_gbxml=gbxml
+        o.run()
+        bim=o.output_bim
+        bim.Building[0].orientation=float(orientation)
+        epw.map_climate(bim)
+        bims.append(bim)
+
+    o=MonthlyHeatBalance()
+    o.bims=bims
+    t=time.time()
+    o.run()
+    print('run',time.time()-t)
+    print(o.results.groupby('bim').heating_energy.sum().describe()/3.6e9)  # MWh
+    print(bims[0].RoomHeater[0].heating_energy.ts.series/3.6e6)  # kWh
@@ -18,20 +18,18 @@ class IdfGraph(Graph):
 
     def first_node(self):
         "Returns the first node in the graph"
-        nodes=self.nodes
-        if not nodes: return None
-        for n in nodes:
-            if not n.in_edges:
-                return n
+        for _id,node_tuple in self._nodes.items():
+            if not node_tuple[2]:
+                return self._Node(_id)
+        return None
 
 
     def last_node(self):
         "Returns the last node in the graph"
-        nodes=self.nodes
-        if not nodes: return None
-        for n in reversed(nodes):
-            if not n.out_edges:
-                return n
+        for _id in reversed(self._nodes):
+            if not self._nodes[_id][3]:
+                return self._Node(_id)
+        return None
 
 
     def add_node(self,
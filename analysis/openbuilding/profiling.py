@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+
+"""This module contains timers and counters for profiling the pipeline
+
+A Profiler records one dict per stage of a run, i.e. 'gbxml_to_bim',
+    'bim_to_idf', 'write_idf', 'energyplus' (ExpandObjects and EnergyPlus),
+    'read_eso' and 'eso_to_bim' for EnergyPlusModel.run_gbxml. Each record
+    has the wall time, the CPU time of this process, the CPU time of the
+    child processes (i.e. EnergyPlus) and any counters added by the stage,
+    such as the number of nodes and edges of a graph or the bytes read and
+    written.
+
+A stage that starts when no other stage is running starts a new run, and the
+    stages inside it are recorded with their parent stage, so the records
+    of many runs, i.e. of a sweep over many buildings, can be grouped by run.
+
+Example:
+    with profiler.stage('read_xml') as record:
+        gbxml.read_xml(fp)
+        record.update(graph_counters(gbxml),bytes_read=file_size(fp))
+
+    @profiler.stage('my_function')
+    def my_function():
+        ...
+
+    df=profiler.to_dataframe()
+    profiler.write_json_lines('profile.jsonl')
+
+"""
+
+import collections
+import contextlib
+import contextvars
+import datetime
+import json
+import os
+import time
+
+import numpy as np
+
+
+class Profiler():
+    """A registry of the timings and counters of the stages of runs
+
+    Attributes:
+        - records (collections.deque): a dict for each completed stage, in 
+            the order the stages ended. If maxlen is given only the latest 
+            maxlen records are kept, so a long sweep does not use more and 
+            more memory.
+        - enabled (bool): if False, stages are not timed or recorded
+
+    """
+
+    def __init__(self,maxlen=None):
+        self.records=collections.deque(maxlen=maxlen)
+        self.enabled=True
+        self._run_count=0
+        self._stack=contextvars.ContextVar('stack',default=())  # the running stage records
+
+
+    def __len__(self):
+        return len(self.records)
+
+
+    def clear(self):
+        "Removes all records"
+        self.records.clear()
+
+
+    @contextlib.contextmanager
+    def stage(self,name,**counters):
+        """Times a stage of a run
+
+        Arguments:
+            - name (str): the stage name
+            - counters: initial counter values, i.e. building='house1'
+
+        Yields the record dict of the stage, to which counters can be added.
+            The record is added to self.records when the stage ends, also if
+            it raises an exception, in which case 'error' is the exception
+            type name.
+
+        Can be used as a context manager or as a decorator.
+
+        """
+        if not self.enabled:
+            yield dict(counters)
+            return
+        stack=self._stack.get()
+        if stack:
+            run=stack[-1]['run']
+        else:
+            self._run_count+=1
+            run=self._run_count
+        record={'run':run,
+                'stage':name,
+                'parent':stack[-1]['stage'] if stack else None,
+                'depth':len(stack),
+                'start':datetime.datetime.now().isoformat(),
+                'wall':None,
+                'cpu':None,
+                'child_cpu':None}
+        record.update(counters)
+        token=self._stack.set(stack+(record,))
+        times=os.times()
+        wall=time.perf_counter()
+        cpu=time.process_time()
+        try:
+            yield record
+        except BaseException as err:
+            record['error']=type(err).__name__
+            raise
+        finally:
+            times1=os.times()
+            record['wall']=time.perf_counter()-wall
+            record['cpu']=time.process_time()-cpu
+            record['child_cpu']=(times1.children_user-times.children_user
+                                 +times1.children_system-times.children_system)
+            self._stack.reset(token)
+            self.records.append(record)
+
+
+    def count(self,name,value=1):
+        """Adds value to a counter of the current stage
+
+        Does nothing if no stage is running.
+
+        """
+        stack=self._stack.get()
+        if stack:
+            record=stack[-1]
+            record[name]=record.get(name,0)+value
+
+
+    def to_dataframe(self):
+        "Returns a DataFrame with a row for each record"
+        import pandas as pd
+        return pd.DataFrame(list(self.records))
+
+
+    def summary(self):
+        """Returns a DataFrame of the calls and total times of each stage
+
+        Slowest stage first.
+
+        """
+        df=self.to_dataframe()
+        if len(df)==0:
+            return df
+        df=df.groupby('stage').agg(calls=('wall','count'),
+                                   wall=('wall','sum'),
+                                   cpu=('cpu','sum'),
+                                   child_cpu=('child_cpu','sum'))
+        df['wall_per_call']=df['wall']/df['calls']
+        return df.sort_values('wall',ascending=False)
+
+
+    def json_lines(self):
+        "Returns the records as a JSON lines string"
+        return ''.join(json.dumps(record,default=_json_default)+'\n'
+                       for record in self.records)
+
+
+    def write_json_lines(self,fp,mode='a'):
+        """Writes the records to a JSON lines file
+
+        Arguments:
+            - fp (str): the filepath
+            - mode (str): 'a' to append to the file, 'w' to replace it
+
+        """
+        with open(fp,mode) as f:
+            f.write(self.json_lines())
+
+
+def _json_default(obj):
+    "Converts NumPy scalars for json.dumps"
+    if isinstance(obj,np.generic):
+        return obj.item()
+    return str(obj)
+
+
+def graph_counters(graph,prefix=''):
+    "Returns a dict of the number of nodes and edges of a graph"
+    return {prefix+'nodes':len(graph._nodes),
+            prefix+'edges':len(graph._edges)}
+
+
+def file_size(fp):
+    "Returns the size of a file in bytes, or None if it does not exist"
+    try:
+        return os.path.getsize(fp)
+    except OSError:
+        return None
+
+
+profiler=Profiler(maxlen=10000)  # the default profiler, which keeps the latest 10000 records
+
+
+
+# tests
+
+if __name__=='__main__':
+    from gbxml_graph import GbxmlGraph
+    from gbxml_to_bim_map import GbxmlToBimMap
+    from bim_to_idf_map import BimToIdfMap
+
+    print('TEST-Profiler')
+
+    fp=r'../01_D-original_gbXML/detached_house.gbxml'
+    for i in range(3):
+        with profiler.stage('run_gbxml',building='detached_house'):
+            with profiler.stage('read_xml') as record:
+                gbxml=GbxmlGraph()
+                gbxml.read_xml(fp)
+                record.update(graph_counters(gbxml),bytes_read=file_size(fp))
+            with profiler.stage('gbxml_to_bim') as record:
+                o=GbxmlToBimMap()
+                o.input_gbxml=gbxml
+                o.run()
+                record.update(graph_counters(o.output_bim))
+            with profiler.stage('bim_to_idf') as record:
+                o1=BimToIdfMap()
+                o1.input_bim=o.output_bim
+                o1.run()
+                record.update(graph_counters(o1.output_idf))
+    print(profiler.to_dataframe())
+    print(profiler.summary())
+    print(profiler.json_lines().splitlines()[0])
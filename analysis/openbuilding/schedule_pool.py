@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+import copy
+import weakref
+
+try:
+    from .schedules import YearSchedule, PeriodSchedule, WeekSchedule, DaySchedule
+except ImportError:
+    from schedules import YearSchedule, PeriodSchedule, WeekSchedule, DaySchedule
+
+
+class SchedulePool():
+    """A pool of schedule objects, deduplicated by their content
+
+    intern(ys) returns the YearSchedule in the pool with the same periods,
+        week schedules and day profiles as ys, or adds ys to the pool if there
+        is none. The PeriodSchedule, WeekSchedule and DaySchedule objects
+        inside ys are interned first, so a profile such as 'always on' is
+        held in memory once however many spaces, schedules or buildings
+        use it.
+
+    The pool holds weak references only, so a schedule is removed from the
+        pool when it is no longer used.
+
+    Interned schedules are shared, so they should not be modified in place.
+
+    """
+
+    def __init__(self):
+        self._schedules=weakref.WeakValueDictionary()
+
+
+    def __len__(self):
+        return len(self._schedules)
+
+
+    @staticmethod
+    def key(schedule):
+        "Returns the content hash of a schedule object"
+        return type(schedule).__name__+schedule.content_hash()
+
+
+    def _intern(self,schedule):
+        "Returns the pooled object with the same content as schedule"
+        key=self.key(schedule)
+        schedule1=self._schedules.get(key)
+        if schedule1 is None:
+            self._schedules[key]=schedule
+            return schedule
+        return schedule1
+
+
+    def intern(self,schedule):
+        """Returns the pooled schedule with the same content
+
+        Arguments:
+            - schedule: a YearSchedule, PeriodSchedule, WeekSchedule or
+                DaySchedule
+
+        The schedule passed in is not modified. If it is added to the pool
+            and holds schedules which are not pooled objects, a shallow copy
+            holding the pooled objects is added instead.
+
+        """
+        if schedule is None: return None
+        schedule1=self._schedules.get(self.key(schedule))
+        if schedule1 is not None:
+            return schedule1
+        if isinstance(schedule,YearSchedule):
+            seq=[self.intern(ps) for ps in schedule.seq]
+            if any(x is not y for x,y in zip(seq,schedule.seq)):
+                schedule=copy.copy(schedule)
+                schedule.seq=seq
+        elif isinstance(schedule,PeriodSchedule):
+            ws=self.intern(schedule.ws)
+            if ws is not schedule.ws:
+                schedule=copy.copy(schedule)
+                schedule.ws=ws
+        elif isinstance(schedule,WeekSchedule):
+            ds_dict={k:self.intern(v) for k,v in schedule.ds_dict.items()}
+            if any(ds_dict[k] is not v for k,v in schedule.ds_dict.items()):
+                schedule=copy.copy(schedule)
+                schedule.ds_dict=ds_dict
+        return self._intern(schedule)
+
+
+    def intern_bim(self,bim):
+        """Interns the year_schedule of all Schedule nodes in a BimGraph
+
+        This can be used after reading pickled BimGraphs, which would
+            otherwise each hold their own copy of identical schedules.
+
+        """
+        for labels,properties,_,_ in bim._nodes.values():
+            if 'Schedule' in labels and properties.get('year_schedule') is not None:
+                properties['year_schedule']=self.intern(properties['year_schedule'])
+        return bim
+
+
+    @staticmethod
+    def names(bim):
+        """Returns the name to use for each Schedule node of a BimGraph
+
+        Returns {schedule node _id:id} where the id is the id of the first
+            Schedule node with the same content. The mappers use this to
+            write each distinct schedule once.
+
+        """
+        first={}  # {content hash:id}
+        d={}
+        for _id,(labels,properties,_,_) in bim._nodes.items():
+            if not 'Schedule' in labels: continue
+            ys=properties.get('year_schedule')
+            if ys is None:
+                d[_id]=properties.get('id')
+                continue
+            d[_id]=first.setdefault(ys.content_hash(),properties.get('id'))
+        return d
+
+
+schedule_pool=SchedulePool()  # the default pool
+
+
+
+# tests
+
+if __name__=='__main__':
+
+    print('TEST-SchedulePool')
+
+    l=[YearSchedule(seq=[PeriodSchedule(ws=WeekSchedule(ds_dict={'All':DaySchedule(seq=[0,1,1,0])}))])
+       for i in range(100)]
+    l1=[schedule_pool.intern(ys) for ys in l]
+    print(len(schedule_pool), all(ys is l1[0] for ys in l1))
+    ds=DaySchedule(seq=[0,1,1,0])
+    ws=WeekSchedule(ds_dict={'All':ds})
+    ws1=schedule_pool.intern(ws)
+    assert ws.ds_dict['All'] is ds  # the argument is not modified
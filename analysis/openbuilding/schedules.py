@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 
+import hashlib
+import numpy as np
 import pandas as pd
 
 try:
@@ -7,16 +9,46 @@ try:
 except ImportError:
     from timeseries import ContinuousTimeSeries
 
+
+_day_types={0:'Mon',1:'Tue',2:'Wed',3:'Thu',4:'Fri',5:'Sat',6:'Sun'}
+
+_array_cache={}  # {(content hash,timestep,year):np.ndarray} of YearSchedule.to_array
+_array_cache_size=4096
+
+
+def clear_array_cache():
+    "Empties the cache of YearSchedule.to_array"
+    _array_cache.clear()
+
+
+def _content_hash(key):
+    "Returns a hash string of a schedule key tuple"
+    return hashlib.blake2b(repr(key).encode(),digest_size=16).hexdigest()
+
+
 class DaySchedule(ContinuousTimeSeries):
     """ A class representing the schedule of a typical day
+    
+    The schedule is held as self.series, with timestamps from 1/1/2001 00:00
+        to 1/2/2001 00:00. Values are on a straight line between data 
+        points, and a repeated timestamp gives a step change.
+        
+    The times (seconds from the start of the day) and values of the series 
+        are cached as NumPy arrays, which evaluate() and to_array() use. 
+        Change a schedule by setting self.series rather than changing the 
+        series in place.
+    
     """
+    
+    _day_start=pd.Timestamp('1/1/2001 00:00')
+    
     def __init__(self,series=None,seq=None):
         ContinuousTimeSeries.__init__(self,series)
         if series is None and seq:
             self.seq(seq)
     
     def json(self):
-        l=[(str(index),value) for index,value in self.series.iteritems()]
+        l=[(str(index),value) for index,value in self.series.items()]
         return l
 
     def __repr__(self):
@@ -28,6 +60,61 @@ class DaySchedule(ContinuousTimeSeries):
             )   
     
     
+    def _breakpoints(self):
+        "Returns arrays of the times (seconds from the start of the day) and values"
+        series=self.series
+        cache=self.__dict__.get('_arrays')
+        if cache is not None and cache[0] is series:
+            return cache[1],cache[2]
+        index=series.index
+        if len(index)==0:
+            t,v=np.zeros(0),np.zeros(0)
+        else:
+            t=(index-index[0].normalize()).total_seconds().to_numpy(dtype=float)
+            v=series.to_numpy(dtype=float)
+        self._arrays=(series,t,v)
+        return t,v
+    
+    
+    @classmethod
+    def from_arrays(cls,times,values,step=False):
+        """Returns a DaySchedule from arrays of times and values
+        
+        Arguments:
+            - times (array): the times of the data points, in hours from the
+                start of the day (0 to 24), in time order
+            - values (array): the value at each time
+            - step (bool): if True then each value is held until the next
+                time, or until the end of the day for the last value. If 
+                False the values are on a straight line between the times.
+        
+        """
+        t=np.asarray(times,dtype=float)*3600.0
+        v=np.asarray(values)
+        if step:
+            t=np.repeat(np.append(t,86400.0),2)[1:-1]
+            v=np.repeat(v,2)
+        return cls(series=cls._series_from_arrays(t,v))
+    
+    
+    @classmethod
+    def _series_from_arrays(cls,t,v):
+        "Returns a series from times in seconds from the start of the day and values"
+        index=cls._day_start+pd.to_timedelta(np.asarray(t,dtype=float),unit='s')
+        return pd.Series(data=v,index=index)
+    
+    
+    def content_hash(self):
+        "Returns a hash string of the schedule content"
+        return _content_hash(self.key())
+    
+    
+    def key(self):
+        "Returns a hashable tuple of the schedule content"
+        t,v=self._breakpoints()
+        return (tuple(t.tolist()),tuple(v.tolist()))
+    
+    
     def seq(self,seq):
         "Creates self.series based on seq i.e. '21' or '[0,1,1,0]'"
         if seq is None:
@@ -51,17 +138,67 @@ class DaySchedule(ContinuousTimeSeries):
     def _generate_equal_interval_series(self,seq):
         "Returns series based on seq if seq is a list of values"
         delta=pd.Timedelta('1 days')/len(seq)
-        data=[]
-        index=[]
-        ts=pd.Timestamp('1/1/2001 00:00')
-        for v in seq:
-            data+=[v,v]
-            index+=[ts,ts+delta]
-            ts+=delta
-        s=pd.Series(data=data,
-                    index=index
+        edges=self._day_start+delta*np.arange(len(seq)+1)
+        s=pd.Series(data=np.repeat(np.asarray(seq),2),
+                    index=edges[np.repeat(np.arange(len(seq)+1),2)[1:-1]]
                     )
         return s
+    
+    
+    def evaluate(self,times_of_day,method='interpolate'):
+        """Returns the schedule values at an array of times of the day
+        
+        Arguments:
+            - times_of_day (array or pd.DatetimeIndex): the times in hours 
+                from the start of the day (0 to 24), or timestamps, of which
+                only the time of day is used
+            - method (str): 'interpolate' for a straight line between data 
+                points, or 'step' for the value of the last data point at or 
+                before each time
+        
+        Where there are two data points at the same time, the later value is
+            used. Before the first and after the last data point, the first 
+            and last values are used.
+        
+        """
+        if isinstance(times_of_day,(pd.DatetimeIndex,pd.Series)):
+            x=pd.DatetimeIndex(times_of_day)
+            x=(x-x.normalize()).total_seconds().to_numpy(dtype=float)
+        else:
+            x=np.asarray(times_of_day,dtype=float)*3600.0
+        t,v=self._breakpoints()
+        if len(t)==0:
+            return np.full(x.shape,np.nan)
+        if method=='interpolate':
+            return np.interp(x,t,v)
+        elif method=='step':
+            i=np.searchsorted(t,x,side='right')-1
+            return v[np.clip(i,0,len(v)-1)]
+        raise ValueError('method must be interpolate or step: {}'.format(method))
+
+
+    def to_array(self,timestep=1):
+        """Returns the mean value over each timestep of the day
+        
+        Arguments:
+            - timestep (int): the number of timesteps per hour
+        
+        The series is integrated as a straight line between data points, 
+            so repeated timestamps give step changes. Before the first data 
+            point the first value is used, and after the last data point 
+            the last value is used.
+        
+        """
+        n=24*timestep
+        t,v=self._breakpoints()
+        if len(t)==0:
+            return np.full(n,np.nan)
+        edges=np.linspace(0.0,86400.0,n+1)
+        area=np.zeros(len(t))
+        np.cumsum((v[1:]+v[:-1])/2.0*np.diff(t),out=area[1:])
+        i=np.clip(np.searchsorted(t,edges,side='right')-1,0,len(t)-1)
+        cumulative=area[i]+(edges-t[i])*(v[i]+np.interp(edges,t,v))/2.0
+        return np.diff(cumulative)/np.diff(edges)
 
 
 class WeekSchedule():
@@ -70,12 +207,43 @@ class WeekSchedule():
     def __init__(self,ds_dict=None):
         self.ds_dict=ds_dict
     
+    
+    def day_schedule(self,dayofweek):
+        """Returns the DaySchedule for a day of the week, or None
+        
+        Arguments:
+            - dayofweek (int): 0 is Monday, 6 is Sunday
+        
+        The day types are tried in the order: the day ('Mon' etc.), 
+            'Weekend' or 'Weekday', 'WeekendOrHoliday', 'All'.
+        
+        """
+        weekend=dayofweek>=5
+        for k in (_day_types[dayofweek],
+                  'Weekend' if weekend else 'Weekday',
+                  'WeekendOrHoliday' if weekend else None,
+                  'All'):
+            if k in self.ds_dict:
+                return self.ds_dict[k]
+        return None
+    
+    
     def json(self):
         ""
         d={}
         for k,v in self.ds_dict.items():
             d[k]=v.json()
         return d
+    
+    
+    def content_hash(self):
+        "Returns a hash string of the schedule content"
+        return _content_hash(self.key())
+    
+    
+    def key(self):
+        "Returns a hashable tuple of the schedule content"
+        return tuple(sorted((k,v.key()) for k,v in self.ds_dict.items()))
         
     
     
@@ -96,8 +264,27 @@ class PeriodSchedule():
                 'ws':self.ws.json()}
 
 
+    def content_hash(self):
+        "Returns a hash string of the schedule content"
+        return _content_hash(self.key())
+
+
+    def key(self):
+        "Returns a hashable tuple of the schedule content"
+        return ((self.begin_date.month,self.begin_date.day),
+                (self.end_date.month,self.end_date.day),
+                self.ws.key())
+
+
 class YearSchedule():
-    "This represent a schedule over a year"
+    """This represent a schedule over a year
+    
+    to_array() expands the schedule to a value for every timestep of a year.
+        The arrays are cached by the content of the schedule, so schedules 
+        with the same profile, i.e. the same schedule on thousands of spaces,
+        are only expanded once.
+    
+    """
     def __init__(self,seq=None):
         self.seq=[]
         if seq: self.seq=seq
@@ -108,3 +295,100 @@ class YearSchedule():
             if isinstance(item,PeriodSchedule):
                 l.append(item.json())
         return l
+    
+    
+    def content_hash(self):
+        "Returns a hash string of the schedule content"
+        return _content_hash(self.key())
+    
+    
+    def key(self):
+        "Returns a hashable tuple of the schedule content"
+        return tuple(ps.key() for ps in self.seq)
+    
+    
+    def to_array(self,timestep=1,year=2001):
+        """Returns the schedule value at every timestep of a year
+        
+        Arguments:
+            - timestep (int): the number of timesteps per hour, i.e. 1 gives
+                8760 values and 6 gives 52560 values for a non leap year
+            - year (int): the year, which sets the day of the week of each 
+                date
+        
+        Each value is the mean of the DaySchedule over the timestep. The 
+            PeriodSchedule dates are used as days of the year, so the year 
+            of begin_date and end_date is ignored, and a period with an 
+            end_date before its begin_date runs over the new year. Days 
+            outside all periods are 0.
+        
+        The returned array is shared through the cache and is read only.
+        
+        """
+        k=(self.content_hash(),timestep,year)
+        a=_array_cache.get(k)
+        if a is None:
+            a=self._expand(timestep,year)
+            a.flags.writeable=False
+            if len(_array_cache)>=_array_cache_size:
+                _array_cache.clear()
+            _array_cache[k]=a
+        return a
+    
+    
+    def _expand(self,timestep,year):
+        "Returns a new array for to_array"
+        days=pd.date_range('{}-01-01'.format(year),'{}-12-31'.format(year),freq='D')
+        month_day=(days.month*100+days.day).to_numpy()
+        dayofweek=days.dayofweek.to_numpy()
+        profiles=[np.zeros(24*timestep)]
+        index={}  # {id(DaySchedule):row of profiles}
+        day_index=np.zeros(len(days),dtype=np.int64)
+        for ps in self.seq:
+            begin=ps.begin_date.month*100+ps.begin_date.day
+            end=ps.end_date.month*100+ps.end_date.day
+            if begin<=end:
+                mask=(month_day>=begin)&(month_day<=end)
+            else:
+                mask=(month_day>=begin)|(month_day<=end)
+            for d in range(7):
+                ds=ps.ws.day_schedule(d)
+                if ds is None: continue
+                if not id(ds) in index:
+                    index[id(ds)]=len(profiles)
+                    profiles.append(ds.to_array(timestep))
+                day_index[mask&(dayofweek==d)]=index[id(ds)]
+        return np.stack(profiles)[day_index].ravel()
+
+
+
+# tests
+
+if __name__=='__main__':
+    import time
+    
+    print('TEST-YearSchedule')
+    
+    ws=WeekSchedule(ds_dict={'Weekday':DaySchedule(seq=[0]*8+[1]*10+[0]*6),
+                             'Weekend':DaySchedule(seq=[0.5,1])})
+    ys=YearSchedule(seq=[PeriodSchedule(ws=ws)])
+    t=time.time()
+    a=ys.to_array()
+    print('to_array',time.time()-t,a.shape,a[:24],a[5*24+10:5*24+14])
+    ys1=YearSchedule(seq=[PeriodSchedule(ws=WeekSchedule(ds_dict=dict(ws.ds_dict)))])
+    t=time.time()
+    a1=ys1.to_array()
+    print('cached',time.time()-t,a1 is a,ys.to_array(6).shape)
+    
+    print('TEST-DaySchedule.evaluate')
+    
+    ds=DaySchedule.from_arrays([0,6,22],[16,21,16],step=True)
+    print(ds.evaluate([5,6,21.5,23]),ds.evaluate(pd.date_range('2001-01-01',periods=4,freq='6h'),'step'))
+    
+    ds=DaySchedule.from_arrays([6,22],[21,16],step=True)  # starts after 00:00
+    assert ds.evaluate([0,6,21,22,23],'step').tolist()==[21,21,21,16,16]
+    assert ds.to_array()[[0,6,21,22,23]].tolist()==[21,21,21,16,16]
+    ds=DaySchedule.from_arrays([6,18],[0,1])
+    assert ds.evaluate([0,6,12,18,24]).tolist()==[0,0,0.5,1,1]
+    assert np.allclose(ds.to_array()[[0,11,12,23]],[0,5.5/12,6.5/12,1])
+    print(ds.to_array())
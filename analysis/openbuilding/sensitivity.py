@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+
+"""This module contains global sensitivity analysis methods
+
+Two methods are available, each with its own experimental design:
+    - Morris elementary effects: MorrisDesign and MorrisAnalysis
+    - Sobol first and total order indices: SaltelliDesign and SobolAnalysis
+
+The designs are run in the same way as the designs in experimental_design,
+    and the simulation outputs are added to the design with add_result.
+    The analysis then uses the design matrix and one or more outputs.
+
+Example:
+    d=SaltelliDesign(parameters)
+    d.run(n=256,seed=1)
+    for i,bim1 in d.bim_variants(bim):
+        ...
+        d.add_result(i,heating_energy=...)
+    o=SobolAnalysis()
+    o.input_design=d
+    o.output='heating_energy'
+    o.run()
+    print(o.results)
+
+"""
+
+import concurrent.futures
+import numpy as np
+import pandas as pd
+
+try:
+    from .experimental_design import Design, sobol_sequence
+except ImportError:
+    from experimental_design import Design, sobol_sequence
+
+
+class MorrisDesign(Design):
+    """A Morris trajectory design
+
+    Each trajectory has d+1 points and moves one parameter at a time by
+        delta=levels/(2*(levels-1)) in the unit hypercube, so running n
+        trajectories gives n*(d+1) rows.
+
+    levels must be even (the default is 4), as with an odd number of levels
+        delta does not move the points from one level to another. A 
+        ValueError is raised otherwise.
+
+    """
+
+    def __init__(self,parameters=None,levels=4):
+        if levels<2 or levels%2:
+            raise ValueError('levels must be an even number: {}'.format(levels))
+        Design.__init__(self,parameters)
+        self.levels=levels
+        self.delta=levels/(2.0*(levels-1))
+        self.unit=None
+
+
+    def unit_samples(self,n,rng):
+        d=len(self.parameters)
+        p=self.levels
+        base=rng.integers(0,p//2,size=(n,d))/(p-1.0)
+        sign=rng.choice([-1.0,1.0],size=(n,d))
+        start=base+(sign<0)*self.delta
+        order=rng.permuted(np.tile(np.arange(d),(n,1)),axis=1)
+        rank=np.argsort(order,axis=1)  # the step at which each parameter moves
+        step=np.arange(d+1)[None,:,None]>rank[:,None,:]
+        u=start[:,None,:]+step*(sign*self.delta)[:,None,:]
+        self.unit=u.reshape(n*(d+1),d)
+        return self.unit
+
+
+class SaltelliDesign(Design):
+    """A Saltelli design for estimating Sobol indices
+
+    The design is made from two independent sample matrices A and B, taken
+        from a 2d-dimensional Sobol sequence, and d matrices AB_j which are
+        equal to A except for column j, which is taken from B.
+
+    Running with n gives n*(d+2) rows, in the order A, B, AB_1 ... AB_d.
+
+    """
+
+    def unit_samples(self,n,rng):
+        d=len(self.parameters)
+        x=sobol_sequence(n+1,2*d)[1:]  # the first point is all zeros
+        shift=rng.random(2*d)  # a random (Cranley-Patterson) shift
+        x=(x+shift)%1.0
+        a=x[:,:d]
+        b=x[:,d:]
+        ab=np.repeat(a[None,:,:],d,axis=0)
+        ab[np.arange(d),:,np.arange(d)]=b.T
+        return np.concatenate([a,b,ab.reshape(d*n,d)])
+
+
+class _Analysis():
+    "The base class of a sensitivity analysis"
+
+    def __init__(self):
+        self.input_design=None
+        self.output=None  # an output name, a list of names or an array
+        self.results=None
+
+
+    def _outputs(self):
+        "Returns a DataFrame of the outputs, with a row for each design row"
+        output=self.output
+        if isinstance(output,str):
+            output=[output]
+        if isinstance(output,list):
+            df=self.input_design.to_dataframe()
+            return df[output]
+        return pd.DataFrame(np.asarray(output,dtype=float).reshape(len(self.input_design.matrix),-1))
+
+
+    def _parameter_names(self):
+        return [p.name for p in self.input_design.parameters]
+
+
+    def run(self,**kwargs):
+        """Runs the analysis
+
+        self.results is a DataFrame with a row for each parameter. If there
+            is more than one output then self.results is a dict of
+            {output:DataFrame}.
+
+        """
+        outputs=self._outputs()
+        d={}
+        for name in outputs.columns:
+            y=outputs[name].to_numpy(dtype=float)
+            d[name]=self._analyse(y,**kwargs)
+        if len(d)==1:
+            self.results=list(d.values())[0]
+        else:
+            self.results=d
+        return self.results
+
+
+class MorrisAnalysis(_Analysis):
+    """Morris elementary effects analysis
+
+    The results hold mu, mu_star and sigma of the elementary effects of each
+        parameter, and a bootstrap confidence interval of mu_star.
+
+    """
+
+    def _analyse(self,y,n_bootstrap=1000,confidence=0.95,seed=None):
+        design=self.input_design
+        u=design.unit
+        d=u.shape[1]
+        r=len(u)//(d+1)
+        u=u.reshape(r,d+1,d)
+        y=y.reshape(r,d+1)
+        du=np.diff(u,axis=1)  # (r,d,d)
+        j=np.abs(du).argmax(axis=2)  # the parameter moved at each step
+        delta=np.take_along_axis(du,j[:,:,None],axis=2)[:,:,0]
+        ee_step=np.diff(y,axis=1)/delta
+        ee=np.empty((r,d))
+        ee[np.arange(r)[:,None],j]=ee_step
+        rng=np.random.default_rng(seed)
+        i=rng.integers(r,size=(n_bootstrap,r))
+        mu_star_bootstrap=np.abs(ee)[i].mean(axis=1)
+        alpha=(1.0-confidence)/2.0
+        df=pd.DataFrame(index=self._parameter_names())
+        df['mu']=ee.mean(axis=0)
+        df['mu_star']=np.abs(ee).mean(axis=0)
+        df['sigma']=ee.std(axis=0,ddof=1) if r>1 else np.nan
+        df['mu_star_low']=np.quantile(mu_star_bootstrap,alpha,axis=0)
+        df['mu_star_high']=np.quantile(mu_star_bootstrap,1.0-alpha,axis=0)
+        return df
+
+
+def _sobol_indices(ya,yb,yab):
+    """Returns the first order and total order Sobol indices
+
+    Uses the Saltelli (2010) first order and Jansen total order estimators.
+        All arrays may have leading dimensions, for example for bootstrap
+        samples.
+
+    Arguments:
+        - ya, yb (array): (...,n) outputs of matrices A and B
+        - yab (array): (d,...,n) outputs of the matrices AB_j
+
+    """
+    v=np.concatenate([ya,yb],axis=-1).var(axis=-1)
+    s1=(yb*(yab-ya)).mean(axis=-1)/v
+    st=0.5*((ya-yab)**2).mean(axis=-1)/v
+    return s1,st
+
+
+def _sobol_bootstrap(ya,yb,yab,n_bootstrap,seed):
+    "Returns bootstrap samples of the first and total order indices"
+    rng=np.random.default_rng(seed)
+    i=rng.integers(len(ya),size=(n_bootstrap,len(ya)))
+    s1,st=_sobol_indices(ya[i],yb[i],yab[:,i])
+    return s1.T,st.T
+
+
+class SobolAnalysis(_Analysis):
+    """Sobol first order (S1) and total order (ST) sensitivity indices
+
+    Confidence intervals are calculated by bootstrap resampling. The
+        bootstrap is run in chunks to limit memory use; if the ensemble is
+        large the chunks are run in a process pool.
+
+    """
+
+    chunk_size=10000000  # the number of values in one bootstrap chunk
+
+
+    def _analyse(self,y,n_bootstrap=1000,confidence=0.95,seed=None,processes=None):
+        d=len(self.input_design.parameters)
+        n=len(y)//(d+2)
+        ya=y[:n]
+        yb=y[n:2*n]
+        yab=y[2*n:].reshape(d,n)
+        s1,st=_sobol_indices(ya,yb,yab)
+
+        #BOOTSTRAP
+        chunk=max(1,min(n_bootstrap,self.chunk_size//(n*(d+2))))
+        sizes=[min(chunk,n_bootstrap-k) for k in range(0,n_bootstrap,chunk)]
+        seeds=np.random.SeedSequence(seed).spawn(len(sizes))
+        if len(sizes)>1 and processes!=1:
+            with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+                l=list(executor.map(_sobol_bootstrap,
+                                    [ya]*len(sizes),
+                                    [yb]*len(sizes),
+                                    [yab]*len(sizes),
+                                    sizes,
+                                    seeds))
+        else:
+            l=[_sobol_bootstrap(ya,yb,yab,size,s) for size,s in zip(sizes,seeds)]
+        s1_bootstrap=np.concatenate([x[0] for x in l])
+        st_bootstrap=np.concatenate([x[1] for x in l])
+
+        alpha=(1.0-confidence)/2.0
+        df=pd.DataFrame(index=self._parameter_names())
+        df['S1']=s1
+        df['S1_low']=np.quantile(s1_bootstrap,alpha,axis=0)
+        df['S1_high']=np.quantile(s1_bootstrap,1.0-alpha,axis=0)
+        df['ST']=st
+        df['ST_low']=np.quantile(st_bootstrap,alpha,axis=0)
+        df['ST_high']=np.quantile(st_bootstrap,1.0-alpha,axis=0)
+        return df
+
+
+
+# tests
+
+if __name__=='__main__':
+    import time
+    from experimental_design import Parameter
+
+    print('TEST-sensitivity.py')
+
+    def ishigami(x):
+        return np.sin(x[:,0])+7*np.sin(x[:,1])**2+0.1*x[:,2]**4*np.sin(x[:,0])
+
+    parameters=[Parameter('x{}'.format(i),low=-np.pi,high=np.pi) for i in range(3)]
+
+    d=MorrisDesign(parameters)
+    d.run(n=100,seed=1)
+    o=MorrisAnalysis()
+    o.input_design=d
+    o.output=ishigami(d.matrix.to_numpy(dtype=float))
+    print(o.run(seed=1))
+
+    d=SaltelliDesign(parameters)
+    d.run(n=4096,seed=1)
+    for i,y in enumerate(ishigami(d.matrix.to_numpy(dtype=float))):
+        d.add_result(i,y=y)
+    o=SobolAnalysis()
+    o.input_design=d
+    o.output='y'
+    t=time.time()
+    print(o.run(seed=1))  # analytical S1=0.314,0.442,0 ST=0.558,0.442,0.244
+    print(time.time()-t)
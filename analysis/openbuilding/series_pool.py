@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import pickle
+import weakref
+import numpy as np
+
+try:
+    from .timeseries import TimeSeries, Variable
+except ImportError:
+    from timeseries import TimeSeries, Variable
+
+
+class SeriesPool():
+    """A pool of TimeSeries objects, deduplicated by their content
+
+    intern(ts) returns the TimeSeries in the pool with the same class,
+        attributes, index and data as ts, or adds ts to the pool if there is
+        none. Identical series, such as the climate data of many simulations
+        using the same weather file, are then held in memory once and
+        referenced from every BimGraph.
+
+    The pool holds weak references only, so a series is removed from the
+        pool when it is no longer used.
+
+    Interned series are shared, so they should not be modified in place.
+
+    """
+
+    def __init__(self):
+        self._series=weakref.WeakValueDictionary()
+
+
+    def __len__(self):
+        return len(self._series)
+
+
+    @staticmethod
+    def key(ts):
+        "Returns the content hash of a TimeSeries"
+        h=hashlib.sha1()
+        h.update(type(ts).__name__.encode())
+        attributes={k:v for k,v in ts.__dict__.items() if k!='series'}
+        h.update(repr(sorted(attributes.items())).encode())
+        for a in (ts.series.index,ts.series.values):
+            a=np.asarray(a)
+            if a.dtype.kind in 'biufcmM':
+                h.update(a.dtype.str.encode())
+                h.update(np.ascontiguousarray(a).tobytes())
+            else:
+                h.update(pickle.dumps(a.tolist()))
+        return h.hexdigest()
+
+
+    def intern(self,ts):
+        "Returns the pooled TimeSeries with the same content as ts"
+        if ts is None: return None
+        key=self.key(ts)
+        ts1=self._series.get(key)
+        if ts1 is None:
+            self._series[key]=ts
+            return ts
+        return ts1
+
+
+    def intern_bim(self,bim):
+        """Interns all TimeSeries properties and Variables in a BimGraph
+
+        This can be used after reading pickled BimGraphs, which would
+            otherwise each hold their own copy of identical series.
+
+        """
+        for node_tuple in bim._nodes.values():
+            properties=node_tuple[1]
+            for k,v in properties.items():
+                if isinstance(v,TimeSeries):
+                    properties[k]=self.intern(v)
+                elif isinstance(v,Variable) and isinstance(v.ts,TimeSeries):
+                    v.ts=self.intern(v.ts)
+        return bim
+
+
+series_pool=SeriesPool()  # the default pool
+
+
+
+# tests
+
+if __name__=='__main__':
+    import pandas as pd
+    from timeseries import IntervalTimeSeries
+
+    print('TEST-SeriesPool')
+
+    index=pd.date_range('2001-01-01',periods=8760,freq='h')
+    l=[IntervalTimeSeries(series=pd.Series(index=index,data=np.arange(8760.0)),
+                          interval='1H')
+       for i in range(72)]
+    l1=[series_pool.intern(ts) for ts in l]
+    print(len(series_pool), all(ts is l1[0] for ts in l1))
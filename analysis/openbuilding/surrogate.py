@@ -0,0 +1,341 @@
+# -*- coding: utf-8 -*-
+
+"""This module contains surrogate models (emulators) of simulation outputs
+
+A surrogate is trained on the design matrix and outputs of completed
+    simulations, for example an experimental design from the
+    experimental_design or sensitivity modules. It then predicts the outputs
+    for new parameter values, with an estimate of the prediction uncertainty,
+    far faster than running EnergyPlus.
+
+Three methods are available:
+    - 'gp': a Gaussian process. Uses scikit-learn if installed, otherwise
+        a pure NumPy Gaussian process.
+    - 'gbt': gradient boosted trees from scikit-learn, with the uncertainty
+        estimated from quantile models.
+    - 'numpy': the pure NumPy Gaussian process.
+
+If scikit-learn is not installed then 'gp' uses the pure NumPy Gaussian
+    process and 'gbt' raises an ImportError.
+
+Example:
+    o=Surrogate(method='gp')
+    o.input_design=d
+    o.outputs=['heating_energy']
+    o.run()
+    mean,std=o.predict(new_matrix)
+    for i in np.flatnonzero(o.needs_simulation(new_matrix)):
+        ...  # run EnergyPlusModel.run_bim for these rows
+
+"""
+
+import numpy as np
+import pandas as pd
+
+try:
+    import sklearn
+except ImportError:
+    sklearn=None
+
+
+class _NumpyGaussianProcess():
+    """A Gaussian process regression model using NumPy only
+
+    Uses a squared exponential kernel with a length scale for each input
+        (inputs scaled to [0,1]) and a white noise term. The hyperparameters
+        are chosen by maximising the log marginal likelihood, using a grid
+        search followed by coordinate-wise refinement of the length scales.
+
+    """
+
+    length_scales=np.logspace(-1.3,0.7,12)
+    noise_levels=[1e-6,1e-4,1e-2,1e-1]
+
+
+    def _kernel(self,a,b,length_scale):
+        a=a/length_scale
+        b=b/length_scale
+        d2=(a**2).sum(axis=1)[:,None]+(b**2).sum(axis=1)[None,:]-2*a@b.T
+        return np.exp(-0.5*np.maximum(d2,0.0))
+
+
+    def _log_marginal_likelihood(self,length_scale,noise):
+        "Returns (lml,L,alpha) for the training data"
+        x=self._x
+        y=self._y
+        k=self._kernel(x,x,length_scale)+noise*np.eye(len(x))
+        try:
+            L=np.linalg.cholesky(k)
+        except np.linalg.LinAlgError:
+            return -np.inf,None,None
+        alpha=np.linalg.solve(L.T,np.linalg.solve(L,y))
+        lml=-0.5*(y*alpha).sum()-y.shape[1]*(np.log(np.diag(L)).sum()+0.5*len(x)*np.log(2*np.pi))
+        return lml,L,alpha
+
+
+    def fit(self,x,y):
+        self._x=x
+        self._y=y
+        d=x.shape[1]
+        best=(-np.inf,None,None)
+        for length_scale in self.length_scales:
+            for noise in self.noise_levels:
+                lml=self._log_marginal_likelihood(np.full(d,length_scale),noise)[0]
+                if lml>best[0]:
+                    best=(lml,np.full(d,length_scale),noise)
+        lml,length_scale,noise=best
+        for sweep in range(2):
+            for j in range(d):
+                for factor in [0.25,0.5,2.0,4.0]:
+                    ls=length_scale.copy()
+                    ls[j]*=factor
+                    lml1=self._log_marginal_likelihood(ls,noise)[0]
+                    if lml1>lml:
+                        lml,length_scale=lml1,ls
+        self.length_scale=length_scale
+        self.noise=noise
+        lml,L,alpha=self._log_marginal_likelihood(length_scale,noise)
+        self._alpha=alpha
+        self._L_inv=np.linalg.inv(L)
+
+
+    def predict(self,x):
+        "Returns the mean and standard deviation of the predictions"
+        k=self._kernel(x,self._x,self.length_scale)
+        mean=k@self._alpha
+        v=self._L_inv@k.T
+        var=np.maximum(1.0+self.noise-(v**2).sum(axis=0),0.0)
+        std=np.sqrt(var)[:,None]*np.ones(mean.shape[1])
+        return mean,std
+
+
+class _SklearnGaussianProcess():
+    "A Gaussian process regression model using scikit-learn"
+
+    def fit(self,x,y):
+        from sklearn.gaussian_process import GaussianProcessRegressor
+        from sklearn.gaussian_process.kernels import ConstantKernel, RBF, WhiteKernel
+        kernel=ConstantKernel()*RBF(length_scale=np.ones(x.shape[1]))+WhiteKernel()
+        self.model=GaussianProcessRegressor(kernel=kernel,n_restarts_optimizer=2)
+        self.model.fit(x,y)
+
+
+    def predict(self,x):
+        mean,std=self.model.predict(x,return_std=True)
+        return mean.reshape(len(x),-1),std.reshape(len(x),-1)
+
+
+class _SklearnGradientBoosting():
+    """A gradient boosted trees model using scikit-learn
+
+    The standard deviation is estimated from the 16% and 84% quantile models.
+
+    """
+
+    def fit(self,x,y):
+        from sklearn.ensemble import GradientBoostingRegressor
+        self.models=[]
+        for j in range(y.shape[1]):
+            d={}
+            for k,alpha in (('mean',None),('low',0.16),('high',0.84)):
+                if alpha is None:
+                    m=GradientBoostingRegressor()
+                else:
+                    m=GradientBoostingRegressor(loss='quantile',alpha=alpha)
+                d[k]=m.fit(x,y[:,j])
+            self.models.append(d)
+
+
+    def predict(self,x):
+        mean=np.column_stack([d['mean'].predict(x) for d in self.models])
+        std=np.column_stack([(d['high'].predict(x)-d['low'].predict(x))/2.0
+                             for d in self.models])
+        return mean,np.abs(std)
+
+
+class Surrogate():
+    """A surrogate model of simulation outputs
+
+    Attributes:
+        - method (str): 'gp', 'gbt' or 'numpy'
+        - input_design (Design): a design with results, used by run()
+        - outputs (list): the names of the outputs to model
+        - max_std (float): predictions with a standard deviation above this
+            value need simulating, if given
+        - max_relative_std (float): predictions with a standard deviation
+            above this fraction of the mean, or of the standard deviation
+            of the training outputs if that is larger, need simulating
+
+    """
+
+    def __init__(self,method='gp'):
+        self.method=method
+        self.input_design=None
+        self.outputs=None
+        self.max_std=None
+        self.max_relative_std=0.05
+        self.model=None
+
+
+    def _encode(self,x):
+        """Returns x as a 2D float array, scaled to the training range
+
+        Columns of a DataFrame which hold discrete levels are replaced by
+            the index of the level. If the surrogate was trained with an 
+            array then the columns of a DataFrame are used in order.
+
+        """
+        if isinstance(x,pd.DataFrame) and self.columns is None:
+            x=x.to_numpy(dtype=float)
+        elif isinstance(x,pd.DataFrame):
+            x=x[self.columns].copy()
+            for name,levels in self.levels.items():
+                x[name]=x[name].map({v:i for i,v in enumerate(levels)})
+            x=x.to_numpy(dtype=float)
+        x=np.atleast_2d(np.asarray(x,dtype=float))
+        if np.ndim(self.x_min)==1 and x.shape[1]!=len(self.x_min):
+            raise ValueError('Expected {} inputs, got {}'.format(len(self.x_min),x.shape[1]))
+        return (x-self.x_min)/self.x_range
+
+
+    def fit(self,x,y):
+        """Trains the surrogate model
+
+        Arguments:
+            - x (pd.DataFrame or array): the inputs, one row per simulation
+            - y (pd.DataFrame or array): the outputs, one row per simulation
+
+        """
+        if isinstance(x,pd.DataFrame):
+            self.columns=list(x.columns)
+            self.levels={}
+            for name in x.columns:
+                if not pd.api.types.is_numeric_dtype(x[name]):
+                    self.levels[name]=list(pd.unique(x[name]))
+        else:
+            self.columns=None
+            self.levels={}
+        self.x_min=0.0
+        self.x_range=1.0
+        x1=self._encode(x)
+        self.x_min=x1.min(axis=0)
+        self.x_range=np.where(x1.max(axis=0)>self.x_min,x1.max(axis=0)-self.x_min,1.0)
+        x1=(x1-self.x_min)/self.x_range
+
+        y=np.asarray(y,dtype=float)
+        if y.ndim==1: y=y[:,None]
+        self.y_mean=y.mean(axis=0)
+        self.y_std=np.where(y.std(axis=0)>0,y.std(axis=0),1.0)
+        y1=(y-self.y_mean)/self.y_std
+
+        method=self.method
+        if sklearn is None:
+            if method=='gbt':
+                raise ImportError("The 'gbt' surrogate method needs scikit-learn")
+            method='numpy'
+        if method=='gp':
+            self.model=_SklearnGaussianProcess()
+        elif method=='gbt':
+            self.model=_SklearnGradientBoosting()
+        elif method=='numpy':
+            self.model=_NumpyGaussianProcess()
+        else:
+            raise ValueError('Unknown surrogate method: {}'.format(self.method))
+        self.model.fit(x1,y1)
+
+
+    def needs_simulation(self,x):
+        """Returns a boolean array, True where the surrogate is not reliable
+
+        A prediction is not reliable if any input is outside the training
+            range or missing (i.e. a discrete level that was not in the
+            training data), if its mean or standard deviation is not finite,
+            or if its standard deviation is above max_std or max_relative_std
+            times the larger of the absolute mean and the standard deviation
+            of the training outputs, so outputs with a mean near zero are
+            not always flagged. These rows should be simulated with
+            EnergyPlusModel.run_bim instead.
+
+        """
+        x1=self._encode(x)
+        outside=((x1<-1e-9)|(x1>1+1e-9)).any(axis=1)
+        outside|=np.isnan(x1).any(axis=1)
+        mean,std=self.predict(x)
+        mean=np.asarray(mean,dtype=float).reshape(len(x1),-1)
+        std=np.asarray(std,dtype=float).reshape(len(x1),-1)
+        uncertain=(~np.isfinite(mean)|~np.isfinite(std)).any(axis=1)
+        scale=np.maximum(np.abs(mean),self.y_std)
+        uncertain|=(std>self.max_relative_std*scale).any(axis=1)
+        if not self.max_std is None:
+            uncertain|=(std>self.max_std).any(axis=1)
+        return outside|uncertain
+
+
+    def predict(self,x):
+        """Returns the predicted mean and standard deviation of the outputs
+
+        If the surrogate was trained with named outputs then DataFrames are
+            returned, otherwise arrays.
+
+        """
+        x1=self._encode(x)
+        mean,std=self.model.predict(x1)
+        mean=mean*self.y_std+self.y_mean
+        std=std*self.y_std
+        if self.outputs:
+            index=x.index if isinstance(x,pd.DataFrame) else None
+            return (pd.DataFrame(mean,columns=self.outputs,index=index),
+                    pd.DataFrame(std,columns=self.outputs,index=index))
+        if mean.shape[1]==1:
+            return mean[:,0],std[:,0]
+        return mean,std
+
+
+    def run(self):
+        "Trains the surrogate on self.input_design and self.outputs"
+        df=self.input_design.to_dataframe()
+        columns=[p.name for p in self.input_design.parameters]
+        df=df.dropna(subset=self.outputs)
+        self.fit(df[columns],df[self.outputs])
+
+
+
+# tests
+
+if __name__=='__main__':
+    import time
+    from experimental_design import Parameter, LatinHypercubeDesign
+
+    print('TEST-surrogate.py')
+
+    d=LatinHypercubeDesign([Parameter('orientation',low=0,high=360),
+                            Parameter('infiltration',low=0.2,high=1.5)])
+    d.run(n=100,seed=1)
+    for i,row in d.matrix.iterrows():
+        d.add_result(i,heating_energy=100+10*np.cos(np.radians(row.orientation))+50*row.infiltration)
+
+    o=Surrogate(method='numpy')
+    o.input_design=d
+    o.outputs=['heating_energy']
+    t=time.time()
+    o.run()
+    print('train',time.time()-t)
+
+    x=pd.DataFrame({'orientation':[0,90,180],'infiltration':[0.5,0.5,2.0]})
+    t=time.time()
+    mean,std=o.predict(x)
+    print('predict',time.time()-t)
+    print(mean,std)
+    print(o.needs_simulation(x))
+
+    o1=Surrogate(method='numpy')
+    x=pd.DataFrame({'orientation':[0,90,180,270]*5,'glazing':['single','double']*10})
+    o1.fit(x,100+10*np.cos(np.radians(x.orientation))+(x.glazing=='single')*20)
+    x=pd.DataFrame({'orientation':[90,90],'glazing':['double','triple']})
+    assert o1.needs_simulation(x).tolist()==[False,True]  # triple is unknown
+
+    o2=Surrogate(method='numpy')
+    x=np.random.default_rng(1).random((30,2))
+    o2.fit(x,np.zeros(30))  # i.e. no cooling energy
+    assert not o2.needs_simulation(x[:5]).any()
+    print(o2.predict(pd.DataFrame(x[:2],columns=['a','b'])))
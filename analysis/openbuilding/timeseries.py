@@ -2,7 +2,6 @@
 
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 
 
 class TimeSeries():
@@ -116,6 +115,7 @@ class TimeSeries():
         
     def plot_colormap(self,ax):
         "plots a colormap of self.series"
+        import matplotlib.pyplot as plt
         ax.set_xlabel('Date')
         ax.set_ylabel('Time')
         df=self.date_vs_TOD()
@@ -292,28 +292,40 @@ class ContinuousTimeSeries(DiscreteTimeSeries):
         return 'ContinuousTimeSeries({})'.format(st)
     
     
+    def interpolate(self,timestamps):
+        """Returns the data values at an array of timestamps
+        
+        Arguments:
+            - timestamps (pd.DatetimeIndex or list): 
+            
+        The values are on a straight line between the two nearest data 
+            points, found for all timestamps in one np.interp call. Where 
+            there are two data points at the same timestamp the later value
+            is used. Timestamps outside the series are nan.
+            
+        """
+        series=self.series
+        if len(series)==0:
+            return np.full(len(timestamps),np.nan)
+        index=series.index
+        t=(index-index[0]).total_seconds().to_numpy(dtype=float)
+        x=(pd.DatetimeIndex(timestamps)-index[0]).total_seconds().to_numpy(dtype=float)
+        return np.interp(x,t,series.to_numpy(dtype=float),left=np.nan,right=np.nan)
+    
+    
     def lookup(self,ts):
         """Returns the data value at time ts.
         
          Arguments:
             - ts (pd.Timestamp): 
             
+        Returns None if ts is outside the series or next to a missing value.
+            
         """
-        v=TimeSeries.lookup(self,ts)
-        if v:
-            return v
-        else:
-            lower_ts,lower_v,upper_ts,upper_v=self.nearest_timestamps(ts)
-            print(lower_ts,lower_v,upper_ts,upper_v)
-            if lower_ts is None or lower_v is None or \
-                upper_ts is None or upper_v is None: 
-                return None
-            else:
-                interval_ts=upper_ts-lower_ts
-                ts_proportion=(ts-lower_ts)/(interval_ts)
-                interval_v=upper_v-lower_v
-                v=lower_v+(interval_v)*(ts_proportion)
-                return v
+        v=self.interpolate([ts])[0]
+        if np.isnan(v):
+            return None
+        return v
             
     
     def plot(self):
@@ -355,6 +367,7 @@ class Variable():
 
 
     def plot(self,ax=None):
+        import matplotlib.pyplot as plt
         if not ax:
             fig=plt.figure(figsize=(13,4))
             ax=fig.add_axes([0, 0, 1, 1])
@@ -364,6 +377,7 @@ class Variable():
         
         
     def plot_colormap(self,ax=None):
+        import matplotlib.pyplot as plt
         if not ax:
             fig=plt.figure(figsize=(13,4))
             ax=fig.add_axes([0, 0, 1, 1])
@@ -374,6 +388,7 @@ class Variable():
 
 
     def hist(self,ax=None,bins=None):
+        import matplotlib.pyplot as plt
         if not ax:
             fig=plt.figure(figsize=(13,4))
             ax=fig.add_axes([0, 0, 1, 1])
@@ -384,6 +399,7 @@ class Variable():
         
         
     def chist(self,ax=None,bins=None):
+        import matplotlib.pyplot as plt
         if not ax:
             fig=plt.figure(figsize=(13,4))
             ax=fig.add_axes([0, 0, 1, 1])
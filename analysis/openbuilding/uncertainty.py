@@ -4,39 +4,147 @@
 
 The value classes are used to represent ???
 
+Each value class has a 'sample' method. If called with no arguments a
+    single value is returned; if called with 'n' then an array of n values
+    is returned, drawn in a single vectorised operation.
+
+Each class holds its own numpy.random.Generator, set up from the 'seed'
+    argument (an int, a SeedSequence or an existing Generator), so
+    that samples can be reproduced.
+
 """
 
-import pandas as pd
+import math
 import numpy as np
-import random
+
+
+def _generator(seed=None):
+    "Returns a numpy.random.Generator from a seed or an existing Generator"
+    return np.random.default_rng(seed)
 
 
 class NumpyRandomNormal():
     """A class that represents the numpy.random.normal function
+
+    If min1 and/or max1 are given then the distribution is truncated,
+        and only values between min1 and max1 are returned.
+
     """
-    
+
     def __init__(self,
                  loc=0.0,
                  scale=1.0,
                  min1=None,
-                 max1=None):
+                 max1=None,
+                 seed=None):
         self.loc=loc
         self.scale=scale
         self.min1=min1
         self.max1=max1
+        self.rng=_generator(seed)
+
+
+    def _bounds(self):
+        "Returns min1 and max1 in standard deviations from loc, or -inf and inf"
+        a=-math.inf if self.min1 is None else (self.min1-self.loc)/self.scale
+        b=math.inf if self.max1 is None else (self.max1-self.loc)/self.scale
+        return a,b
+
+
+    def _acceptance(self):
+        """Returns the probability that a normal draw lies between min1 and max1
         
+        The tail on the far side of the interval is found with erfc, so the
+            small probabilities of intervals in the tails do not cancel to 0.
         
-    def sample(self):  # NEEDS CHECKING THAT AN SD OF 1 * MULTIPLER = SD OF MULTIPLIER
-        while True:
-            n=np.random.normal(loc=0,scale=1)
-            v=self.loc+self.scale*n
-            if self.min1 and v<=self.min1:
-                continue
-            if self.max1 and v>=self.max1:
-                continue
-            return v
-            
+        """
+        a,b=self._bounds()
+        r=math.sqrt(2.0)
+        if a>0:
+            return 0.5*(math.erfc(a/r)-math.erfc(b/r))
+        if b<0:
+            return 0.5*(math.erfc(-b/r)-math.erfc(-a/r))
+        return 1.0-0.5*math.erfc(-a/r)-0.5*math.erfc(b/r)
+
+
+    @staticmethod
+    def _sample_tail(a,b,size,rng):
+        """Returns size standard normal values between a and b, for an 
+        interval with a small probability
         
+        For an interval in the tail (a>0) the exponential proposal of Robert 
+            (1995) is used, or a uniform proposal if the interval is narrow.
+            An interval with b<0 is sampled as its mirror image.
+        
+        """
+        sign=1.0
+        if b<=0:
+            a,b,sign=-b,-a,-1.0
+        a1=max(a,0.0)
+        alpha=(a1+math.sqrt(a1*a1+4.0))/2.0
+        uniform=a<=0 or alpha*(b-a)<1.0
+        out=np.empty(size)
+        i=0
+        while i<size:
+            m=int((size-i)*1.5)+16
+            if uniform:
+                z=rng.uniform(a,b,m)
+                log_rho=-0.5*z*z if a<=0 else 0.5*(a*a-z*z)
+            else:
+                z=a+rng.exponential(1.0/alpha,m)
+                log_rho=-0.5*(z-alpha)**2
+            z=z[(np.log(rng.random(m))<log_rho)&(z>a)&(z<b)][:size-i]
+            out[i:i+len(z)]=z
+            i+=len(z)
+        return sign*out
+
+
+    def sample(self,
+               n=None,
+               rng=None):
+        """Returns a sample from the (truncated) normal distribution
+
+        Values are drawn in blocks by vectorised rejection; each block is
+            sized using the probability of a draw falling between min1 and
+            max1, so normally only one block is needed. If this probability
+            is below 0.05, i.e. an interval far in a tail, the values are 
+            drawn from an exponential or uniform proposal instead.
+
+        Arguments:
+            - n (int): the number of values to return. If None then a
+                single float is returned, otherwise a numpy array of length n.
+            - rng (numpy.random.Generator or seed): if given, this is used
+                instead of self.rng
+
+        """
+        rng=self.rng if rng is None else _generator(rng)
+        size=1 if n is None else int(n)
+        if self.scale==0:
+            a=np.full(size,float(self.loc))
+            return float(a[0]) if n is None else a
+        lower,upper=self._bounds()
+        if not upper>lower:
+            raise ValueError('No probability mass between min1={} and max1={}'.format(self.min1,
+                                                                                      self.max1))
+        p=self._acceptance()
+        if p<0.05:
+            a=self.loc+self.scale*self._sample_tail(lower,upper,size,rng)
+            return float(a[0]) if n is None else a
+        a=np.empty(size)
+        i=0
+        while i<size:
+            m=min(int((size-i)/p*1.1)+16,10000000)
+            v=self.loc+self.scale*rng.standard_normal(m)
+            if self.min1 is not None: v=v[v>self.min1]
+            if self.max1 is not None: v=v[v<self.max1]
+            v=v[:size-i]
+            a[i:i+len(v)]=v
+            i+=len(v)
+        if n is None:
+            return float(a[0])
+        return a
+
+
     def __repr__(self):
         return \
             'NumpyRandomNormal(loc={},scale={},min1={},max1={})'.format(self.loc,
@@ -50,18 +158,45 @@ class NumpyRandomNormal():
 class RandomChoice():
     """A class that represents the random.choice function
     """
-    
-    def __init__(self, seq=None):
+
+    def __init__(self,
+                 seq=None,
+                 seed=None):
         self.seq=seq
-        
-        
-    def sample(self):
-        if self.seq:
-            return random.choice(self.seq)
-        else:
+        self.rng=_generator(seed)
+
+
+    def _seq_array(self):
+        "Returns self.seq as a 1D numpy array, using dtype=object if needed"
+        a=np.asarray(self.seq)
+        if a.ndim!=1:
+            a=np.empty(len(self.seq),dtype=object)
+            for i,x in enumerate(self.seq):
+                a[i]=x
+        return a
+
+
+    def sample(self,
+               n=None,
+               rng=None):
+        """Returns a random choice (or choices) from self.seq
+
+        Arguments:
+            - n (int): the number of values to return. If None then a
+                single item is returned, otherwise a numpy array of length n.
+            - rng (numpy.random.Generator or seed): if given, this is used
+                instead of self.rng
+
+        """
+        if not self.seq:
             return None
-        
-        
+        rng=self.rng if rng is None else _generator(rng)
+        if n is None:
+            return self.seq[rng.integers(len(self.seq))]
+        i=rng.integers(len(self.seq),size=int(n))
+        return self._seq_array()[i]
+
+
     def __repr__(self):
         return 'RandomChoice({})'.format(self.seq)
 
@@ -71,10 +206,37 @@ class RandomChoice():
 ### TESTS ###
 
 
+if __name__=='__main__':
+
+    import time
+
+    print('TEST-NumpyRandomNormal')
+    o=NumpyRandomNormal(loc=0.5,scale=0.2,min1=0.1,max1=1.0,seed=1)
+    print(o, o.sample())
+    t=time.time()
+    a=o.sample(100000)
+    print(len(a), a.min(), a.max(), a.mean(), time.time()-t)
+    print(np.array_equal(NumpyRandomNormal(0.5,0.2,0.1,1.0,seed=1).sample(10),
+                         NumpyRandomNormal(0.5,0.2,0.1,1.0,seed=1).sample(10)))
+    for min1,max1 in [(9,10),(40,None),(None,-9),(3,3.001),(-1e-6,1e-6)]:
+        o=NumpyRandomNormal(0,1,min1=min1,max1=max1,seed=1)
+        t=time.time()
+        a=o.sample(100000)
+        print(o, o._acceptance(), a.min(), a.max(), a.mean(), time.time()-t)
+
+    print('TEST-RandomChoice')
+    o=RandomChoice(seq=['Smooth','Rough','VeryRough'],seed=1)
+    print(o, o.sample())
+    t=time.time()
+    a=o.sample(100000)
+    print(len(a), a[:5], time.time()-t)
+
+
+
 #if __name__=='__main__':
-#       
+#
 #    import subprocess
-#    
+#
 #    def run_test(fp):
 #        print('run_test: fp={}'.format(fp))
 #        p=subprocess.run(['python.exe',fp],
@@ -82,16 +244,6 @@ class RandomChoice():
 #                         stderr=subprocess.PIPE)
 #        print(p.stderr.decode())
 #        print(p.stdout.decode())
-#    
+#
 #    fp=r'../tests/test_NumpyRandomNormal.py'
 #    run_test(fp)
-    
-
-    
-    
-    
-    
-    
-    
-    
-    
\ No newline at end of file
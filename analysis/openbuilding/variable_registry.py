@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+import re
+
+
+class VariableRegistry():
+    """A registry of how EnergyPlus output variables map to BimGraph properties
+
+    Each rule is (pattern,label,name,units):
+        - pattern: a regular expression which must match the whole
+            EnergyPlus variable name, i.e. 'Zone Mean Air Temperature'
+        - label: the label of the BimGraph node the variable is placed on,
+            i.e. 'Space'
+        - name: the name of the BimGraph property, i.e. 'air_temperature'
+        - units: the expected units, i.e. 'C', or None for any units
+
+    A variable name can match rules for several labels, i.e. the same
+        variable on Space and Surface nodes. The first rule added for a label
+        is used.
+
+    EsoGraph.read_eso uses the registry to skip unmapped variables while
+        reading, and EsoToBimMap uses it to place the variables on the
+        BimGraph nodes.
+
+    Example:
+        variable_registry.add('Zone Air System Sensible Heating Energy',
+                              'Space','sensible_heating_energy','J')
+
+    """
+
+    def __init__(self,rules=None):
+        self.rules=[]
+        self._cache={}
+        for rule in rules or []:
+            self.add(*rule)
+
+
+    def __contains__(self,variable_name):
+        return bool(self.match(variable_name))
+
+
+    def __len__(self):
+        return len(self.rules)
+
+
+    def add(self,pattern,label,name,units=None):
+        """Adds a rule to the registry
+
+        Arguments:
+            - pattern (str): a regular expression for the variable name.
+                Use re.escape for names with special characters.
+            - label (str): the label of the BimGraph node
+            - name (str): the BimGraph property name
+            - units (str): the expected units, or None
+
+        """
+        self.rules.append((re.compile(pattern),label,name,units))
+        self._cache.clear()
+
+
+    def match(self,variable_name):
+        "Returns the rules which match a variable name"
+        l=self._cache.get(variable_name)
+        if l is None:
+            l=[x for x in self.rules if x[0].fullmatch(variable_name)]
+            self._cache[variable_name]=l
+        return l
+
+
+    def rule(self,variable_name,labels):
+        "Returns the first matching rule for a node with labels, or None"
+        for x in self.match(variable_name):
+            if x[1] in labels:
+                return x
+        return None
+
+
+variable_registry=VariableRegistry([
+    ('Site Outdoor Air Drybulb Temperature','Climate','air_drybulb_temperature','C'),
+    ('Site Diffuse Solar Radiation Rate per Area','Climate','diffuse_solar_radiation','W/m2'),
+    ('Site Direct Solar Radiation Rate per Area','Climate','direct_solar_radiation','W/m2'),
+    ('Site Surface Ground Temperature','Climate','surface_ground_temperature','C'),
+    ('Facility Total Building Electric Demand Power','Building','electric_power','W'),
+    ('Zone Total Internal Total Heating Energy','Space','internal_heat_gain','J'),
+    ('Zone People Total Heating Energy','Space','people_heat_gain','J'),
+    ('Zone Lights Total Heating Energy','Space','light_heat_gain','J'),
+    ('Zone Electric Equipment Total Heating Energy','Space','appliance_heat_gain','J'),
+    ('Zone Windows Total Transmitted Solar Radiation Energy','Space','solar_gain','J'),
+    ('Zone Windows Total Heat Gain Energy','Space','windows_heat_gain','J'),
+    ('Zone Windows Total Heat Loss Energy','Space','windows_heat_loss','J'),
+    ('Zone Mean Air Temperature','Space','air_temperature','C'),
+    ('Zone Infiltration Total Heat Loss Energy','Space','infiltration_heat_loss','J'),
+    ('Zone Infiltration Total Heat Gain Energy','Space','infiltration_heat_gain','J'),
+    ('Zone Thermostat Heating Setpoint Temperature','Space','thermostat_setpoint','C'),
+    ('Surface Inside Face Conduction Heat Transfer Energy','Surface','inside_conduction','J'),
+    ('Baseboard Total Heating Energy','RoomHeater','heating_energy','J'),
+    ('Baseboard Electric Energy','RoomHeater','electric_energy','J')
+    ])  # the default registry
+
+
+
+# tests
+
+if __name__=='__main__':
+    print('TEST-VariableRegistry')
+    print(len(variable_registry))
+    print('Zone Mean Air Temperature' in variable_registry,
+          'Zone Air Humidity Ratio' in variable_registry)
+    print(variable_registry.rule('Zone Mean Air Temperature',['Space']))
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+
+"""This module contains a pipeline for simulating variants of one building
+
+The base gbXML file is parsed and mapped to a BimGraph once. Each variant is
+    a BimGraphView of the base BimGraph with a list of transforms applied,
+    such as a new azimuth, a construction swap or a new infiltration rate.
+    The variants go straight to BimToIdfMap and EnergyPlus, with no
+    intermediate gbXML files. The IdfGraph is mapped in full once and then
+    only patched for the changes in each variant.
+
+Example:
+    o=VariantPipeline()
+    o.input_gbxml=gbxml
+    o.input_epw=r'GBR_Birmingham.035340_IWEC.epw'
+    o.simulation_folder=r'../05_D-energyplus_results/sim-{}'
+    for i in range(0,360,5):
+        o.variants['detached_house_{}'.format(i)]=[SetAzimuth(i)]
+    o.run()
+    bim=o.output_bims['detached_house_90']
+
+"""
+
+import abc
+import os
+
+try:
+    from .gbxml_to_bim_map import GbxmlToBimMap
+except ImportError:
+    from gbxml_to_bim_map import GbxmlToBimMap
+
+try:
+    from .energyplus_model import EnergyPlusModel
+except ImportError:
+    from energyplus_model import EnergyPlusModel
+
+try:
+    from .bim_to_idf_map import BimToIdfMap
+except ImportError:
+    from bim_to_idf_map import BimToIdfMap
+
+
+class Transform(abc.ABC):
+    "The base class of a transform of a BimGraph, subclasses implement apply"
+
+    @abc.abstractmethod
+    def apply(self,bim):
+        "Changes bim in place"
+
+
+    def __repr__(self):
+        d={k:v for k,v in self.__dict__.items()}
+        return '{}({})'.format(self.__class__.__name__,d)
+
+
+class SetAzimuth(Transform):
+    """Sets the Building orientation, equivalent to the gbXML CADModelAzimuth
+
+    Arguments:
+        - azimuth (float): degrees clockwise from true north
+
+    """
+
+    def __init__(self,azimuth):
+        self.azimuth=azimuth
+
+
+    def apply(self,bim):
+        for n in bim.Building:
+            n.orientation=float(self.azimuth)
+
+
+class SetInfiltration(Transform):
+    """Sets the infiltration rate of the spaces
+
+    Arguments:
+        - infiltration (float): air changes per hour
+        - space_ids (list): the ids of the spaces to change, or None for all
+            spaces
+
+    """
+
+    def __init__(self,infiltration,space_ids=None):
+        self.infiltration=infiltration
+        self.space_ids=space_ids
+
+
+    def apply(self,bim):
+        for n in bim.Space:
+            if self.space_ids is None or n.id in self.space_ids:
+                n.infiltration=float(self.infiltration)
+
+
+class SwapConstruction(Transform):
+    """Replaces one construction with another on surfaces and openings
+
+    Arguments:
+        - old_id (str): the id of the Construction node to replace
+        - new_id (str): the id of the new Construction node, which must be in
+            the BimGraph
+        - surface_types (list): only surfaces with these surfaceType
+            values are changed, i.e. ['ExteriorWall'], or None for all
+
+    """
+
+    def __init__(self,old_id,new_id,surface_types=None):
+        self.old_id=old_id
+        self.new_id=new_id
+        self.surface_types=surface_types
+
+
+    def apply(self,bim):
+        old=bim.filter_node_by_property(key='id',value=self.old_id)
+        new=bim.filter_node_by_property(key='id',value=self.new_id)
+        if not old or not new:
+            raise ValueError('Construction not found: {}'.format(
+                self.old_id if not old else self.new_id))
+        for e in old.in_edges:
+            if e.name!='has_construction': continue
+            n=e.start_node
+            if self.surface_types is not None and not n.surfaceType in self.surface_types:
+                continue
+            bim.remove_edge(e)
+            n=bim._Node(n._id)
+            bim.add_edge(n,new,'has_construction')
+            if 'constructionIdRef' in n.properties:
+                n.constructionIdRef=self.new_id
+
+
+class VariantPipeline():
+    """Simulates variants of a building which is parsed and mapped only once
+
+    Attributes:
+        - input_gbxml (GbxmlGraph): the base building, or
+        - input_bim (BimGraph): the base building
+        - input_epw (str): the weather file
+        - variants (dict): {name:[transforms]}
+        - simulation_folder (str): the simulation folder, where '{}' is
+            replaced by the variant name
+        - output_variables (list): passed to EnergyPlusModel.run_bim
+        - output_bims (dict): {name:BimGraphView} of the variants after
+            running
+
+    """
+
+    def __init__(self):
+        self.input_gbxml=None
+        self.input_bim=None
+        self.input_epw=None
+        self.variants={}
+        self.simulation_folder='sim-{}'
+        self.output_variables=None
+        self.output_bims={}
+
+
+    def base_bim(self):
+        "Returns the base BimGraph, mapping the gbXML the first time only"
+        if self.input_bim is None:
+            o=GbxmlToBimMap()
+            o.input_gbxml=self.input_gbxml
+            o.run()
+            self.input_bim=o.output_bim
+        return self.input_bim
+
+
+    def variant(self,name):
+        "Returns a BimGraphView of the base BimGraph with the transforms applied"
+        bim=self.base_bim().view()
+        for transform in self.variants[name]:
+            transform.apply(bim)
+        return bim
+
+
+    def run(self,simulate=True):
+        """Creates and simulates all variants
+
+        Arguments:
+            - simulate (bool): if False then the variant BimGraphs are
+                created and placed in self.output_bims without running
+                EnergyPlus
+
+        """
+        self.output_bims={}
+        bim_to_idf_map=BimToIdfMap()
+        for name in self.variants:
+            bim=self.variant(name)
+            if simulate:
+                o=EnergyPlusModel()
+                o.bim=bim
+                o.bim_to_idf_map=bim_to_idf_map
+                o.input_epw=self.input_epw
+                o.simulation_folder=os.path.abspath(self.simulation_folder.format(name))
+                o.run_bim(output_variables=self.output_variables)
+                bim=o.output_bim
+            self.output_bims[name]=bim
+        return self.output_bims
+
+
+
+# tests
+
+if __name__=='__main__':
+    import time
+    from gbxml_graph import GbxmlGraph
+
+    print('TEST-VariantPipeline')
+
+    gbxml=GbxmlGraph()
+    gbxml.read_xml(r'../01_D-original_gbXML/detached_house.gbxml')
+
+    o=VariantPipeline()
+    o.input_gbxml=gbxml
+    for i in range(0,360,5):
+        o.variants['detached_house_{}'.format(i)]=[SetAzimuth(i),
+                                                  SetInfiltration(1.0),
+                                                  SwapConstruction('WALL','PART',['ExteriorWall'])]
+    t=time.time()
+    o.run(simulate=False)
+    print('variants',time.time()-t)
+
+    bim=o.output_bims['detached_house_90']
+    print(bim.Building[0].orientation,o.input_bim.Building[0].orientation)
+    m=BimToIdfMap()
+    m.input_bim=bim
+    m.run()
+
+    class IncompleteTransform(Transform):
+        pass
+    try:
+        IncompleteTransform()
+        raise AssertionError('a Transform without apply was created')
+    except TypeError as err:
+        print('TypeError:',err)